@@ -6,6 +6,8 @@ import serial.tools.list_ports
 import slip
 import neblina as neb
 import neblinaAPI as nebapi
+import neblinaclock as nebclock
+import neblinahub as nebhub
 import sys
 import time
 
@@ -26,9 +28,15 @@ def main():
             else:
                 print('se: {0}'.format(se))
 
-    # Perform a start recording command to each board
+    # Reset the timestamps of all the boards at once
+    hub = nebhub.NeblinaHub()
     for comm in nebBoards:
-        comm.motionResetTimestamp()
+        hub.addDevice(comm.sc.port, comm.sc)
+    clockSync = nebclock.ClockSync(hub)
+    for deviceID in clockSync.resetTimestamps():
+        print('{0}: timestamp reset at host time {1:.6f}'\
+            .format(deviceID, clockSync.hostTime(deviceID, 0)))
+    hub.close()
 
     # Switch back to BLE interface
     for comm in nebBoards:
@@ -15,6 +15,15 @@ import neblinasim as sim
 import sys
 import time
 
+def printPackets(packets):
+    for packet in packets:
+        print(packet.data)
+
+def printProgress(numPackets, totalPackets):
+    if totalPackets is None:
+        print('Received {0} packets \r'.format(numPackets), end="", flush=True)
+    else:
+        print('Received {0}/{1} packets \r'.format(numPackets, totalPackets), end="", flush=True)
 
 class StreamMenu(cmd.Cmd):
     """docstring for StreamMenu"""
@@ -150,6 +159,27 @@ class StreamMenu(cmd.Cmd):
         except UnicodeDecodeError as ude:
             print('Got {0} at page #{1}'.format(dataBytes, readPageNumber))
 
+    def do_EEPROMDump(self, args):
+        if(len(args) <= 0):
+            print('EEPROMDump <fileName>')
+            return
+        with open(args, 'wb') as imageFile:
+            imageFile.write(self.comm.EEPROMReadAll(refresh=True))
+        print('EEPROM saved to {0}'.format(args))
+
+    def do_EEPROMRestore(self, args):
+        if(len(args) <= 0):
+            print('EEPROMRestore <fileName>')
+            return
+        with open(args, 'rb') as imageFile:
+            image = imageFile.read()
+        try:
+            pageNumbers = self.comm.EEPROMWriteAll(image)
+        except neb.EEPROMPageError as pe:
+            print(pe)
+            pageNumbers = pe.writtenPages
+        print('Wrote {0} changed pages'.format(len(pageNumbers)))
+
     def do_setCOMPort(self, args):
         self.setCOMPortName()
 
@@ -169,34 +199,34 @@ class StreamMenu(cmd.Cmd):
         print('Board Temperature: {0} degrees (Celsius)'.format(temp))
 
     def do_streamEuler(self, args):
-        self.comm.motionStream(neb.MotCmd_EulerAngle)
+        self.comm.motionStream(neb.MotCmd_EulerAngle, consumer=printPackets)
 
     def do_streamIMU(self, args):
-        self.comm.motionStream(neb.MotCmd_IMU_Data)
+        self.comm.motionStream(neb.MotCmd_IMU_Data, consumer=printPackets)
 
     def do_streamQuat(self, args):
-        self.comm.motionStream(neb.MotCmd_Quaternion)
+        self.comm.motionStream(neb.MotCmd_Quaternion, consumer=printPackets)
 
     def do_streamMAG(self, args):
-        self.comm.motionStream(neb.MotCmd_MAG_Data)
+        self.comm.motionStream(neb.MotCmd_MAG_Data, consumer=printPackets)
 
     def do_streamForce(self, args):
-        self.comm.motionStream(neb.MotCmd_ExtForce)
+        self.comm.motionStream(neb.MotCmd_ExtForce, consumer=printPackets)
 
     def do_streamRotation(self, args):
-        self.comm.motionStream(neb.MotCmd_RotationInfo)
+        self.comm.motionStream(neb.MotCmd_RotationInfo, consumer=printPackets)
 
     def do_streamPedometer(self, args):
-        self.comm.motionStream(neb.MotCmd_Pedometer)
+        self.comm.motionStream(neb.MotCmd_Pedometer, consumer=printPackets)
 
     def do_streamGesture(self, args):
-        self.comm.motionStream(neb.MotCmd_FingerGesture)
+        self.comm.motionStream(neb.MotCmd_FingerGesture, consumer=printPackets)
 
     def do_streamTrajectory(self, args):
         self.comm.sendCommand(neb.Subsys_MotionEngine, neb.MotCmd_TrajectoryRecStartStop, True) # start recording a reference orientation trajectory
         packet = self.comm.waitForAck(neb.Subsys_MotionEngine, neb.MotCmd_TrajectoryRecStartStop)
         print("Recording a reference trajectory...")
-        self.comm.motionStream(neb.MotCmd_TrajectoryInfo)
+        self.comm.motionStream(neb.MotCmd_TrajectoryInfo, consumer=printPackets)
 
     def do_stopStreams(self, args):
         self.comm.motionStopStreams()
@@ -256,6 +286,11 @@ class StreamMenu(cmd.Cmd):
             print( "Session %d: %d packets (%d bytes)"\
             %(info[0], info[1]/18, info[1]) )
 
+    def do_flashCatalog(self, args):
+        for sessionID, sessionLength in self.comm.flashGetCatalog(refresh=(args == 'refresh')):
+            print( "Session %d: %d packets (%d bytes)"\
+            %(sessionID, sessionLength/18, sessionLength) )
+
     def do_flashErase(self, args):
         self.comm.flashErase()
         print('Flash erase has completed successfully!')
@@ -274,6 +309,14 @@ class StreamMenu(cmd.Cmd):
             numSamples = int(args)
         self.comm.flashRecord(numSamples, neb.MotCmd_EulerAngle)
 
+    def do_flashRecordIMUFor(self, args):
+        if(len(args) <= 0):
+            duration = 10.0
+        else:
+            duration = float(args)
+        self.comm.flashRecordFor(neb.MotCmd_IMU_Data, duration=duration,\
+            monitor=lambda packet: print(packet.data))
+
     def do_flashRecordQuaternion(self, args):
         if(len(args) <= 0):
             numSamples = 1000
@@ -286,7 +329,8 @@ class StreamMenu(cmd.Cmd):
             mySessionID = 65535
         elif(len(args) > 0):
             mySessionID = int(args)
-        self.comm.flashPlayback(mySessionID)
+        self.comm.flashPlayback(mySessionID, progress=printProgress)
+        print()
 
     def do_versions(self, args):
         versions = self.comm.debugFWVersions()
@@ -5,7 +5,9 @@
 
 import struct
 import binascii
+from array import array
 from itertools import zip_longest
+import neblinacrc as nebcrc
 
 # Control Byte Masks
 Subsys_BitMask              =   0x1F
@@ -153,35 +155,65 @@ CommandStrings = {
     (Subsys_EEPROM, EEPROMCmd_Write)                        :   'Write',
 }
 
+def unpackData(dataStruct, dataString, offset=0):
+    """ Unpacks the data of a response packet, from offset to the end of
+        dataString, which must be exactly the size of the format.
+    """
+    dataLength = len(dataString) - offset
+    if dataLength != dataStruct.size:
+        raise InvalidPacketFormatError('Expected {0} data bytes but got {1}'\
+            .format(dataStruct.size, dataLength))
+    return dataStruct.unpack_from(dataString, offset)
+
 Neblina_CommandPacketData_fmt = "<I B 11s" # Timestamp (unused for now), enable/disable
+Neblina_CommandPacketData_struct = struct.Struct(Neblina_CommandPacketData_fmt)
 class NebCommandData(object):
     """docstring for NebCommandData"""
+    __slots__ = ('enable', 'timestamp')
     def __init__(self, enable):
         self.enable = enable
         self.timestamp = 0 # Not really used for now
 
     def encode(self):
         garbage = ('\000'*11).encode('utf-8')
-        commandDataString = struct.pack(Neblina_CommandPacketData_fmt,\
+        commandDataString = Neblina_CommandPacketData_struct.pack(\
             self.timestamp, self.enable, garbage)
         return commandDataString
 
     def __str__(self):
         return "enable: {0}".format(self.enable)
 
+Neblina_BlankData_fmt = "16s"
+Neblina_BlankData_struct = struct.Struct(Neblina_BlankData_fmt)
 class BlankData(object):
     """docstring for BlankData
         This object is for packet data 
         containing no meaningful info in it.
     """
-    def __init__(self, dataString):
-        self.blankBytes = struct.unpack( "16s", dataString )
+    __slots__ = ('blankBytes',)
+    def __init__(self, dataString, offset=0):
+        self.blankBytes = unpackData(Neblina_BlankData_struct, dataString, offset)
     def __str__(self):
         return '{0}'.format(self.blankBytes)
 
+class UnknownData(object):
+    """docstring for UnknownData
+        Data of a response packet with a subsystem and command
+        combination that is not known. Keeps the raw data bytes.
+    """
+    __slots__ = ('dataBytes',)
+    def __init__(self, dataString, offset=0):
+        self.dataBytes = bytes(dataString[offset:])
+    def encode(self):
+        return self.dataBytes
+    def __str__(self):
+        return 'Unknown data: {0}'.format(binascii.hexlify(self.dataBytes))
+
 Neblina_FlashSession_fmt = "<I B H 9s" # Timestamp, open/close, session ID
+Neblina_FlashSession_struct = struct.Struct(Neblina_FlashSession_fmt)
 class NebFlashPlaybackCommandData(object):
     """docstring for MotionStateData"""
+    __slots__ = ('openClose', 'sessionID')
     def __init__(self, openClose, sessionID):
         self.openClose = openClose
         self.sessionID = sessionID
@@ -191,7 +223,7 @@ class NebFlashPlaybackCommandData(object):
         if self.openClose == 1:
             pass
         openCloseVal = 1 if self.openClose else 0
-        commandDataString = struct.pack(Neblina_FlashSession_fmt,\
+        commandDataString = Neblina_FlashSession_struct.pack(\
             timestamp, openCloseVal, self.sessionID, garbage)
         return commandDataString
     def __str__(self):
@@ -200,14 +232,16 @@ class NebFlashPlaybackCommandData(object):
         .format(self.sessionID, openCloseString)
 
 Neblina_FlashSessionInfo_fmt = "<I H 10s" # Timestamp, session ID
+Neblina_FlashSessionInfo_struct = struct.Struct(Neblina_FlashSessionInfo_fmt)
 class NebFlashSessionInfoCommandData(object):
     """docstring for MotionStateData"""
+    __slots__ = ('sessionID',)
     def __init__(self, sessionID):
         self.sessionID = sessionID
     def encode(self):
         garbage = ('\000'*10).encode('utf-8')
         timestamp = 0
-        commandDataString = struct.pack(Neblina_FlashSessionInfo_fmt,\
+        commandDataString = Neblina_FlashSessionInfo_struct.pack(\
             timestamp, self.sessionID, garbage)
         return commandDataString
     def __str__(self):
@@ -216,45 +250,52 @@ class NebFlashSessionInfoCommandData(object):
 
 # Special 26 byte packet
 Neblina_UnitTestMotionCommandData_fmt = "<I 3h 3h 3h" # Timestamp, accel, gyro, mag
+Neblina_UnitTestMotionCommandData_struct = struct.Struct(Neblina_UnitTestMotionCommandData_fmt)
 class NebUnitTestMotionDataCommandData(object):
     """docstring for NebUnitTestMotionDataCommandData"""
+    __slots__ = ('timestamp', 'accel', 'gyro', 'mag')
     def __init__(self, timestamp, accel, gyro, mag):
         self.timestamp = timestamp
         self.accel = accel
         self.gyro = gyro
         self.mag = mag
     def encode(self):
-        commandDataString = struct.pack(Neblina_UnitTestMotionCommandData_fmt,\
+        commandDataString = Neblina_UnitTestMotionCommandData_struct.pack(\
             self.timestamp, self.accel[0], self.accel[1], self.accel[2],\
             self.gyro[0], self.gyro[1], self.gyro[2],\
             self.mag[0], self.mag[1], self.mag[2])
         return commandDataString
 
 Neblina_AccRangeCommandPacketData_fmt = "<I H 10s" # Timestamp (unused for now), downsample factor
+Neblina_AccRangeCommandPacketData_struct = struct.Struct(Neblina_AccRangeCommandPacketData_fmt)
 class NebAccRangeCommandData(NebCommandData):
     """docstring for NebAccRangeCommandData"""
+    __slots__ = ()
     rangeCodes = {2:0x00, 4:0x01, 8:0x02, 16:0x03}
 
     def encode(self):
         garbage = ('\000'*10).encode('utf-8')
         rangeCode = NebAccRangeCommandData.rangeCodes[self.enable]
-        commandDataString = struct.pack(Neblina_AccRangeCommandPacketData_fmt,\
+        commandDataString = Neblina_AccRangeCommandPacketData_struct.pack(\
             self.timestamp, rangeCode, garbage)
         return commandDataString
 
 Neblina_DownsampleCommandPacketData_fmt = "<I H 10s" # Timestamp (unused for now), downsample factor
+Neblina_DownsampleCommandPacketData_struct = struct.Struct(Neblina_DownsampleCommandPacketData_fmt)
 class NebDownsampleCommandData(NebCommandData):
     """docstring for NebDownsampleCommandData"""
+    __slots__ = ()
 
     def encode(self):
         garbage = ('\000'*10).encode('utf-8')
-        commandDataString = struct.pack(Neblina_DownsampleCommandPacketData_fmt,\
+        commandDataString = Neblina_DownsampleCommandPacketData_struct.pack(\
             self.timestamp, self.enable, garbage)
         return commandDataString
 
 Neblina_SetLEDData_fmt = "<B {0}s {1}s" # Number of LEDs, LED Index/Value, LED Index/Value, LED Index/Value (...) 
 class NebSetLEDCommandData(object):
     """docstring for NebEEPROMCommandData"""
+    __slots__ = ('ledValues',)
     def __init__(self, ledValueTupleList):
         if(len(ledValueTupleList) > 7):
             raise InvalidPacketFormatError("The packet can't hold more than 7 LED Values")
@@ -284,6 +325,7 @@ class NebSetLEDCommandData(object):
 Neblina_GetLEDData_fmt = "<B {0}s {1}s" # Number of LEDs, Index, Index, (...) 
 class NebGetLEDCommandData(object):
     """docstring for NebEEPROMCommandData"""
+    __slots__ = ('ledIndices',)
     def __init__(self, ledIndices):
         if(len(ledIndices) > 7):
             raise InvalidPacketFormatError("You can't request more than 7 LED Values")
@@ -309,8 +351,10 @@ class NebGetLEDCommandData(object):
         return commandDataString
 
 Neblina_EEPROMCommandPacketData_fmt = "<H 8s 6s" # Page number, 8 bytes R/W Data
+Neblina_EEPROMCommandPacketData_struct = struct.Struct(Neblina_EEPROMCommandPacketData_fmt)
 class NebEEPROMCommandData(object):
     """docstring for NebEEPROMCommandData"""
+    __slots__ = ('readWrite', 'pageNumber', 'dataBytes')
     def __init__(self, readWrite, pageNumber, dataBytes=b'00'*8):
         self.readWrite = readWrite # read = False, write = True
         self.pageNumber = pageNumber
@@ -318,13 +362,16 @@ class NebEEPROMCommandData(object):
 
     def encode(self):
         garbage = b'00'*6
-        commandDataString = struct.pack(Neblina_EEPROMCommandPacketData_fmt,\
+        commandDataString = Neblina_EEPROMCommandPacketData_struct.pack(\
             self.pageNumber, self.dataBytes, garbage)
         return commandDataString
 
 Neblina_MotionAndFlash_fmt = "<I 4s B 7s" # Timestamp (unused for now), downsample factor
+Neblina_MotionAndFlash_struct = struct.Struct(Neblina_MotionAndFlash_fmt)
 class MotAndFlashRecStateData(object):
     """docstring for NebMotAndFlashRecStateData"""
+    __slots__ = ('timestamp', 'recorderStatus', 'distance', 'force', 'euler',\
+        'quaternion', 'imuData', 'motion', 'steps', 'magData', 'sitStand')
 
     recorderStatusStrings = {
         0:"Off",
@@ -332,11 +379,11 @@ class MotAndFlashRecStateData(object):
         2:"Playback",
     }
 
-    def __init__(self, dataString):
+    def __init__(self, dataString, offset=0):
         self.timestamp, \
         motionEngineStatusBytes,\
         self.recorderStatus,\
-        garbage = struct.unpack( Neblina_MotionAndFlash_fmt, dataString )
+        garbage = unpackData(Neblina_MotionAndFlash_struct, dataString, offset)
 
         # Extract motion engine state
         self.distance = ((motionEngineStatusBytes[0]  & 0x01) == 1)
@@ -357,12 +404,14 @@ class MotAndFlashRecStateData(object):
                             MotAndFlashRecStateData.recorderStatusStrings[self.recorderStatus])
 
 Neblina_EEPROMRead_fmt = "<H 8s 6s" # Page number, 8 bytes Read Data
+Neblina_EEPROMRead_struct = struct.Struct(Neblina_EEPROMRead_fmt)
 class EEPROMReadData(object):
     """docstring for EEPROMData"""
-    def __init__(self, dataString):
+    __slots__ = ('pageNumber', 'dataBytes')
+    def __init__(self, dataString, offset=0):
         self.pageNumber, \
         self.dataBytes,\
-        garbage = struct.unpack( Neblina_EEPROMRead_fmt, dataString )
+        garbage = unpackData(Neblina_EEPROMRead_struct, dataString, offset)
 
     def __str__(self):
         return "Page# {0} Data Bytes:{1} ".format(self.pageNumber, self.dataBytes)
@@ -370,43 +419,48 @@ class EEPROMReadData(object):
 Neblina_LEDGetVal_fmt = "<B {0}s {1}s" # Number of LEDs, Index/Value, Index/Value, (...)
 class LEDGetValData(object):
     """docstring for LEDGetValData"""
-    def __init__(self, dataString):
-        numLEDs = int(dataString[0])
+    __slots__ = ('ledTupleList',)
+    def __init__(self, dataString, offset=0):
+        numLEDs = int(dataString[offset])
         numLEDBytes = numLEDs*2
         numGarbageBytes = (15-numLEDBytes)
         stringFormat = Neblina_LEDGetVal_fmt.format(numLEDBytes, numGarbageBytes)
-        numLEDs, ledBytes, garbage = struct.unpack( stringFormat, dataString )
+        numLEDs, ledBytes, garbage = unpackData(struct.Struct(stringFormat), dataString, offset)
         self.ledTupleList = list(grouper(ledBytes, 2))
 
     def __str__(self):
         return "LED Values: {0}".format(self.ledTupleList)
 
 Neblina_BatteryLevel_fmt = "<I H 10s" # Battery Level (%)
+Neblina_BatteryLevel_struct = struct.Struct(Neblina_BatteryLevel_fmt)
 class BatteryLevelData(object):
     """docstring for BatteryLevelData"""
-    def __init__(self, dataString):
+    __slots__ = ('batteryLevel',)
+    def __init__(self, dataString, offset=0):
         # timestamp = 0
         timestamp, \
         self.batteryLevel,\
-        garbage = struct.unpack( Neblina_BatteryLevel_fmt, dataString )
+        garbage = unpackData(Neblina_BatteryLevel_struct, dataString, offset)
         self.batteryLevel = self.batteryLevel/10
 
     def __str__(self):
         return "batteryLevel: {0}%".format(self.batteryLevel)
 
 Neblina_Temperature_fmt = "<I h 10s" # Temperature x100 in Celsius
+Neblina_Temperature_struct = struct.Struct(Neblina_Temperature_fmt)
 class TemperatureData(object):
     """docstring for TemperatureData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'temperature')
+    def __init__(self, dataString, offset=0):
         # timestamp = 0
         self.timestamp, \
         self.temperature,\
-        garbage = struct.unpack( Neblina_Temperature_fmt, dataString )
+        garbage = unpackData(Neblina_Temperature_struct, dataString, offset)
         self.temperature = self.temperature/100
 
     def encode(self):
         garbage = ('\000'*10).encode('utf-8')
-        packetString = struct.pack(Neblina_Temperature_fmt, self.timestamp,\
+        packetString = Neblina_Temperature_struct.pack(self.timestamp,\
         self.temperature, garbage)
         return packetString('utf-8')
 
@@ -418,11 +472,12 @@ class TemperatureData(object):
 # Neblina_FlashSession_fmt = "<I B H 9s" # Timestamp, open/close, session ID
 class FlashSessionData(object):
     """docstring for FlashSessionData"""
-    def __init__(self, dataString):
+    __slots__ = ('sessionID', 'openClose')
+    def __init__(self, dataString, offset=0):
         timestamp,\
         openCloseByte,\
         self.sessionID,\
-        garbage = struct.unpack( Neblina_FlashSession_fmt, dataString )
+        garbage = unpackData(Neblina_FlashSession_struct, dataString, offset)
         # open = True, close = False
         self.openClose = (openCloseByte == 1)
     def __str__(self):
@@ -433,36 +488,39 @@ class FlashSessionData(object):
 Neblina_FlashSessionInfo_fmt = "<I H 10s" # Timestamp, session ID
 class FlashSessionInfoData(object):
     """docstring for FlashSessionInfoData"""
-    def __init__(self, dataString):
+    __slots__ = ('sessionLength', 'sessionID')
+    def __init__(self, dataString, offset=0):
         self.sessionLength,\
         self.sessionID,\
-        garbage = struct.unpack( Neblina_FlashSessionInfo_fmt, dataString )
+        garbage = unpackData(Neblina_FlashSessionInfo_struct, dataString, offset)
     def __str__(self):
         return "Session {0}: {1} bytes"\
         .format(self.sessionID, self.sessionLength)
 
 Neblina_FlashNumSessions_fmt = "<I H 10s" # Reserved, number of sessions
+Neblina_FlashNumSessions_struct = struct.Struct(Neblina_FlashNumSessions_fmt)
 class FlashNumSessionsData(object):
     """docstring for FlashNumSessionsData"""
-    def __init__(self, dataString):
+    __slots__ = ('numSessions',)
+    def __init__(self, dataString, offset=0):
         reserved,\
         self.numSessions,\
-        garbage = struct.unpack( Neblina_FlashNumSessions_fmt, dataString )
+        garbage = unpackData(Neblina_FlashNumSessions_struct, dataString, offset)
     def __str__(self):
         return "Number of sessions: {0}"\
         .format(self.numSessions)
 
 Neblina_FWVersions_fmt = "<B 3B 3B 8s B" # API Release, MCU Major/Minor/Build, BLE Major/Minor/Build, Device ID
+Neblina_FWVersions_struct = struct.Struct(Neblina_FWVersions_fmt)
 class FWVersionsData(object):
     """docstring for FWVersionsData"""
-    def __init__(self, dataString):
-        self.mcuFWVersion = [0]*3
-        self.bleFWVersion = [0]*3
-        self.apiRelease,\
-        self.mcuFWVersion[0],self.mcuFWVersion[1],self.mcuFWVersion[2],\
-        self.bleFWVersion[0],self.bleFWVersion[1],self.bleFWVersion[2],\
-        self.deviceID,\
-        garbage = struct.unpack( Neblina_FWVersions_fmt, dataString )
+    __slots__ = ('apiRelease', 'mcuFWVersion', 'bleFWVersion', 'deviceID')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_FWVersions_struct, dataString, offset)
+        self.apiRelease = values[0]
+        self.mcuFWVersion = values[1:4]
+        self.bleFWVersion = values[4:7]
+        self.deviceID = values[7]
     def __str__(self):
         return "API Release: {0}\n\
         MCU Version: {1}.{2}.{3}\n\
@@ -474,6 +532,7 @@ class FWVersionsData(object):
 
 # Special 70 byte packet
 Neblina_UnitTestMotionData_fmt = "<B 3h 3h 3h 4h 3h 3h 3h H B I I h B I I"
+Neblina_UnitTestMotionData_struct = struct.Struct(Neblina_UnitTestMotionData_fmt)
 # motion, imu+mag, quaternion, euler, force, error, motion track, motion track progress, timestamp, stepCount, walkingDirection, sitStand
 class UnitTestMotionData(object):
     motionStrings = {
@@ -482,31 +541,24 @@ class UnitTestMotionData(object):
         2: "Starts Moving",
     }
     """docstring for NebUnitTestMotionDataCommandData"""
-    def __init__(self, dataString):
-        self.accel = [0]*3
-        self.gyro = [0]*3
-        self.mag = [0]*3
-        self.quaternions = [0]*4
-        self.eulerAngleErrors = [0]*3
-        self.externalForces = [0]*3
-        self.startStop,\
-        self.accel[0], self.accel[1], self.accel[2],\
-        self.gyro[0], self.gyro[1], self.gyro[2],\
-        self.mag[0], self.mag[1], self.mag[2],\
-        self.quaternions[0], self.quaternions[1],\
-        self.quaternions[2], self.quaternions[3],\
-        self.yaw, self.pitch, self.roll,\
-        self.externalForces[0],\
-        self.externalForces[1],\
-        self.externalForces[2],\
-        self.eulerAngleErrors[0],\
-        self.eulerAngleErrors[1],\
-        self.eulerAngleErrors[2],\
+    __slots__ = ('startStop', 'accel', 'gyro', 'mag', 'quaternions',\
+        'yaw', 'pitch', 'roll', 'externalForces', 'eulerAngleErrors',\
+        'motionTrack', 'motionTrackProgress', 'timestamp', 'stepCount',\
+        'walkingDirection', 'sitStand', 'sitTime', 'standTime')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_UnitTestMotionData_struct, dataString, offset)
+        self.startStop = values[0]
+        self.accel = array('h', values[1:4])
+        self.gyro = array('h', values[4:7])
+        self.mag = array('h', values[7:10])
+        self.quaternions = array('h', values[10:14])
+        self.yaw, self.pitch, self.roll = values[14:17]
+        self.externalForces = array('h', values[17:20])
+        self.eulerAngleErrors = array('h', values[20:23])
         self.motionTrack, self.motionTrackProgress,\
         self.timestamp, self.stepCount,\
         self.walkingDirection,\
-        self.sitStand, self.sitTime, self.standTime,\
-        = struct.unpack(Neblina_UnitTestMotionData_fmt, dataString)        
+        self.sitStand, self.sitTime, self.standTime = values[23:]
 
     def __str__(self):
         return "Motion: {0} \n\
@@ -543,7 +595,7 @@ class UnitTestMotionData(object):
         self.sitStand, self.sitTime, self.standTime)
 
     def encode(self):
-        packetBytes = struct.pack(Neblina_UnitTestMotionData_fmt,\
+        packetBytes = Neblina_UnitTestMotionData_struct.pack(\
             self.startStop,\
             self.accel[0], self.accel[1], self.accel[2],\
             self.gyro[0], self.gyro[1], self.gyro[2],\
@@ -564,27 +616,28 @@ class UnitTestMotionData(object):
         return packetBytes
 
 Neblina_MotionState_fmt = "<I B 11s" # Timestamp, start/stop
+Neblina_MotionState_struct = struct.Struct(Neblina_MotionState_fmt)
 class MotionStateData(object):
     """docstring for MotionStateData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'startStop')
+    def __init__(self, dataString, offset=0):
         self.timestamp,\
         startStopByte,\
-        garbage = struct.unpack( Neblina_MotionState_fmt, dataString )
+        garbage = unpackData(Neblina_MotionState_struct, dataString, offset)
         self.startStop = (startStopByte == 0)
     def __str__(self):
         return "{0}us: startStop:{1})"\
         .format(self.timestamp,self.startStop)
 
 Neblina_ExternalForce_fmt = "<I 3h 6s" # Timestamp, External force xyz
+Neblina_ExternalForce_struct = struct.Struct(Neblina_ExternalForce_fmt)
 class ExternalForceData(object):
     """docstring for ExternalForceData"""
-    def __init__(self, dataString):
-        self.externalForces = [0]*3
-        self.timestamp,\
-        self.externalForces[0],\
-        self.externalForces[1],\
-        self.externalForces[2],\
-        garbage = struct.unpack( Neblina_ExternalForce_fmt, dataString )
+    __slots__ = ('timestamp', 'externalForces')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_ExternalForce_struct, dataString, offset)
+        self.timestamp = values[0]
+        self.externalForces = array('h', values[1:4])
 
     def __str__(self):
         return "{0}us: externalForces(x,y,z):({1},{2},{3})"\
@@ -592,17 +645,16 @@ class ExternalForceData(object):
             self.externalForces[1], self.externalForces[2])
 
 Neblina_TrajectoryDistance_fmt = "<I 3h H B 3s" # Timestamp, Euler angle errors, repeat count, percentage of completion
+Neblina_TrajectoryDistance_struct = struct.Struct(Neblina_TrajectoryDistance_fmt)
 class TrajectoryDistanceData(object):
     """docstring for TrajectoryDistance"""
-    def __init__(self, dataString):
-        self.eulerAngleErrors = [0]*3
-        self.timestamp,\
-        self.eulerAngleErrors[0],\
-        self.eulerAngleErrors[1],\
-        self.eulerAngleErrors[2],\
-        self.count,\
-        self.progress,\
-        garbage = struct.unpack( Neblina_TrajectoryDistance_fmt, dataString )
+    __slots__ = ('timestamp', 'eulerAngleErrors', 'count', 'progress')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_TrajectoryDistance_struct, dataString, offset)
+        self.timestamp = values[0]
+        self.eulerAngleErrors = array('h', values[1:4])
+        self.count = values[4]
+        self.progress = values[5]
 
     def __str__(self):
         return "{0}us: eulerAngleErrors(yaw,pitch,roll):({1},{2},{3}), count:{4}, progress:{5}%"\
@@ -610,18 +662,20 @@ class TrajectoryDistanceData(object):
             self.eulerAngleErrors[1], self.eulerAngleErrors[2], self.count, self.progress)
 
 Neblina_Pedometer_fmt = "<I H B h 7s" # Timestamp, stepCount, stepsPerMinute, walking direction 
+Neblina_Pedometer_struct = struct.Struct(Neblina_Pedometer_fmt)
 class PedometerData(object):
     """docstring for PedometerData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'stepCount', 'stepsPerMinute', 'walkingDirection')
+    def __init__(self, dataString, offset=0):
         self.timestamp,self.stepCount,\
         self.stepsPerMinute,\
         self.walkingDirection,\
-        garbage = struct.unpack( Neblina_Pedometer_fmt, dataString )
+        garbage = unpackData(Neblina_Pedometer_struct, dataString, offset)
         self.walkingDirection /= 10.0
 
     def encode(self):
         garbage = ('\000'*7).encode('utf-8')
-        packetString = struct.pack(Neblina_Pedometer_fmt, self.timestamp,\
+        packetString = Neblina_Pedometer_struct.pack(self.timestamp,\
         self.stepCount, self.stepsPerMinute, int(self.walkingDirection*10), garbage)
         return packetString
 
@@ -631,15 +685,17 @@ class PedometerData(object):
         self.stepsPerMinute, self.walkingDirection)
 
 Neblina_FingerGesture_fmt = "<I B 11s" # Timestamp, rotationCount, rpm speed
+Neblina_FingerGesture_struct = struct.Struct(Neblina_FingerGesture_fmt)
 class FingerGestureData(object):
     """docstring for RotationData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'gesture')
+    def __init__(self, dataString, offset=0):
         self.timestamp,self.gesture,\
-        garbage = struct.unpack( Neblina_FingerGesture_fmt, dataString )
+        garbage = unpackData(Neblina_FingerGesture_struct, dataString, offset)
 
     def encode(self):
         garbage = ('\000'*11).encode('utf-8')
-        packetString = struct.pack(Neblina_FingerGesture_fmt, self.timestamp,\
+        packetString = Neblina_FingerGesture_struct.pack(self.timestamp,\
         self.gesture, garbage)
         return packetString
 
@@ -663,17 +719,19 @@ class FingerGestureData(object):
 
 
 Neblina_RotationInfo_fmt = "<I I H 6s" # Timestamp, rotationCount, rpm speed
+Neblina_RotationInfo_struct = struct.Struct(Neblina_RotationInfo_fmt)
 class RotationData(object):
     """docstring for RotationData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'rotationCount', 'rpm')
+    def __init__(self, dataString, offset=0):
         self.timestamp,self.rotationCount,\
         self.rpm,\
-        garbage = struct.unpack( Neblina_RotationInfo_fmt, dataString )
+        garbage = unpackData(Neblina_RotationInfo_struct, dataString, offset)
         self.rpm = self.rpm/10.0
 
     def encode(self):
         garbage = ('\000'*6).encode('utf-8')
-        packetString = struct.pack(Neblina_RotationInfo_fmt, self.timestamp,\
+        packetString = Neblina_RotationInfo_struct.pack(self.timestamp,\
         self.rotationCount, int(self.rpm*10), garbage)
         return packetString
 
@@ -684,20 +742,18 @@ class RotationData(object):
 
 
 Neblina_Quat_t_fmt = "<I 4h 4s"
+Neblina_Quat_t_struct = struct.Struct(Neblina_Quat_t_fmt)
 class QuaternionData(object):
     """docstring for QuaternionData"""
-    def __init__(self, dataString):
-        self.quaternions = [0]*4
-        self.timestamp,\
-        self.quaternions[0],\
-        self.quaternions[1],\
-        self.quaternions[2],\
-        self.quaternions[3],\
-        garbage = struct.unpack( Neblina_Quat_t_fmt, dataString )
+    __slots__ = ('timestamp', 'quaternions')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_Quat_t_struct, dataString, offset)
+        self.timestamp = values[0]
+        self.quaternions = array('h', values[1:5])
 
     def encode(self):
         garbage = ('\000'*4).encode('utf-8')
-        packetString = struct.pack(Neblina_Quat_t_fmt, self.timestamp,\
+        packetString = Neblina_Quat_t_struct.pack(self.timestamp,\
         self.quaternions[0], self.quaternions[1],\
         self.quaternions[2], self.quaternions[3], garbage)
         return packetString
@@ -708,18 +764,18 @@ class QuaternionData(object):
             self.quaternions[2], self.quaternions[3])
 
 Neblina_IMU_fmt = "<I 3h 3h" # timestamp xyz xyz
+Neblina_IMU_struct = struct.Struct(Neblina_IMU_fmt)
 class IMUData(object):
     """docstring for IMUData"""
-    def __init__(self, dataString):
-        self.accel = [0]*3
-        self.gyro = [0]*3
-        self.timestamp, \
-        self.accel[0], self.accel[1], self.accel[2],\
-        self.gyro[0], self.gyro[1], self.gyro[2]\
-         = struct.unpack( Neblina_IMU_fmt, dataString )
+    __slots__ = ('timestamp', 'accel', 'gyro')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_IMU_struct, dataString, offset)
+        self.timestamp = values[0]
+        self.accel = array('h', values[1:4])
+        self.gyro = array('h', values[4:7])
 
     def encode(self):
-        packetString = struct.pack( Neblina_IMU_fmt, \
+        packetString = Neblina_IMU_struct.pack(\
         self.timestamp, self.accel[0], self.accel[1], self.accel[2],\
         self.gyro[0], self.gyro[1], self.gyro[2])
         return packetString
@@ -731,18 +787,18 @@ class IMUData(object):
                 self.gyro[0], self.gyro[1], self.gyro[2])
 
 Neblina_MAG_fmt = "<I 3h 3h" # timestamp xyz xyz
+Neblina_MAG_struct = struct.Struct(Neblina_MAG_fmt)
 class MAGData(object):
     """docstring for MAGData"""
-    def __init__(self, dataString):
-        self.mag = [0]*3
-        self.accel = [0]*3
-        self.timestamp, \
-        self.mag[0], self.mag[1], self.mag[2],\
-        self.accel[0], self.accel[1], self.accel[2]\
-         = struct.unpack( Neblina_MAG_fmt, dataString )
+    __slots__ = ('timestamp', 'mag', 'accel')
+    def __init__(self, dataString, offset=0):
+        values = unpackData(Neblina_MAG_struct, dataString, offset)
+        self.timestamp = values[0]
+        self.mag = array('h', values[1:4])
+        self.accel = array('h', values[4:7])
 
     def encode(self):
-        packetString = struct.pack( Neblina_MAG_fmt, \
+        packetString = Neblina_MAG_struct.pack(\
         self.timestamp, self.mag[0], self.mag[1], self.mag[2],\
         self.accel[0], self.accel[1], self.accel[2])
         return packetString
@@ -754,11 +810,13 @@ class MAGData(object):
                 self.mag[0], self.mag[1], self.mag[2])
 
 Neblina_Euler_fmt = "<I 4h 4s" # timestamp yaw, pitch, roll, demo heading
+Neblina_Euler_struct = struct.Struct(Neblina_Euler_fmt)
 class EulerAngleData(object):
     """docstring for EulerAngleData"""
-    def __init__(self, dataString):
+    __slots__ = ('timestamp', 'yaw', 'pitch', 'roll', 'demoHeading')
+    def __init__(self, dataString, offset=0):
         self.timestamp, self.yaw, self.pitch, self.roll, self.demoHeading,\
-            garbage = struct.unpack( Neblina_Euler_fmt, dataString )
+            garbage = unpackData(Neblina_Euler_struct, dataString, offset)
         self.yaw = self.yaw/10.0
         self.pitch = self.pitch/10.0
         self.roll = self.roll/10.0
@@ -766,7 +824,7 @@ class EulerAngleData(object):
 
     def encode(self):
         garbage = ('\000'*4).encode('utf-8')
-        packetString = struct.pack(Neblina_Euler_fmt, self.timestamp,\
+        packetString = Neblina_Euler_struct.pack(self.timestamp,\
          int(self.yaw*10), int(self.pitch*10), int(self.roll*10), int(self.demoHeading*10), garbage)
         return packetString
         
@@ -774,6 +832,13 @@ class EulerAngleData(object):
         return "{0}us: yaw/pitch/roll:({1},{2},{3}))"\
         .format(self.timestamp,self.yaw, self.pitch, self.roll)
 
+# Fields of the motion engine streams sent as fixed point values
+# (value*scale), converted to floats by the data classes above
+StreamScales = {
+    MotCmd_EulerAngle       :   {'yaw':10.0, 'pitch':10.0, 'roll':10.0, 'demoHeading':10.0},
+    MotCmd_Pedometer        :   {'walkingDirection':10.0},
+    MotCmd_RotationInfo     :   {'rpm':10.0},
+}
 
 # Dictionaries containing the data constructors for response packets
 # BlankData means a response data object does not need to be implemented
@@ -862,11 +927,52 @@ ResponsePacketDataConstructors = {
     Subsys_Storage              :   StorageResponses,
     Subsys_EEPROM               :   EEPROMResponses,
 }
+
+# Flat dispatch table indexed by (ctrlByte << 8) | command.
+# Each entry is (packetType, subSystem, dataConstructor), with UnknownData
+# as the constructor of unknown combinations and None for command packets,
+# which cannot be decoded as responses.
+def buildResponseDispatchTable():
+    table = []
+    for ctrlByte in range(256):
+        subSystem = ctrlByte & Subsys_BitMask
+        packetType = (ctrlByte & PacketType_BitMask) >> PacketType_BitPosition
+        if packetType == PacketType_Command:
+            table += [(packetType, subSystem, None)]*256
+            continue
+        row = [(packetType, subSystem, UnknownData)]*256
+        constructors = ResponsePacketDataConstructors.get(subSystem, {})
+        for command, dataConstructor in constructors.items():
+            row[command] = (packetType, subSystem, dataConstructor)
+        table += row
+    return table
+
+ResponseDispatchTable = buildResponseDispatchTable()
+
+# Entries of the regular motion engine responses, for the streaming fast path
+MotionStreamDispatch = ResponseDispatchTable[Subsys_MotionEngine << 8:(Subsys_MotionEngine+1) << 8]
+
+def headerKey(packetType, subSystem, command):
+    """ Key of a packet header, as used to index ResponseDispatchTable """
+    return (((packetType << PacketType_BitPosition) | subSystem) << 8) | command
+
+def splitHeaderKey(key):
+    """ (packetType, subSystem, command) of a header key """
+    ctrlByte = key >> 8
+    return (ctrlByte >> PacketType_BitPosition, ctrlByte & Subsys_BitMask, key & 0xFF)
+
+def packetKey(packetString):
+    """ Header key read straight from the bytes of a packet """
+    return (packetString[0] << 8) | packetString[3]
+
+def lookupResponse(ctrlByte, command):
+    return ResponseDispatchTable[(ctrlByte << 8) | command]
 # -------------------------------------------------------------------
 
 
 # Header = 4 bytes
 Neblina_PacketHeader_fmt = "<4B"
+Neblina_PacketHeader_struct = struct.Struct(Neblina_PacketHeader_fmt)
 class NebHeader(object):
     """ docstring for NebHeader
         The header section consists of four bytes.
@@ -879,6 +985,7 @@ class NebHeader(object):
         CtrlByte(7:5) = PacketType
         CtrlByte(4:0) = Subsytem Code
     """
+    __slots__ = ('subSystem', 'length', 'crc', 'command', 'packetType')
     def __init__(self, subSystem, packetType, commandType, crc=255, length = 16 ):
         self.subSystem = subSystem
         self.length = length
@@ -890,13 +997,13 @@ class NebHeader(object):
         packedCtrlByte = self.subSystem
         if self.packetType:
             packedCtrlByte |= (self.packetType << PacketType_BitPosition)
-        headerStringCode = struct.pack(Neblina_PacketHeader_fmt,\
+        headerStringCode = Neblina_PacketHeader_struct.pack(\
         packedCtrlByte, self.length, self.crc, self.command)
         return headerStringCode
 
     def __str__(self):
         stringFormat = "packetType = {0}, subSystem = {1}, packetLength = {2}, crc = {3}, command = {4}"
-        commandString = CommandStrings[(self.subSystem, self.command)]
+        commandString = CommandStrings.get((self.subSystem, self.command), 'Unknown Command')
         stringDescriptor = stringFormat.format(PacketTypeStrings[self.packetType], \
              self.subSystem, self.length,self.crc, commandString)
         return stringDescriptor
@@ -904,7 +1011,10 @@ class NebHeader(object):
 # Data = 16 bytes
 NeblinaPacket_fmt = "<4s 16s"
 class NebCommandPacket(object):
-    """docstring for NebCommandPacket"""
+    """docstring for NebCommandPacket
+        The wire bytes are built once, when the packet is created.
+    """
+    __slots__ = ('header', 'data', 'packetString')
     def __init__(self, subSystem, commandType, enable=True, **kwargs):
         # Logic for determining which type of command packet it is based on the header
         if(subSystem == Subsys_Debug and commandType == DebugCmd_UnitTestMotionData):
@@ -929,45 +1039,87 @@ class NebCommandPacket(object):
             self.data = NebGetLEDCommandData(kwargs['ledIndices'])
         else:
             self.data = NebCommandData(enable)
-        self.header = NebHeader(subSystem, PacketType_Command, commandType, length=len(self.data.encode()))
+        dataString = self.data.encode()
+        self.header = NebHeader(subSystem, PacketType_Command, commandType, length=len(dataString))
+        packetString = bytearray(self.header.encode())
+        packetString += dataString
         # Perform CRC calculation
-        self.header.crc = crc8(bytearray(self.header.encode() + self.data.encode()))
+        self.header.crc = nebcrc.nebCRC8(packetString)
+        packetString[nebcrc.CRCPosition] = self.header.crc
+        self.packetString = bytes(packetString)
 
     def stringEncode(self):
-        headerStringCode = self.header.encode()
-        dataStringCode = self.data.encode()
-        return headerStringCode+dataStringCode
+        return self.packetString
 
     def __str__(self):
         stringFormat = "header = [{0}] data = [{1}]"
         stringDescriptor = stringFormat.format(self.header, self.data)
         return stringDescriptor
 
+def decodeResponseHeader(packetString, checkCRC=True):
+    """ Decodes and checks the header of a response packet string.
+        Returns the packet as bytes along with its NebHeader and the
+        constructor of its data object (UnknownData if not known).
+    """
+    # Sanity check
+    packetStringLength = len(packetString)
+    if(packetStringLength < 5):
+        raise InvalidPacketFormatError(\
+            'Impossible packet, must have a packet of at least 5 bytes but got {0}'\
+            .format(packetStringLength))
+
+    # The string can either be bytes or an actual string
+    # Force it to a string if that is the case.
+    if (type(packetString) == str):
+        packetString = packetString.encode('iso-8859-1')
+
+    # Extract the header information
+    ctrlByte, packetLength, crc, command \
+    =  Neblina_PacketHeader_struct.unpack_from(packetString, 0)
+
+    # Streamed motion engine data: no need to check the packet type
+    if ctrlByte == Subsys_MotionEngine:
+        packetType, subSystem, dataConstructor = MotionStreamDispatch[command]
+    else:
+        packetType, subSystem, dataConstructor = ResponseDispatchTable[(ctrlByte << 8) | command]
+        # See if the packet is a response or a command packet
+        if dataConstructor is None:
+            raise InvalidPacketFormatError('Cannot create a response packet with the string of a command packet.')
+
+    # Perform CRC of data bytes
+    if(checkCRC):
+        calculatedCRC = nebcrc.nebCRC8(packetString)
+        if (calculatedCRC != crc):
+            raise CRCError(calculatedCRC, crc)
+
+    return packetString, NebHeader( subSystem, packetType, command, crc, packetLength ), dataConstructor
+
 class NebResponsePacket(object):
     """docstring for NebResponsePacket"""
+    __slots__ = ('header', 'data', 'headerLength')
 
     @classmethod
     def createMAGResponsePacket(cls, timestamp, mag, accel):
-        dataString = struct.pack( Neblina_MAG_fmt, \
+        dataString = Neblina_MAG_struct.pack(\
         timestamp, int(mag[0]), int(mag[1]), int(mag[2]),\
         int(accel[0]), int(accel[1]), int(accel[2]))
         data = MAGData(dataString)
         # Perform CRC of data bytes
         header = NebHeader(Subsys_MotionEngine, False, MotCmd_MAG_Data, len(dataString))
         responsePacket = NebResponsePacket(packetString=None, header=header, data=data, checkCRC=False)
-        responsePacket.header.crc = genNebCRC8(bytearray(responsePacket.stringEncode()))
+        responsePacket.header.crc = nebcrc.nebCRC8(responsePacket.stringEncode())
         return responsePacket
 
     @classmethod
     def createIMUResponsePacket(cls, timestamp, accel, gyro):
-        dataString = struct.pack( Neblina_IMU_fmt, \
+        dataString = Neblina_IMU_struct.pack(\
         timestamp, int(accel[0]), int(accel[1]), int(accel[2]),\
         int(gyro[0]), int(gyro[1]), int(gyro[2]))
         data = IMUData(dataString)
         # Perform CRC of data bytes
         header = NebHeader(Subsys_MotionEngine, False, MotCmd_IMU_Data, len(dataString))
         responsePacket = NebResponsePacket(packetString=None, header=header, data=data, checkCRC=False)
-        responsePacket.header.crc = genNebCRC8(bytearray(responsePacket.stringEncode()))
+        responsePacket.header.crc = nebcrc.nebCRC8(responsePacket.stringEncode())
         return responsePacket
 
     @classmethod
@@ -978,12 +1130,12 @@ class NebResponsePacket(object):
         roll = int(roll*10)
         demoHeading = int(demoHeading*10)
         garbage = '\000\000\000\000'.encode('utf-8')
-        dataString = struct.pack( Neblina_Euler_fmt, int(timestamp), yaw, pitch, roll, demoHeading, garbage )
+        dataString = Neblina_Euler_struct.pack(int(timestamp), yaw, pitch, roll, demoHeading, garbage )
         data = EulerAngleData(dataString)
         # Perform CRC of data bytes
         header = NebHeader(Subsys_MotionEngine, False, MotCmd_EulerAngle, len(dataString))
         responsePacket = NebResponsePacket(packetString=None, header=header, data=data, checkCRC=False)
-        responsePacket.header.crc = genNebCRC8(bytearray(responsePacket.stringEncode()))
+        responsePacket.header.crc = nebcrc.nebCRC8(responsePacket.stringEncode())
         return responsePacket
 
     @classmethod
@@ -991,73 +1143,35 @@ class NebResponsePacket(object):
         # Multiply the walking direction value by 10 to emulate the firmware behavior
         walkingDirection = int(walkingDirection*10)
         garbage = ('\000'*7).encode('utf-8')
-        dataString = struct.pack( Neblina_Pedometer_fmt, timestamp, stepCount,\
+        dataString = Neblina_Pedometer_struct.pack(timestamp, stepCount,\
          stepsPerMinute, walkingDirection, garbage )
         data = PedometerData(dataString)
         # Perform CRC of data bytes
-        crc = crc8(bytearray(dataString))
-        header = NebHeader(Subsys_MotionEngine, False, MotCmd_Pedometer, crc, len(dataString))
+        header = NebHeader(Subsys_MotionEngine, False, MotCmd_Pedometer, length=len(dataString))
         responsePacket = NebResponsePacket(packetString=None, header=header, data=data, checkCRC=False)
-        responsePacket.header.crc = genNebCRC8(bytearray(responsePacket.stringEncode()))
+        responsePacket.header.crc = nebcrc.nebCRC8(responsePacket.stringEncode())
         return responsePacket
 
     @classmethod
     def createRotationResponsePacket(cls, timestamp, rotationCount, rpm):
         garbage = ('\000'*6).encode('utf-8')
-        dataString = struct.pack( Neblina_RotationInfo_fmt, timestamp, rotationCount,\
+        dataString = Neblina_RotationInfo_struct.pack(timestamp, rotationCount,\
          rpm, garbage )
         data = RotationData(dataString)
         # Perform CRC of data bytes
-        crc = crc8(bytearray(dataString))
-        header = NebHeader(Subsys_MotionEngine, False, MotCmd_RotationInfo, crc, len(dataString))
+        header = NebHeader(Subsys_MotionEngine, False, MotCmd_RotationInfo, length=len(dataString))
         responsePacket = NebResponsePacket(packetString=None, header=header, data=data, checkCRC=False)
-        responsePacket.header.crc = genNebCRC8(bytearray(responsePacket.stringEncode()))
+        responsePacket.header.crc = nebcrc.nebCRC8(responsePacket.stringEncode())
         return responsePacket
 
     def __init__(self, packetString=None, header=None, data=None, checkCRC=True):
         if (packetString != None):
-            # Sanity check
-            packetStringLength = len(packetString)
-            if(packetStringLength < 5):
-                raise InvalidPacketFormatError(\
-                    'Impossible packet, must have a packet of at least 5 bytes but got {0}'\
-                    .format(packetStringLength))
-
-            # The string can either be bytes or an actual string
-            # Force it to a string if that is the case.
-            if (type(packetString) == str):
-                packetString = packetString.encode('iso-8859-1')
-
-            # Extract the header information
-            self.headerLength = 4
-            headerString = packetString[:self.headerLength]
-            ctrlByte, packetLength, crc, command \
-            =  struct.unpack(Neblina_PacketHeader_fmt, headerString)
-            
-            # Extract the value from the subsystem byte            
-            subSystem = ctrlByte & Subsys_BitMask
-
-            # Check if the response byte is an acknowledge
-            packetTypeCode = ctrlByte & PacketType_BitMask
-            packetType = packetTypeCode >> PacketType_BitPosition
-
-            # See if the packet is a response or a command packet
-            if(packetType == PacketType_Command):
-                raise InvalidPacketFormatError('Cannot create a response packet with the string of a command packet.')
-
-            self.header = NebHeader( subSystem, packetType, command, crc, packetLength )
-
-            # Extract the data substring
-            dataString = packetString[self.headerLength:self.headerLength+packetLength]
-
-            # Perform CRC of data bytes
-            if(checkCRC):
-                calculatedCRC = genNebCRC8(bytearray(packetString))
-                if (calculatedCRC != self.header.crc):
-                    raise CRCError(calculatedCRC, self.header.crc)
+            packetString, self.header, dataConstructor = decodeResponseHeader(packetString, checkCRC)
+            self.headerLength = Neblina_PacketHeader_struct.size
 
             # Build the data object based on the subsystem and command.
-            self.data = ResponsePacketDataConstructors[subSystem][self.header.command](dataString)
+            # The data is unpacked in place, right after the header.
+            self.data = dataConstructor(packetString, self.headerLength)
 
         elif(header != None and data != None):
             self.header = header
@@ -1073,6 +1187,35 @@ class NebResponsePacket(object):
         stringDescriptor = stringFormat.format(self.header, self.data)
         return stringDescriptor
 
+class NebLazyResponsePacket(object):
+    """docstring for NebLazyResponsePacket
+        Response packet that only decodes its header up front.
+        The packet string is kept as received and the data object is
+        built the first time the data attribute is read, so packets that
+        are filtered out on their header never pay for data decoding.
+        An unknown subsystem/command decodes to UnknownData.
+    """
+    __slots__ = ('header', 'headerLength', 'packetString', 'dataConstructor', 'decodedData')
+
+    def __init__(self, packetString, checkCRC=True):
+        self.packetString, self.header, self.dataConstructor = decodeResponseHeader(packetString, checkCRC)
+        self.headerLength = Neblina_PacketHeader_struct.size
+        self.decodedData = None
+
+    @property
+    def data(self):
+        if self.decodedData is None:
+            self.decodedData = self.dataConstructor(self.packetString, self.headerLength)
+        return self.decodedData
+
+    def stringEncode(self):
+        return bytes(self.packetString)
+
+    def __str__(self):
+        stringFormat = "header = [{0}] data = [{1}]"
+        stringDescriptor = stringFormat.format(self.header, self.data)
+        return stringDescriptor
+
 class CRCError(Exception):
     """docstring for CRCError"""
     def __init__(self, expected, actual):
@@ -1089,33 +1232,66 @@ class InvalidPacketFormatError(Exception):
     def __str__(self):
         return self.errorString
 
+class NebTimeoutError(TimeoutError):
+    """docstring for NebTimeoutError
+        Raised when an expected packet did not come in time. numPackets,
+        when set, is the number of packets received before giving up.
+    """
+    def __init__(self, packetType, subSystem, command, timeout, attempts=1, numPackets=None):
+        self.packetType = packetType
+        self.subSystem = subSystem
+        self.command = command
+        self.timeout = timeout
+        self.attempts = attempts
+        self.numPackets = numPackets
+    def __str__(self):
+        commandString = CommandStrings.get((self.subSystem, self.command), 'Unknown Command')
+        errorString = 'No {0} packet for {1} after {2} attempt(s), last one waited {3}s'\
+            .format(PacketTypeStrings.get(self.packetType, self.packetType),\
+                commandString, self.attempts, self.timeout)
+        if self.numPackets is not None:
+            errorString += ', {0} packets received before'.format(self.numPackets)
+        return errorString
+
+class StreamOverflowError(BufferError):
+    """docstring for StreamOverflowError
+        Raised when packets of a stream were dropped because its consumer
+        fell behind.
+    """
+    def __init__(self, command, droppedPackets):
+        self.command = command
+        self.droppedPackets = droppedPackets
+    def __str__(self):
+        commandString = CommandStrings.get((Subsys_MotionEngine, self.command), 'Unknown Command')
+        return '{0} packets of {1} dropped, the consumer fell behind'\
+            .format(self.droppedPackets, commandString)
+
+class EEPROMPageError(Exception):
+    """docstring for EEPROMPageError
+        Raised when EEPROM pages could not be read or written: the board
+        answered them with an error log response (errorPages) or did not
+        answer in time (timedOutPages). writtenPages are the pages that
+        were written anyway.
+    """
+    def __init__(self, command, errorPages, timedOutPages, writtenPages=()):
+        self.command = command
+        self.errorPages = list(errorPages)
+        self.timedOutPages = list(timedOutPages)
+        self.writtenPages = list(writtenPages)
+    def __str__(self):
+        commandString = CommandStrings.get((Subsys_EEPROM, self.command), 'Unknown Command')
+        return 'EEPROM {0} failed, error on pages {1}, no answer for pages {2}'\
+            .format(commandString, self.errorPages, self.timedOutPages)
+
 # http://stackoverflow.com/questions/434287/what-is-the-most-pythonic-way-to-iterate-over-a-list-in-chunks
 def grouper(iterable, n, fillvalue=None):
     args = [iter(iterable)] * n
     return zip_longest(*args, fillvalue=fillvalue)
 
 def crc8(bytes):
-    crc = 0
-    for byte in bytes:
-        ee = (crc) ^ (byte)
-        ff = (ee) ^ (ee>>4) ^ (ee>>7)
-        crc = ((ff<<1)%256) ^ ((ff<<4) % 256)
-    return crc
+    return nebcrc.crc8(bytes)
 
 # Special CRC routine that skips the expected position of the CRC calculation
 # in a Neblina packet
 def genNebCRC8(packetBytes):
-    crc = 0
-    # The CRC should be placed as the third byte in the packet
-    crc_backup = packetBytes[2]
-    packetBytes[2] = 255
-    ii = 0
-    while ii < len(packetBytes):
-       ee = (crc) ^ (packetBytes[ii])
-       ff = (ee) ^ (ee>>4) ^ (ee>>7)
-       crc = ((ff<<1)%256) ^ ((ff<<4) % 256)
-       ii += 1
-    packetBytes[2] = crc_backup
-    return crc
-
-
+    return nebcrc.nebCRC8(packetBytes)
@@ -1,115 +1,482 @@
 import os
 import cmd
 import binascii
+import time
+import struct
 import serial
-import slip
+from collections import deque
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
 import neblina as neb
+import neblinaclock as nebclock
+import neblinacrc as nebcrc
+import neblinareader as nebreader
+import neblinaslip as nebslip
+import neblinastore as nebstore
+
+def freezeArgument(value):
+    """ Hashable version of a command argument: lists and tuples become
+        tuples, buffers (bytearray, array, ...) their format and bytes.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freezeArgument(item) for item in value)
+    if isinstance(value, (bytes, str)):
+        return value
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return value
+    return (view.format, view.shape, view.tobytes())
+
+def commandFrame(frameCache, subsystem, command, enable=True, **kwargs):
+    """ SLIP frame of a command, taken from a FrameCache. Commands with
+        arguments that cannot be hashed are encoded without the cache.
+    """
+    build = lambda: nebslip.encodeFrame(\
+        neb.NebCommandPacket(subsystem, command, enable, **kwargs).stringEncode())
+    key = (subsystem, command, freezeArgument(enable)) + \
+        tuple((name, freezeArgument(value)) for name, value in sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return build()
+    return frameCache.get(key, build)
+
+# Time given to the board to erase its flash
+FlashEraseTimeout = 600.0
+
+# Bytes taken by a packet in a flash session (see flashGetSessionInfo())
+FlashPacketSize = 18
+
+# Write buffer of the playback files, and how often playback progress is
+# reported (in packets)
+PlaybackBufferSize = 1 << 16
+PlaybackProgressPackets = 256
+
+class RetryPolicy(object):
+    """docstring for RetryPolicy
+        How many times a command is sent and how long each attempt waits
+        for the answer: timeout seconds at first, multiplied by backoff
+        after every attempt, up to maxTimeout.
+    """
+    def __init__(self, attempts=5, timeout=1.5, backoff=2.0, maxTimeout=10.0):
+        self.attempts = attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self.maxTimeout = maxTimeout
+
+    def timeouts(self):
+        timeout = self.timeout
+        for attempt in range(self.attempts):
+            yield timeout
+            timeout = min(timeout*self.backoff, self.maxTimeout)
+
+# Flash session catalogs by device ID: lists of (sessionID, sessionLength),
+# see NeblinaComm.flashGetCatalog()
+SessionCatalogs = {}
+
+# How many sessions are asked per pipelined batch of flashGetCatalog()
+CatalogPipelineDepth = 32
+
+# EEPROM layout, and how many pages are read or written per pipelined batch
+EEPROMNumPages = 256
+EEPROMPageSize = 8
+EEPROMPipelineDepth = 32
+
+# Write-through EEPROM page caches by device ID: page number -> page bytes,
+# see NeblinaComm.EEPROMRead()
+EEPROMCaches = {}
+
+# Streams sent when something happens rather than at a fixed rate
+EventStreams = (neb.MotCmd_RotationInfo, neb.MotCmd_Pedometer,\
+    neb.MotCmd_FingerGesture, neb.MotCmd_TrajectoryInfo)
+
+# What iterStream() does when its consumer falls behind and the stream
+# buffer is full: drop the oldest packets, or raise StreamOverflowError
+StreamOverflow_DropOldest   =   0x00
+StreamOverflow_Raise        =   0x01
+
+class StreamSubscription(object):
+    """docstring for StreamSubscription
+        A consumer of one stream type, see NeblinaComm.subscribe().
+        The consumer is a callable, or a sink with an extend() method
+        (a list, a deque, a StreamStore). It is given lists of packets,
+        every batchSize packets and, when interval is set, once interval
+        seconds have passed since the first packet of the batch.
+    """
+    def __init__(self, streamingType, consumer, batchSize=None, interval=None):
+        self.streamingType = streamingType
+        self.consumer = consumer
+        self.deliver = consumer if callable(consumer) else consumer.extend
+        # One packet at a time unless batched by time
+        if batchSize is None and interval is None:
+            batchSize = 1
+        self.batchSize = batchSize
+        self.interval = interval
+        self.batch = []
+        self.flushTime = None
+        self.numPackets = 0
+
+    def add(self, packet, now):
+        batch = self.batch
+        if not batch and self.interval is not None:
+            self.flushTime = now + self.interval
+        batch.append(packet)
+        if (self.batchSize is not None and len(batch) >= self.batchSize) or \
+            (self.flushTime is not None and now >= self.flushTime):
+            self.flush()
+
+    def flush(self):
+        batch = self.batch
+        if batch:
+            self.batch = []
+            self.flushTime = None
+            self.numPackets += len(batch)
+            self.deliver(batch)
 
 class NeblinaComm(object):
     """docstring for NeblinaComm"""
-    def __init__(self, serialcom):
-        self.comslip = slip.slip()
+    def __init__(self, serialcom, retryPolicy=None):
         self.sc = serialcom
+        # Default wait timeout and retries of the commands
+        self.retryPolicy = retryPolicy if retryPolicy is not None else RetryPolicy()
+        # Encoded command frames, reused on retries and repeated commands
+        self.commandFrames = nebslip.FrameCache()
+        # The CRC is only checked on the frames that get decoded
+        self.slipReader = nebslip.SlipReader(serialcom, checkCRC=False)
+        # Background reader owning the port, see startReader()
+        self.reader = None
+        # Stream consumers per stream type, see subscribe()
+        self.subscriptions = {}
+        self.streaming = False
+        # Device ID of the board, once asked (see getDeviceID())
+        self.deviceID = None
+
+    def startReader(self, queueSize=nebreader.PacketQueueSize):
+        """ Hands the port over to a background reader thread. Packets
+            are then queued as they arrive instead of being dropped while
+            waiting for an answer.
+        """
+        if self.reader is None:
+            self.reader = nebreader.NeblinaReader(self.slipReader, queueSize)
+            self.reader.start()
+        return self.reader
+
+    def stopReader(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+
+    def readTimeout(self):
+        return getattr(self.sc, 'timeout', None)
+
+    def deadline(self, timeout=None):
+        """ time.monotonic() deadline of a wait, by default the first
+            timeout of the retry policy.
+        """
+        if timeout is None:
+            timeout = self.retryPolicy.timeout
+        return time.monotonic() + timeout
+
+    def receiveQueued(self, keys=None, deadline=None):
+        timeout = self.readTimeout() if deadline is None else max(deadline - time.monotonic(), 0.0)
+        packet = self.reader.get(keys, timeout)
+        if packet is None:
+            raise TimeoutError('No packet received before the read timed out')
+        return packet
+
+    def discardInput(self):
+        """ Drops what was received and not read yet """
+        if self.reader is not None:
+            self.reader.discard()
+            return
+        resetInput = getattr(self.sc, 'reset_input_buffer', None) or getattr(self.sc, 'flushInput', None)
+        if resetInput is not None:
+            resetInput()
+        self.slipReader.reset()
 
     def sendCommand(self, subsystem, command, enable=True, **kwargs):
-        commandPacket = neb.NebCommandPacket(subsystem, command, enable, **kwargs)
-        self.comslip.sendPacketToStream(self.sc, commandPacket.stringEncode())
+        frame = commandFrame(self.commandFrames, subsystem, command, enable, **kwargs)
+        self.sc.write(frame)
+
+    def submitCommand(self, subsystem, command, enable=True, packetType=neb.PacketType_Ack, **kwargs):
+        """ Sends a command without waiting. Returns a future completed
+            with its ack (or with the packet of the given type). Requires
+            the background reader.
+        """
+        if self.reader is None:
+            raise RuntimeError('submitCommand() needs the background reader, call startReader() first')
+        future = self.reader.expect((neb.headerKey(packetType, subsystem, command),\
+            neb.headerKey(neb.PacketType_ErrorLogResp, subsystem, command)))
+        self.sendCommand(subsystem, command, enable, **kwargs)
+        return future
+
+    def commandWithRetry(self, subsystem, command, enable=True,\
+        packetType=neb.PacketType_Ack, retryPolicy=None, rejected=None, **kwargs):
+        """ Sends a command until its answer (ack by default) comes, as set
+            by the retry policy. Raises NebTimeoutError when it never does.
+            Other packets received meanwhile go to rejected, see
+            receivePacketMatching().
+        """
+        retryPolicy = retryPolicy if retryPolicy is not None else self.retryPolicy
+        attempts = 0
+        timeout = None
+        for timeout in retryPolicy.timeouts():
+            attempts += 1
+            self.sendCommand(subsystem, command, enable, **kwargs)
+            try:
+                return self.waitForPacket(packetType, subsystem, command, rejected, timeout)
+            except neb.NebTimeoutError:
+                continue
+        raise neb.NebTimeoutError(packetType, subsystem, command, timeout, attempts)
+
+    def sendCommands(self, commands, packetTypes=(neb.PacketType_Ack,), timeout=None):
+        """ Pipelined commands: all the commands are put on the wire back
+            to back, then their answers are collected. Each command is a
+            (subsystem, command[, enable[, kwargs]]) tuple. Answers are
+            matched to the commands by header key, in sending order, one
+            packet of each of packetTypes per command. Returns the last
+            answer of each command (its error log response if any, None
+            if they did not all come before the timeout). Raises
+            ConnectionError if the background reader is stopped meanwhile.
+        """
+        deadline = self.deadline(timeout)
+        requests = [tuple(command) + (True, {})[len(command)-2:] for command in commands]
+        answerKeys = [[neb.headerKey(packetType, subsystem, command) for packetType in packetTypes]\
+            for subsystem, command, enable, kwargs in requests]
+        errorKeys = [neb.headerKey(neb.PacketType_ErrorLogResp, subsystem, command)\
+            for subsystem, command, enable, kwargs in requests]
+        answers = [[None]*len(packetTypes) for request in requests]
 
-    def receivePacket(self):
-        consoleBytes = self.comslip.receivePacketFromStream(self.sc)
-        packet = neb.NebResponsePacket(consoleBytes)
+        if self.reader is not None:
+            futures = []
+            for request, keys, errorKey in zip(requests, answerKeys, errorKeys):
+                futures.append([self.reader.expect((key, errorKey)) for key in keys])
+                subsystem, command, enable, kwargs = request
+                self.sendCommand(subsystem, command, enable, **kwargs)
+            for commandIndex, (commandAnswers, commandFutures) in enumerate(zip(answers, futures)):
+                for index, future in enumerate(commandFutures):
+                    try:
+                        commandAnswers[index] = future.result(max(deadline - time.monotonic(), 0.0))
+                    except FutureTimeoutError:
+                        break
+                    except CancelledError:
+                        # The reader was stopped, no answer will come anymore
+                        for laterFutures in futures[commandIndex:]:
+                            for laterFuture in laterFutures:
+                                laterFuture.cancel()
+                        subsystem, command = requests[commandIndex][:2]
+                        raise ConnectionError('The reader was stopped before command {0} ({1}) was answered'\
+                            .format(commandIndex, neb.CommandStrings.get((subsystem, command), 'Unknown Command')))
+                    if commandAnswers[index].header.packetType == neb.PacketType_ErrorLogResp:
+                        break
+                # Answers that will not come must not take later packets
+                for future in commandFutures:
+                    future.cancel()
+            return [self.lastAnswer(commandAnswers) for commandAnswers in answers]
+
+        # Answers still expected per header key, oldest command first
+        pending = {}
+        for commandIndex, (keys, errorKey) in enumerate(zip(answerKeys, errorKeys)):
+            for index, key in enumerate(keys):
+                pending.setdefault(key, deque()).append((commandIndex, index))
+            pending.setdefault(errorKey, deque()).append((commandIndex, None))
+        for subsystem, command, enable, kwargs in requests:
+            self.sendCommand(subsystem, command, enable, **kwargs)
+        numMissing = len(requests)*len(packetTypes)
+        while numMissing > 0:
+            try:
+                packet = self.receivePacketMatching(pending, deadline=deadline)
+            except (neb.CRCError, neb.InvalidPacketFormatError):
+                continue
+            except TimeoutError:
+                break
+            key = neb.packetKey(packet.packetString)
+            commandIndex, index = pending[key].popleft()
+            if index is None:
+                # Error log response: the command will not answer further
+                commandAnswers = answers[commandIndex]
+                for index, answerKey in enumerate(answerKeys[commandIndex]):
+                    if commandAnswers[index] is None:
+                        pending[answerKey].remove((commandIndex, index))
+                        commandAnswers[index] = packet
+                        numMissing -= 1
+            else:
+                answers[commandIndex][index] = packet
+                numMissing -= 1
+                if all(answers[commandIndex]):
+                    pending[errorKeys[commandIndex]].remove((commandIndex, None))
+            pending = dict((key, queue) for key, queue in pending.items() if queue)
+        return [self.lastAnswer(commandAnswers) for commandAnswers in answers]
+
+    def sendCommandBatches(self, commands, depth, packetTypes=(neb.PacketType_Ack,),\
+        matches=None, attempts=2):
+        """ sendCommands() by batches of depth commands, each batch with a
+            deadline of its own. matches(index, packet), if given, tells
+            whether an answer really is the one of commands[index] (error
+            log responses always are). Commands without a matching answer
+            are sent again, up to attempts times in all. Returns the
+            answers, None for the commands still without one.
+        """
+        answers = [None]*len(commands)
+        indices = list(range(len(commands)))
+        for attempt in range(attempts):
+            for start in range(0, len(indices), depth):
+                batch = indices[start:start+depth]
+                packets = self.sendCommands([commands[index] for index in batch], packetTypes)
+                for index, packet in zip(batch, packets):
+                    if packet is None:
+                        continue
+                    if matches is None or packet.header.packetType == neb.PacketType_ErrorLogResp or \
+                        matches(index, packet):
+                        answers[index] = packet
+            indices = [index for index in indices if answers[index] is None]
+            if not indices:
+                break
+        return answers
+
+    def lastAnswer(self, commandAnswers):
+        for packet in commandAnswers:
+            if packet is None:
+                return None
+            if packet.header.packetType == neb.PacketType_ErrorLogResp:
+                return packet
+        return commandAnswers[-1]
+
+    def receiveFrame(self, deadline=None):
+        if self.reader is not None:
+            return self.receiveQueued(None, deadline).packetString
+        return self.slipReader.receiveFrame(deadline)
+
+    def receivePacket(self, deadline=None):
+        if self.reader is not None:
+            return self.receiveQueued(None, deadline)
+        # Malformed frames are dropped by the SLIP reader
+        consoleBytes = self.slipReader.receiveFrame(deadline)
+        # Only the header is decoded here, the data is decoded on first access
+        packet = neb.NebLazyResponsePacket(consoleBytes)
         return packet
 
-    def storePacketsUntil(self, packetType, subSystem, command):
-        packetList = []
-        packetCounter = 0
-        packet = None
-        #print('waiting and got: {0}'.format(packet))
-        while( packet == None or \
-                packet.header.packetType != packetType or \
-                packet.header.subSystem != subSystem or \
-                packet.header.command != command):
+    def receivePacketMatching(self, match, rejected=None, deadline=None):
+        """ Receives the next packet accepted by match.
+            match is either a collection of header keys (see neb.headerKey)
+            or a predicate called with the raw packet bytes. Packets that
+            are not accepted are skipped on their header bytes alone, with
+            no CRC check nor decoding, or handed over raw to rejected.
+            With the background reader, packets matching a collection of
+            keys are taken from their queues and the others stay queued.
+            Raises TimeoutError when the deadline (time.monotonic) passes.
+        """
+        if self.reader is not None and not callable(match):
+            return self.receiveQueued(match, deadline)
+        if callable(match):
+            accept = match
+        else:
+            accept = lambda packetString: neb.packetKey(packetString) in match
+        while True:
+            consoleBytes = self.receiveFrame(deadline)
+            if accept(consoleBytes):
+                return neb.NebLazyResponsePacket(consoleBytes)
+            if rejected is not None:
+                rejected(consoleBytes)
+
+    def receivePacketsUntil(self, sink, packetType, subSystem, command,\
+        progress=None, totalPackets=None):
+        """ Hands the received packet strings to sink (if not None) until
+            the given packet is received. Debug packets and packets with a
+            bad CRC are left out. progress is called with the number of
+            packets received so far and totalPackets, every
+            PlaybackProgressPackets packets and at the end. Returns the
+            number of packets. Raises NebTimeoutError, with the number of
+            packets received so far, when the port goes quiet before the
+            given packet comes.
+        """
+        untilKey = neb.headerKey(packetType, subSystem, command)
+        numPackets = 0
+        while True:
             try:
-                if (packet != None and \
-                    packet.header.subSystem != neb.Subsys_Debug):
-                    packetList.append(packet)
-                    print('Received {0} packets \r'.format(len(packetList)) , end="", flush=True)
-                packet = self.receivePacket()
-                # print('waiting and got: {0}'.format(packet.data))
-            except NotImplementedError as nie:
-                packet = None
-                print('Dropped bad packet')
-                print(nie)
+                packetString = self.receiveFrame()
+            except TimeoutError:
+                raise neb.NebTimeoutError(packetType, subSystem, command,\
+                    self.readTimeout(), numPackets=numPackets) from None
+            if neb.packetKey(packetString) == untilKey:
+                break
+            if (packetString[0] & neb.Subsys_BitMask) == neb.Subsys_Debug:
                 continue
-            except KeyError as ke:
-                packet = None
-                print("Tried creating a packet with an invalid subsystem or command")
-                print(ke)
-            except neb.CRCError as crce:
-                packet = None
+            calculatedCRC = nebcrc.nebCRC8(packetString)
+            if calculatedCRC != packetString[nebcrc.CRCPosition]:
                 print('CRCError')
-                print(crce)
-                continue
-            except Exception as e:
-                packet = None
-                print(type(e))
+                print(neb.CRCError(calculatedCRC, packetString[nebcrc.CRCPosition]))
                 continue
-        print('\nTotal IMU Packets Read: {0}'.format(len(packetList)))
-        return packetList
+            if sink is not None:
+                try:
+                    sink(packetString)
+                except struct.error as se:
+                    print('Dropped bad packet')
+                    print(se)
+                    continue
+            numPackets += 1
+            if progress is not None and numPackets % PlaybackProgressPackets == 0:
+                progress(numPackets, totalPackets)
+        if progress is not None:
+            progress(numPackets, totalPackets)
+        return numPackets
+
+    def storePacketsUntil(self, packetType, subSystem, command, store=None):
+        """ Appends the received packets to a StreamStore until the given
+            packet is received, see receivePacketsUntil().
+        """
+        if store is None:
+            store = nebstore.StreamStore()
+        numPackets = self.receivePacketsUntil(store.append, packetType, subSystem, command,\
+            lambda numPackets, totalPackets: print('Received {0} packets \r'.format(numPackets),\
+                end="", flush=True))
+        print('\nTotal IMU Packets Read: {0}'.format(numPackets))
+        return store
+
+    def writePacketsUntil(self, stream, packetType, subSystem, command,\
+        progress=None, totalPackets=None):
+        """ Writes the received packets to a binary stream (if not None)
+            as they arrive, laid end to end, until the given packet is
+            received. See receivePacketsUntil().
+        """
+        return self.receivePacketsUntil(None if stream is None else stream.write,\
+            packetType, subSystem, command, progress, totalPackets)
 
     # Helper Functions
-    def waitForAck(self, subSystem, command):
-        ackPacket = self.waitForPacket(neb.PacketType_Ack, subSystem, command)
+    def waitForAck(self, subSystem, command, rejected=None, timeout=None):
+        ackPacket = self.waitForPacket(neb.PacketType_Ack, subSystem, command, rejected, timeout)
         return ackPacket
         
-    def waitForPacket(self, packetType, subSystem, command):
-        packet = None
-        while( (packet == None) or \
-            ( (packet.header.packetType != packetType) and (packet.header.packetType != neb.PacketType_ErrorLogResp) ) or \
-            packet.header.subSystem != subSystem or \
-            packet.header.command != command):
+    def waitForPacket(self, packetType, subSystem, command, rejected=None, timeout=None):
+        """ Waits for a packet, up to timeout seconds if given. Without a
+            timeout it waits as long as packets keep coming, until a read
+            of the port times out, so slow commands (flash erase, recorder,
+            EEPROM) are not cut short. Error log responses to the command
+            are returned as well. Raises NebTimeoutError when nothing came
+            in time.
+        """
+        keys = (neb.headerKey(packetType, subSystem, command),\
+            neb.headerKey(neb.PacketType_ErrorLogResp, subSystem, command))
+        deadline = None if timeout is None else self.deadline(timeout)
+        while True:
             try:
-                packet = self.receivePacket()
-            except NotImplementedError as nie:
-                print('Dropped bad packet')
-                print(nie)
-                packet = None
-                continue
+                return self.receivePacketMatching(keys, rejected, deadline)
             except neb.InvalidPacketFormatError as ipfe:
                 print(ipfe)
-                packet = None
                 continue
             except neb.CRCError as crce:
                 print('CRCError')
                 print(crce)
-                packet = None
-                continue
-            except KeyError as ke:
-                packet = None
-                print("Tried creating a packet with an invalid subsystem or command")
-                print(ke)
                 continue
             except TimeoutError as te:
-                packet = None
-                print('Read timed out.')
-                return None
-        return packet
+                raise neb.NebTimeoutError(packetType, subSystem, command,\
+                    timeout if timeout is not None else self.readTimeout())
 
     def switchStreamingInterface(self, interface=True):
         # True = UART
         # False = BLE
-        self.sendCommand(neb.Subsys_Debug, neb.DebugCmd_SetInterface, interface)
         print('Waiting for the module to switch its interface...')
-        packet = self.waitForAck(neb.Subsys_Debug, neb.DebugCmd_SetInterface)
-        numTries = 0
-        while(packet == None):
-            numTries += 1
-            if numTries > 5:
-                print('The unit is not responding. Exiting...')
-                exit()
-            print('Trying again...')
-            self.sendCommand(neb.Subsys_Debug, neb.DebugCmd_SetInterface, interface)
-            packet = self.waitForAck(neb.Subsys_Debug, neb.DebugCmd_SetInterface)
+        self.commandWithRetry(neb.Subsys_Debug, neb.DebugCmd_SetInterface, interface)
 
     # Debug Commands
     def motionGetStates(self):
@@ -128,59 +495,180 @@ class NeblinaComm(object):
         return neb.MotAndFlashRecStateData.recorderStatusStrings[packet.data.recorderStatus]
 
     # Motine Engine commands
-    def motionStream(self, streamingType, numPackets=None):
-        errorList = []
-        # Send command to start streaming
-        self.sendCommand(neb.Subsys_MotionEngine, streamingType, True)
-        packet = self.waitForAck(neb.Subsys_MotionEngine, streamingType)
+    def subscribe(self, streamingType, consumer, batchSize=None, interval=None):
+        """ Registers a consumer of a motion engine stream, served by
+            runStreams(). Returns the StreamSubscription.
+        """
+        subscription = StreamSubscription(streamingType, consumer, batchSize, interval)
+        self.subscriptions.setdefault(streamingType, []).append(subscription)
+        return subscription
 
-        # Timeout mechanism.
-        numTries = 0
-        while (packet == None):
-            print('Timed out. Trying again.')
-            self.sendCommand(neb.Subsys_MotionEngine, streamingType, True)
-            packet = self.waitForAck(neb.Subsys_MotionEngine, streamingType)
-            numTries += 1
-            if numTries > 5:
-                print('Tried {0} times and it doesn\'t respond. Exiting.'.format(numTries))
-                exit()
-        numTries = 0
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscriptions[subscription.streamingType]
+        subscriptions.remove(subscription)
+        if not subscriptions:
+            del self.subscriptions[subscription.streamingType]
 
-        # Stream forever if the number of packets is unspecified (None)
-        keepStreaming = (numPackets == None or numPackets > 0)
-        while(keepStreaming):
-            try:
-                packet = self.receivePacket()
-                if(packet.header.subSystem == neb.Subsys_MotionEngine and \
-                    packet.header.command == streamingType):
-                    print(packet.data)
-                elif(packet.header.subSystem!=neb.Subsys_Debug):
+    def stopStreaming(self):
+        """ Makes runStreams() return. Can be called from a consumer or
+            from another thread.
+        """
+        self.streaming = False
+
+    def runStreams(self, numPackets=None, duration=None):
+        """ Enables every subscribed stream and hands their packets to the
+            consumers until numPackets stream packets were received,
+            duration seconds passed, stopStreaming() was called or Ctrl-C.
+            The pending batches are then delivered and the streams are
+            disabled. Returns the number of stream packets received.
+            Raises NebTimeoutError when a stream sent at a fixed rate
+            stops, as set by the retry policy.
+        """
+        streamingTypes = list(self.subscriptions)
+        streamKeys = dict((neb.headerKey(neb.PacketType_RegularResponse,\
+            neb.Subsys_MotionEngine, streamingType), streamingType) for streamingType in streamingTypes)
+        rateStreams = [streamingType for streamingType in streamingTypes if streamingType not in EventStreams]
+        timeouts = list(self.retryPolicy.timeouts())
+        numTries = 0
+        numReceived = 0
+        def onPacket(packet, now):
+            streamingType = streamKeys.get(neb.packetKey(packet.packetString))
+            if streamingType is None:
+                if(packet.header.subSystem!=neb.Subsys_Debug):
                     print('Unexpected packet: {0}'.format(packet))
-                if(numPackets != None):
-                    numPackets -= 1
-                keepStreaming = (numPackets == None or numPackets > 0)
-            except NotImplementedError as nie:
-                print(nie)
-            # In the event of Ctrl-C
-            except KeyboardInterrupt as ki:
-                # self.sendCommand(neb.Subsys_MotionEngine, streamingType, False)
-                break
-                # return
-            except neb.CRCError as crce:
-                print('CRCError')
-                print(crce)
-            except TimeoutError as te:
-                if (streamingType!=neb.MotCmd_RotationInfo and streamingType!=neb.MotCmd_Pedometer and streamingType!=neb.MotCmd_FingerGesture and streamingType!=neb.MotCmd_TrajectoryInfo):
-                    print('Timed out, sending command again.')
-                    numTries += 1
-                    self.sendCommand(neb.Subsys_MotionEngine, streamingType, True)
-                    if numTries > 3:
-                        print('Tried {0} times and it doesn\'t respond. Exiting.'.format(numTries))
-                        exit()
-            except Exception as e:
+                return False
+            for subscription in self.subscriptions.get(streamingType, ()):
+                subscription.add(packet, now)
+            return True
+        # Streams already enabled send packets while the next ones are acked
+        def onEarlyPacket(packetString):
+            nonlocal numReceived
+            try:
+                packet = neb.NebLazyResponsePacket(packetString)
+            except (neb.CRCError, neb.InvalidPacketFormatError) as e:
                 print(e)
-        # Stop whatever it was streaming
-        self.sendCommand(neb.Subsys_MotionEngine, streamingType, False)
+                return
+            if onPacket(packet, time.monotonic()):
+                numReceived += 1
+        self.streaming = True
+        try:
+            for streamingType in streamingTypes:
+                self.commandWithRetry(neb.Subsys_MotionEngine, streamingType, True, rejected=onEarlyPacket)
+            now = time.monotonic()
+            stopTime = None if duration is None else now + duration
+            # Timeout mechanism, only for the streams sent at a fixed rate
+            retryDeadline = now + timeouts[0] if rateStreams else None
+            while self.streaming and (numPackets is None or numReceived < numPackets):
+                deadlines = [subscription.flushTime for subscriptions in self.subscriptions.values()\
+                    for subscription in subscriptions if subscription.flushTime is not None]
+                deadlines += [deadline for deadline in (retryDeadline, stopTime) if deadline is not None]
+                try:
+                    packet = self.receivePacket(min(deadlines) if deadlines else None)
+                    now = time.monotonic()
+                    if onPacket(packet, now):
+                        numReceived += 1
+                        numTries = 0
+                        if retryDeadline is not None:
+                            retryDeadline = now + timeouts[0]
+                except (neb.CRCError, neb.InvalidPacketFormatError) as e:
+                    print(e)
+                    continue
+                except TimeoutError as te:
+                    now = time.monotonic()
+                # Batches whose time window is over
+                for subscriptions in self.subscriptions.values():
+                    for subscription in subscriptions:
+                        if subscription.flushTime is not None and now >= subscription.flushTime:
+                            subscription.flush()
+                if stopTime is not None and now >= stopTime:
+                    break
+                if retryDeadline is not None and now >= retryDeadline:
+                    numTries += 1
+                    if numTries >= len(timeouts):
+                        raise neb.NebTimeoutError(neb.PacketType_RegularResponse,\
+                            neb.Subsys_MotionEngine, rateStreams[0], timeouts[-1], numTries)
+                    print('Timed out, sending command again.')
+                    for streamingType in rateStreams:
+                        self.sendCommand(neb.Subsys_MotionEngine, streamingType, True)
+                    retryDeadline = now + timeouts[numTries]
+        # In the event of Ctrl-C
+        except KeyboardInterrupt as ki:
+            pass
+        finally:
+            self.streaming = False
+            for subscriptions in self.subscriptions.values():
+                for subscription in subscriptions:
+                    subscription.flush()
+            # Stop whatever it was streaming
+            for streamingType in streamingTypes:
+                self.sendCommand(neb.Subsys_MotionEngine, streamingType, False)
+        return numReceived
+
+    def iterStream(self, streamingType, batch=None, numPackets=None,\
+        bufferSize=nebreader.PacketQueueSize, overflow=StreamOverflow_DropOldest):
+        """ Generator over the packets of a motion engine stream, one at a
+            time or in lists of batch packets (the last one may be
+            shorter). The stream is enabled on the first next() and
+            disabled when the generator is closed or numPackets were
+            yielded. Packets are buffered by the background reader, which
+            is started for the iteration if it was not running, with
+            bufferSize packets per queue. When the consumer falls behind,
+            the buffer keeps the newest packets, or the generator raises
+            StreamOverflowError (overflow=StreamOverflow_Raise).
+        """
+        ownReader = self.reader is None
+        reader = self.startReader(bufferSize)
+        streamKey = neb.headerKey(neb.PacketType_RegularResponse, neb.Subsys_MotionEngine, streamingType)
+        eventStream = streamingType in EventStreams
+        timeouts = list(self.retryPolicy.timeouts())
+        numTries = 0
+        packets = []
+        try:
+            self.commandWithRetry(neb.Subsys_MotionEngine, streamingType, True)
+            droppedPackets = reader.dropped.get(streamKey, 0)
+            while numPackets is None or numPackets > 0:
+                try:
+                    deadline = None if eventStream else self.deadline(timeouts[numTries])
+                    packet = self.receiveQueued((streamKey,), deadline)
+                except TimeoutError as te:
+                    if not eventStream:
+                        numTries += 1
+                        if numTries >= len(timeouts):
+                            raise neb.NebTimeoutError(neb.PacketType_RegularResponse,\
+                                neb.Subsys_MotionEngine, streamingType, timeouts[-1], numTries)
+                        self.sendCommand(neb.Subsys_MotionEngine, streamingType, True)
+                    continue
+                numTries = 0
+                if overflow == StreamOverflow_Raise and reader.dropped.get(streamKey, 0) != droppedPackets:
+                    raise neb.StreamOverflowError(streamingType,\
+                        reader.dropped[streamKey] - droppedPackets)
+                if numPackets is not None:
+                    numPackets -= 1
+                if batch is None:
+                    yield packet
+                    continue
+                packets.append(packet)
+                if len(packets) == batch:
+                    yield packets
+                    packets = []
+            if packets:
+                yield packets
+        finally:
+            self.sendCommand(neb.Subsys_MotionEngine, streamingType, False)
+            if ownReader:
+                self.stopReader()
+
+    def motionStream(self, streamingType, numPackets=None, consumer=None, batchSize=None, interval=None):
+        """ Streams one stream type to a consumer, see subscribe() and
+            runStreams(). Without a consumer the packets are only counted.
+        """
+        if consumer is None:
+            consumer = lambda packets: None
+        subscription = self.subscribe(streamingType, consumer, batchSize, interval)
+        try:
+            return self.runStreams(numPackets)
+        finally:
+            self.unsubscribe(subscription)
 
     def motionSetDownsample(self, factor):
         self.sendCommand(neb.Subsys_MotionEngine,\
@@ -206,16 +694,130 @@ class NeblinaComm(object):
         self.waitForAck(neb.Subsys_MotionEngine,\
             neb.MotCmd_ResetTimeStamp)
 
-    def EEPROMRead(self, readPageNumber):
+    def getDeviceID(self):
+        if self.deviceID is None:
+            self.debugFWVersions()
+        return self.deviceID
+
+    def EEPROMCache(self):
+        """ Write-through page cache of the board, shared by the
+            connections to the same device ID. Asking the device ID the
+            first time costs a debugFWVersions() round trip, which can
+            time out as well.
+        """
+        return EEPROMCaches.setdefault(self.getDeviceID(), {})
+
+    def EEPROMRead(self, readPageNumber, refresh=False):
+        """ Page of the EEPROM, from the cache unless refresh is set. The
+            first EEPROM access of a connection asks the device ID, see
+            EEPROMCache(). Answers for other pages (left over by an earlier
+            read that timed out) are skipped. Raises EEPROMPageError when
+            the board answers with an error or does not answer.
+        """
+        cache = self.EEPROMCache()
+        if not refresh and readPageNumber in cache:
+            return cache[readPageNumber]
+        cache.pop(readPageNumber, None)
         self.sendCommand(neb.Subsys_EEPROM, neb.EEPROMCmd_Read, pageNumber=readPageNumber)
-        packet = self.waitForAck(neb.Subsys_EEPROM, neb.EEPROMCmd_Read)
-        packet = self.waitForPacket(neb.PacketType_RegularResponse, neb.Subsys_EEPROM, neb.EEPROMCmd_Read)
+        try:
+            packet = self.waitForAck(neb.Subsys_EEPROM, neb.EEPROMCmd_Read)
+            while packet.header.packetType != neb.PacketType_ErrorLogResp:
+                packet = self.waitForPacket(neb.PacketType_RegularResponse, neb.Subsys_EEPROM, neb.EEPROMCmd_Read)
+                if packet.header.packetType == neb.PacketType_RegularResponse and \
+                    packet.data.pageNumber == readPageNumber:
+                    break
+        except neb.NebTimeoutError:
+            raise neb.EEPROMPageError(neb.EEPROMCmd_Read, [], [readPageNumber]) from None
+        if packet.header.packetType == neb.PacketType_ErrorLogResp:
+            raise neb.EEPROMPageError(neb.EEPROMCmd_Read, [readPageNumber], [])
+        cache[readPageNumber] = packet.data.dataBytes
         return packet.data.dataBytes
 
     def EEPROMWrite(self, writePageNumber, dataString):
+        """ Writes a page of the EEPROM, through the cache. The first
+            EEPROM access of a connection asks the device ID, see
+            EEPROMCache().
+        """
+        cache = self.EEPROMCache()
         self.sendCommand(neb.Subsys_EEPROM, neb.EEPROMCmd_Write,\
             pageNumber=writePageNumber, dataBytes=dataString)
         packet = self.waitForAck(neb.Subsys_EEPROM, neb.EEPROMCmd_Write)
+        if packet.header.packetType == neb.PacketType_Ack:
+            # The board pads the page to 8 bytes
+            cache[writePageNumber] = bytes(dataString).ljust(EEPROMPageSize, b'\x00')
+        else:
+            cache.pop(writePageNumber, None)
+
+    def EEPROMReadAll(self, refresh=False):
+        """ Image of the whole EEPROM (EEPROMNumPages pages). Pages that
+            are not cached are read by pipelined batches of
+            EEPROMPipelineDepth pages. An answer for another page than the
+            one asked is not cached, that page is read again. Raises
+            EEPROMPageError with the pages that could not be read.
+        """
+        cache = self.EEPROMCache()
+        pageNumbers = [pageNumber for pageNumber in range(EEPROMNumPages)\
+            if refresh or pageNumber not in cache]
+        for pageNumber in pageNumbers:
+            cache.pop(pageNumber, None)
+        packets = self.sendCommandBatches([(neb.Subsys_EEPROM, neb.EEPROMCmd_Read, True,\
+            {'pageNumber':pageNumber}) for pageNumber in pageNumbers], EEPROMPipelineDepth,\
+            (neb.PacketType_Ack, neb.PacketType_RegularResponse),\
+            lambda index, packet: packet.data.pageNumber == pageNumbers[index])
+        errorPages = []
+        timedOutPages = []
+        for pageNumber, packet in zip(pageNumbers, packets):
+            if packet is None:
+                timedOutPages.append(pageNumber)
+            elif packet.header.packetType == neb.PacketType_ErrorLogResp:
+                errorPages.append(pageNumber)
+            else:
+                cache[pageNumber] = packet.data.dataBytes
+        if errorPages or timedOutPages:
+            raise neb.EEPROMPageError(neb.EEPROMCmd_Read, errorPages, timedOutPages)
+        return b''.join(cache[pageNumber] for pageNumber in range(EEPROMNumPages))
+
+    def EEPROMWriteAll(self, image, current=None):
+        """ Writes an EEPROM image back, only the pages that differ from
+            current, by pipelined batches. current is the image on the
+            board: when not given, it is read with EEPROMReadAll(), which
+            asks the device ID and reads the pages that are not cached.
+            Returns the numbers of the pages written. Raises
+            EEPROMPageError with the pages that could not be written.
+        """
+        imageLength = EEPROMNumPages*EEPROMPageSize
+        for data in (image, current):
+            if data is not None and len(data) != imageLength:
+                raise ValueError('An EEPROM image is {0} bytes, not {1}'\
+                    .format(imageLength, len(data)))
+        if current is None:
+            current = self.EEPROMReadAll()
+        cache = self.EEPROMCache()
+        pageNumbers = [pageNumber for pageNumber in range(EEPROMNumPages)\
+            if image[pageNumber*EEPROMPageSize:(pageNumber+1)*EEPROMPageSize] != \
+            current[pageNumber*EEPROMPageSize:(pageNumber+1)*EEPROMPageSize]]
+        pages = [bytes(image[pageNumber*EEPROMPageSize:(pageNumber+1)*EEPROMPageSize])\
+            for pageNumber in pageNumbers]
+        packets = self.sendCommandBatches([(neb.Subsys_EEPROM, neb.EEPROMCmd_Write, True,\
+            {'pageNumber':pageNumber, 'dataBytes':page}) for pageNumber, page in zip(pageNumbers, pages)],\
+            EEPROMPipelineDepth)
+        writtenPages = []
+        errorPages = []
+        timedOutPages = []
+        for pageNumber, page, packet in zip(pageNumbers, pages, packets):
+            if packet is not None and packet.header.packetType == neb.PacketType_Ack:
+                cache[pageNumber] = page
+                writtenPages.append(pageNumber)
+                continue
+            # Unknown content, read again next time
+            cache.pop(pageNumber, None)
+            if packet is None:
+                timedOutPages.append(pageNumber)
+            else:
+                errorPages.append(pageNumber)
+        if errorPages or timedOutPages:
+            raise neb.EEPROMPageError(neb.EEPROMCmd_Write, errorPages, timedOutPages, writtenPages)
+        return writtenPages
 
     def getBatteryLevel(self):
         self.sendCommand(neb.Subsys_PowerManagement,\
@@ -242,6 +844,7 @@ class NeblinaComm(object):
         return packet.data.temperature
 
     def flashErase(self):
+        self.invalidateCatalog()
         # Step 1 - Initialization
         self.sendCommand(neb.Subsys_MotionEngine,neb.MotCmd_IMU_Data, True)
         self.sendCommand(neb.Subsys_MotionEngine,neb.MotCmd_DisableStreaming, True)
@@ -261,9 +864,13 @@ class NeblinaComm(object):
 
         # Step 5 - wait for the completion notice
         self.waitForPacket(neb.PacketType_RegularResponse,\
-            neb.Subsys_Storage, neb.StorageCmd_EraseAll)
+            neb.Subsys_Storage, neb.StorageCmd_EraseAll, timeout=FlashEraseTimeout)
 
-    def flashRecord(self, numSamples, dataType):
+    def flashRecordStart(self, dataType):
+        """ Opens a flash session and enables the stream to record.
+            Returns the session ID.
+        """
+        self.invalidateCatalog()
 
         # Step 1 - Initialization
         self.sendCommand(neb.Subsys_MotionEngine,neb.MotCmd_DisableStreaming, True)
@@ -290,13 +897,9 @@ class NeblinaComm(object):
         # Step 6 - wait for ack
         self.waitForAck(neb.Subsys_MotionEngine,dataType)
         print('Acknowledge packet was received!')
-        
-        # Step 7 Receive Packets        
-        for x in range(1, numSamples+1):
-            packet = self.waitForPacket(neb.PacketType_RegularResponse, neb.Subsys_MotionEngine, dataType)
-            print('Recording %d packets, current packet: %d\r' % (numSamples, x), end="", flush=True)
-        print('\n')
+        return sessionID
 
+    def flashRecordStop(self, dataType, sessionID):
         # Step 8 - Stop the streaming
         self.sendCommand(neb.Subsys_MotionEngine, dataType, False)
         print('Sending the stop streaming command, and waiting for a response...')
@@ -315,7 +918,99 @@ class NeblinaComm(object):
             neb.Subsys_Storage, neb.StorageCmd_Record)
         print('The acknowledge packet is received, and session %d is closed successfully' % sessionID)
 
-    def flashPlayback(self, pbSessionID, destinationFileName=None):
+    def flashRecord(self, numSamples, dataType):
+        sessionID = self.flashRecordStart(dataType)
+
+        # Step 7 Receive Packets
+        for x in range(1, numSamples+1):
+            packet = self.waitForPacket(neb.PacketType_RegularResponse, neb.Subsys_MotionEngine, dataType)
+            if x % PlaybackProgressPackets == 0:
+                print('Recording %d packets, current packet: %d\r' % (numSamples, x), end="", flush=True)
+        print('\n')
+
+        self.flashRecordStop(dataType, sessionID)
+        return sessionID
+
+    def latestStreamPacket(self, dataType, timeout=None):
+        """ Next packet of a stream, what was received before is dropped """
+        self.discardInput()
+        return self.waitForPacket(neb.PacketType_RegularResponse,\
+            neb.Subsys_MotionEngine, dataType, timeout=timeout)
+
+    def flashRecordFor(self, dataType, duration=None, timestampSpan=None,\
+        monitor=None, monitorInterval=1.0):
+        """ Records a session for duration seconds (host time), or until
+            the timestamps of the recorded stream span timestampSpan
+            seconds. The host does not read the stream meanwhile, it only
+            takes its newest packet now and then: every monitorInterval
+            seconds to hand it to monitor, and to check the timestamp span.
+            The recording is stopped on errors and Ctrl-C as well.
+            Returns the session ID.
+        """
+        if (duration is None) == (timestampSpan is None):
+            raise ValueError('Either a duration or a timestamp span is needed')
+        sessionID = self.flashRecordStart(dataType)
+        try:
+            if duration is not None:
+                stopTime = time.monotonic() + duration
+            else:
+                startTimestamp = self.waitForPacket(neb.PacketType_RegularResponse,\
+                    neb.Subsys_MotionEngine, dataType).data.timestamp
+                stopTime = time.monotonic() + timestampSpan
+            nextMonitor = None if monitor is None else time.monotonic() + monitorInterval
+            while True:
+                now = time.monotonic()
+                wakeTime = stopTime if nextMonitor is None else min(stopTime, nextMonitor)
+                if wakeTime > now:
+                    time.sleep(wakeTime - now)
+                packet = None
+                if nextMonitor is not None and time.monotonic() >= nextMonitor:
+                    nextMonitor += monitorInterval
+                    try:
+                        packet = self.latestStreamPacket(dataType)
+                    except neb.NebTimeoutError as te:
+                        print(te)
+                    else:
+                        monitor(packet)
+                if duration is not None:
+                    if time.monotonic() >= stopTime:
+                        break
+                    continue
+                if packet is None:
+                    if time.monotonic() < stopTime:
+                        continue
+                    packet = self.latestStreamPacket(dataType)
+                span = ((packet.data.timestamp - startTimestamp) % nebclock.TimestampWrap)\
+                    *nebclock.TimestampPeriod
+                if span >= timestampSpan:
+                    break
+                # Board time runs at about the host speed
+                stopTime = time.monotonic() + timestampSpan - span
+        except BaseException:
+            # The error that ended the recording is the one raised
+            try:
+                self.flashRecordStop(dataType, sessionID)
+            except Exception as e:
+                print('Could not stop recording session {0}: {1}'.format(sessionID, e))
+            raise
+        self.flashRecordStop(dataType, sessionID)
+        return sessionID
+
+    def flashPlayback(self, pbSessionID, destinationFileName=None, progress=None):
+        """ Plays a session back. Its packets are written to the binary file
+            destinationFileName as they arrive, raw packets laid end to end
+            (see nebstore.readPacketFile() and nebarray.loadPacketFile()).
+            progress, if given, is called with the number of packets
+            received and the number of packets in the session (None when
+            flashGetSessionInfo() does not know the session). Returns the
+            number of packets played back.
+        """
+        totalPackets = None
+        if progress is not None:
+            # Only sizes the progress, the board answers the playback itself
+            info = self.flashGetSessionInfo(pbSessionID)
+            if info is not None:
+                totalPackets = info[1] // FlashPacketSize
         self.sendCommand(neb.Subsys_Storage, neb.StorageCmd_Playback, True, sessionID=pbSessionID)
         print('Sent the start playback command, waiting for response...')
         #wait for confirmation
@@ -327,14 +1022,15 @@ class NeblinaComm(object):
         else:
             pbSessionID = packet.data.sessionID
             print('Playback routine started from session number %d' % pbSessionID);
-            packetList = self.storePacketsUntil(neb.PacketType_RegularResponse, neb.Subsys_Storage, neb.StorageCmd_Playback)
-            print('Finished playback from session number %d!' % pbSessionID)
             if(destinationFileName != None):
-                thefile = open(destinationFileName, 'w')
-                for item in packetList:
-                    thefile.write("%s\n" % item.stringEncode())
-                thefile.close()
-            return len(packetList)
+                with open(destinationFileName, 'wb', PlaybackBufferSize) as thefile:
+                    numPackets = self.writePacketsUntil(thefile, neb.PacketType_RegularResponse,\
+                        neb.Subsys_Storage, neb.StorageCmd_Playback, progress, totalPackets)
+            else:
+                numPackets = self.writePacketsUntil(None, neb.PacketType_RegularResponse,\
+                    neb.Subsys_Storage, neb.StorageCmd_Playback, progress, totalPackets)
+            print('Finished playback from session number %d!' % pbSessionID)
+            return numPackets
 
     def flashGetSessions(self):
         self.sendCommand(neb.Subsys_Storage, neb.StorageCmd_NumSessions)
@@ -351,6 +1047,58 @@ class NeblinaComm(object):
         else:
             return (packet.data.sessionID, packet.data.sessionLength)
 
+    def flashGetCatalog(self, refresh=False):
+        """ (sessionID, sessionLength) of every session on the flash.
+            The device ID and the number of sessions are asked together,
+            then the info of the sessions by pipelined batches of
+            CatalogPipelineDepth sessions.
+            Catalogs are cached by device ID, see invalidateCatalog().
+        """
+        answerTypes = (neb.PacketType_RegularResponse,)
+        if self.deviceID is None:
+            versionPacket, sessionsPacket = self.sendCommands([\
+                (neb.Subsys_Debug, neb.DebugCmd_FWVersions),\
+                (neb.Subsys_Storage, neb.StorageCmd_NumSessions)], answerTypes)
+            if versionPacket is None:
+                raise neb.NebTimeoutError(neb.PacketType_RegularResponse,\
+                    neb.Subsys_Debug, neb.DebugCmd_FWVersions, self.retryPolicy.timeout)
+            self.deviceID = versionPacket.data.deviceID
+        else:
+            sessionsPacket = None
+        catalog = SessionCatalogs.get(self.deviceID)
+        if catalog is not None and not refresh:
+            return catalog
+        if sessionsPacket is None:
+            sessionsPacket, = self.sendCommands([(neb.Subsys_Storage, neb.StorageCmd_NumSessions)], answerTypes)
+        if sessionsPacket is None:
+            raise neb.NebTimeoutError(neb.PacketType_RegularResponse,\
+                neb.Subsys_Storage, neb.StorageCmd_NumSessions, self.retryPolicy.timeout)
+        # Sessions are numbered from 0, an answer for another session than
+        # the one asked is a stale one and the session is asked again
+        infoPackets = self.sendCommandBatches([(neb.Subsys_Storage, neb.StorageCmd_SessionInfo,\
+            True, {'sessionID':sessionID}) for sessionID in range(sessionsPacket.data.numSessions)],\
+            CatalogPipelineDepth, answerTypes, lambda sessionID, packet: packet.data.sessionID == sessionID)
+        catalog = []
+        for sessionID, packet in enumerate(infoPackets):
+            if packet is None:
+                raise neb.NebTimeoutError(neb.PacketType_RegularResponse,\
+                    neb.Subsys_Storage, neb.StorageCmd_SessionInfo, self.retryPolicy.timeout)
+            if packet.header.packetType == neb.PacketType_ErrorLogResp or \
+                packet.data.sessionLength == 0xFFFFFFFF:
+                continue
+            catalog.append((packet.data.sessionID, packet.data.sessionLength))
+        SessionCatalogs[self.deviceID] = catalog
+        return catalog
+
+    def invalidateCatalog(self):
+        """ Drops the cached session catalog of the board (of all boards
+            if its device ID was never asked).
+        """
+        if self.deviceID is None:
+            SessionCatalogs.clear()
+        else:
+            SessionCatalogs.pop(self.deviceID, None)
+
     def getLEDs(self, ledIndicesList):
         if type(ledIndicesList) != list:
             print("Use this function with a list of leds you want to know the value as an argument.")
@@ -380,6 +1128,7 @@ class NeblinaComm(object):
         self.sendCommand(neb.Subsys_Debug, neb.DebugCmd_FWVersions)
         versionPacket = self.waitForPacket(neb.PacketType_RegularResponse, 
             neb.Subsys_Debug, neb.DebugCmd_FWVersions)
+        self.deviceID = versionPacket.data.deviceID
         return (versionPacket.data.apiRelease,
                 versionPacket.data.mcuFWVersion,
                 versionPacket.data.bleFWVersion,
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# Neblina bulk packet routines based on NumPy
+# (C) 2015 Motsai Research Inc.
+
+import numpy as np
+import neblina as neb
+import neblinacrc as nebcrc
+import neblinaslip as nebslip
+
+# Header (4 bytes) + Data (16 bytes)
+PacketSize          =   20
+
+# Number of packets processed at once so that the working set stays in cache
+BatchRows           =   1 << 16
+
+CRCTableArray = np.frombuffer(nebcrc.CRCTable, dtype=np.uint8)
+
+def toPacketArray(packets, packetSize=PacketSize):
+    """ Returns the packets as a (N, packetSize) uint8 array.
+        Accepts an existing array, a contiguous bytes-like buffer of
+        packets laid end to end, or a list of decoded packet strings.
+        Row i is packet i: a packet string that is not packetSize bytes
+        long raises ValueError rather than shifting the rows.
+    """
+    if isinstance(packets, np.ndarray):
+        packetArray = packets.astype(np.uint8, copy=False)
+        if packetArray.ndim == 1:
+            packetArray = packetArray.reshape(-1, packetSize)
+    elif isinstance(packets, (bytes, bytearray, memoryview)):
+        packetArray = np.frombuffer(packets, dtype=np.uint8).reshape(-1, packetSize)
+    else:
+        packets = list(packets)
+        for index, packet in enumerate(packets):
+            if len(packet) != packetSize:
+                raise ValueError('Packet {0} is {1} bytes long, not {2}'\
+                    .format(index, len(packet), packetSize))
+        buffer = b''.join(packets)
+        packetArray = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, packetSize)
+    if packetArray.ndim != 2 or packetArray.shape[1] <= nebcrc.CRCPosition:
+        raise ValueError('Expected a (N, {0}) packet array but got {1}'\
+            .format(packetSize, packetArray.shape))
+    return packetArray
+
+def computeCRCs(packets):
+    """ Computes the Neblina CRC of every row of a (N, 20) packet array.
+        The CRC is updated column by column for all rows at once, using
+        the same 256-entry table as neblinacrc.
+    """
+    packetArray = toPacketArray(packets)
+    numPackets, packetSize = packetArray.shape
+    crcs = np.empty(numPackets, dtype=np.uint8)
+    for start in range(0, numPackets, BatchRows):
+        # Column-major copy of the batch so that each column is contiguous
+        columns = np.ascontiguousarray(packetArray[start:start+BatchRows].T)
+        crc = np.zeros(columns.shape[1], dtype=np.uint8)
+        index = np.empty_like(crc)
+        for col in range(packetSize):
+            if col == nebcrc.CRCPosition:
+                np.bitwise_xor(crc, nebcrc.CRCPlaceholder, out=index)
+            else:
+                np.bitwise_xor(crc, columns[col], out=index)
+            np.take(CRCTableArray, index, out=crc)
+        crcs[start:start+BatchRows] = crc
+    return crcs
+
+def validateCRCs(packets):
+    """ Returns a boolean mask that is True for every packet whose
+        CRC byte matches its content.
+    """
+    packetArray = toPacketArray(packets)
+    return computeCRCs(packetArray) == packetArray[:, nebcrc.CRCPosition]
+
+# Structured dtypes of complete streamed packets (header + data).
+# Each one mirrors the matching Neblina_*_fmt layout in neblina.py so that
+# a buffer of packets maps onto a record array without any unpacking.
+HeaderFields = [
+    ('ctrlByte',            'u1'),
+    ('length',              'u1'),
+    ('crc',                 'u1'),
+    ('command',             'u1'),
+]
+
+# Neblina_IMU_fmt = "<I 3h 3h"
+IMUDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('accel',               '<i2', (3,)),
+    ('gyro',                '<i2', (3,)),
+])
+
+# Neblina_MAG_fmt = "<I 3h 3h"
+MAGDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('mag',                 '<i2', (3,)),
+    ('accel',               '<i2', (3,)),
+])
+
+# Neblina_Euler_fmt = "<I 4h 4s", angles x10
+EulerAngleDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('yaw',                 '<i2'),
+    ('pitch',               '<i2'),
+    ('roll',                '<i2'),
+    ('demoHeading',         '<i2'),
+    ('garbage',             'V4'),
+])
+
+# Neblina_Quat_t_fmt = "<I 4h 4s"
+QuaternionDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('quaternions',         '<i2', (4,)),
+    ('garbage',             'V4'),
+])
+
+# Neblina_Pedometer_fmt = "<I H B h 7s", walking direction x10
+PedometerDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('stepCount',           '<u2'),
+    ('stepsPerMinute',      'u1'),
+    ('walkingDirection',    '<i2'),
+    ('garbage',             'V7'),
+])
+
+# Neblina_ExternalForce_fmt = "<I 3h 6s"
+ExternalForceDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('externalForces',      '<i2', (3,)),
+    ('garbage',             'V6'),
+])
+
+# Neblina_TrajectoryDistance_fmt = "<I 3h H B 3s"
+TrajectoryDistanceDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('eulerAngleErrors',    '<i2', (3,)),
+    ('count',               '<u2'),
+    ('progress',            'u1'),
+    ('garbage',             'V3'),
+])
+
+# Neblina_MotionState_fmt = "<I B 11s", startStop is 0 when starting
+MotionStateDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('startStop',           'u1'),
+    ('garbage',             'V11'),
+])
+
+# Neblina_FingerGesture_fmt = "<I B 11s"
+FingerGestureDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('gesture',             'u1'),
+    ('garbage',             'V11'),
+])
+
+# Neblina_RotationInfo_fmt = "<I I H 6s", rpm x10
+RotationDtype = np.dtype(HeaderFields + [
+    ('timestamp',           '<u4'),
+    ('rotationCount',       '<u4'),
+    ('rpm',                 '<u2'),
+    ('garbage',             'V6'),
+])
+
+# Record dtype and packed data format of each motion engine stream
+StreamDtypes = {
+    neb.MotCmd_MotionState      :   (MotionStateDtype,          neb.Neblina_MotionState_fmt),
+    neb.MotCmd_IMU_Data         :   (IMUDtype,                  neb.Neblina_IMU_fmt),
+    neb.MotCmd_Quaternion       :   (QuaternionDtype,           neb.Neblina_Quat_t_fmt),
+    neb.MotCmd_EulerAngle       :   (EulerAngleDtype,           neb.Neblina_Euler_fmt),
+    neb.MotCmd_ExtForce         :   (ExternalForceDtype,        neb.Neblina_ExternalForce_fmt),
+    neb.MotCmd_TrajectoryInfo   :   (TrajectoryDistanceDtype,   neb.Neblina_TrajectoryDistance_fmt),
+    neb.MotCmd_Pedometer        :   (PedometerDtype,            neb.Neblina_Pedometer_fmt),
+    neb.MotCmd_MAG_Data         :   (MAGDtype,                  neb.Neblina_MAG_fmt),
+    neb.MotCmd_FingerGesture    :   (FingerGestureDtype,        neb.Neblina_FingerGesture_fmt),
+    neb.MotCmd_RotationInfo     :   (RotationDtype,             neb.Neblina_RotationInfo_fmt),
+}
+
+def streamMask(packets, command, subSystem=neb.Subsys_MotionEngine,\
+    packetType=neb.PacketType_RegularResponse):
+    """ Boolean mask of the packets of a (N, 20) array belonging to a stream """
+    packetArray = toPacketArray(packets)
+    ctrlByte = subSystem | (packetType << neb.PacketType_BitPosition)
+    return (packetArray[:, 0] == ctrlByte) & (packetArray[:, 3] == command)
+
+def decodeStream(packets, command):
+    """ Decodes packets of a single stream type into a record array.
+        packets is a contiguous buffer of 20-byte packets (or a packet
+        array), which is viewed through the stream dtype with a single
+        np.frombuffer call, so the records share memory with the buffer.
+        Fixed point fields are left as stored, see scaleStream().
+    """
+    dtype = StreamDtypes[command][0]
+    if isinstance(packets, np.ndarray):
+        packets = np.ascontiguousarray(packets, dtype=np.uint8)
+    elif not isinstance(packets, (bytes, bytearray, memoryview)):
+        packets = toPacketArray(packets)
+    return np.frombuffer(packets, dtype=dtype)
+
+def scaleStream(records, command):
+    """ Returns a copy of the records with the fixed point fields
+        converted to floats, as done by the matching data classes.
+    """
+    scales = neb.StreamScales.get(command, {})
+    scaledDtype = np.dtype([(name, 'f8' if name in scales else records.dtype.fields[name][0])\
+        for name in records.dtype.names])
+    scaled = np.empty(records.shape, dtype=scaledDtype)
+    for name in records.dtype.names:
+        if name in scales:
+            scaled[name] = records[name] / scales[name]
+        else:
+            scaled[name] = records[name]
+    return scaled
+
+def createStreamPackets(command, timestamps, **fields):
+    """ Builds the complete packets (header, data and CRC) of a stream
+        type as a record array, from arrays of timestamps and field values
+        (e.g. accel and gyro of shape (N, 3) for IMU data). Fields missing
+        are left as zeros. Fixed point fields are given as decoded (e.g.
+        yaw in degrees) and rounded to the nearest fixed point step, so
+        that decoded records encode back to the same packets.
+    """
+    dtype = StreamDtypes[command][0]
+    timestamps = np.asarray(timestamps)
+    records = np.zeros(timestamps.shape[0], dtype=dtype)
+    records['ctrlByte'] = neb.Subsys_MotionEngine
+    records['length'] = PacketSize - neb.Neblina_PacketHeader_struct.size
+    records['command'] = command
+    records['timestamp'] = timestamps
+    scales = neb.StreamScales.get(command, {})
+    for name, values in fields.items():
+        if name in scales:
+            values = np.rint(np.asarray(values, dtype=np.float64)*scales[name])
+        records[name] = values
+    records['crc'] = computeCRCs(packetView(records))
+    return records
+
+def packetView(records):
+    """ (N, 20) uint8 view of a stream record array """
+    return records.view(np.uint8).reshape(-1, PacketSize)
+
+SlipEndByte = nebslip.SLIP_END[0]
+SlipEscByte = nebslip.SLIP_ESC[0]
+SlipEscEndByte = nebslip.SLIP_ESC_END[1]
+SlipEscEscByte = nebslip.SLIP_ESC_ESC[1]
+
+def slipEncodeBatch(packetArray):
+    """ SLIP encodes every row of a packet array, END terminated """
+    numPackets, packetSize = packetArray.shape
+    framed = np.empty((numPackets, packetSize+1), dtype=np.uint8)
+    framed[:, :packetSize] = packetArray
+    framed[:, packetSize] = SlipEndByte
+    flat = framed.reshape(-1)
+    isEnd = flat == SlipEndByte
+    isEnd[packetSize::packetSize+1] = False
+    isEsc = flat == SlipEscByte
+    special = isEnd | isEsc
+    numSpecial = np.count_nonzero(special)
+    if numSpecial == 0:
+        return flat.tobytes()
+    # Each escaped byte shifts the rest of the stream by one
+    positions = np.arange(flat.size) + np.cumsum(special) - special
+    encoded = np.empty(flat.size + numSpecial, dtype=np.uint8)
+    encoded[positions] = flat
+    encoded[positions[special]] = SlipEscByte
+    encoded[positions[isEnd]+1] = SlipEscEndByte
+    encoded[positions[isEsc]+1] = SlipEscEscByte
+    return encoded.tobytes()
+
+def iterSlipStream(packets):
+    """ Yields the SLIP encoded stream of packets, BatchRows packets at a time """
+    packetArray = packetView(packets) if isinstance(packets, np.ndarray) \
+        and packets.dtype.names else toPacketArray(packets)
+    for start in range(0, packetArray.shape[0], BatchRows):
+        yield slipEncodeBatch(packetArray[start:start+BatchRows])
+
+def encodeSlipStream(packets):
+    """ SLIP encoded bytes of packets (record or packet array) """
+    return b''.join(iterSlipStream(packets))
+
+def writeSlipStream(stream, packets):
+    """ Writes the SLIP encoded packets to a binary stream batch by batch.
+        Returns the number of bytes written.
+    """
+    numBytes = 0
+    for chunk in iterSlipStream(packets):
+        stream.write(chunk)
+        numBytes += len(chunk)
+    return numBytes
+
+def loadPacketFile(fileName, packetSize=PacketSize):
+    """ Loads a file of raw packets laid end to end (see
+        NeblinaComm.flashPlayback()) as a (N, packetSize) packet array,
+        ready for streamMask() and decodeStream().
+    """
+    return toPacketArray(np.fromfile(fileName, dtype=np.uint8), packetSize)
+
+def columnArrays(streamColumns):
+    """ Zero-copy NumPy views of the columns of a neblinastore.StreamColumns,
+        by column name. The views must be released before the columns grow.
+    """
+    return dict((name, np.frombuffer(column, dtype=np.dtype(column.typecode)))\
+        for name, column in zip(streamColumns.names, streamColumns.columns))
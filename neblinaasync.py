@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# Neblina asyncio communication
+# (C) 2015 Motsai Research Inc.
+
+import os
+import asyncio
+import neblina as neb
+import neblinaslip as nebslip
+import neblinastore as nebstore
+from neblinaAPI import commandFrame
+from neblinareader import PacketQueueSize, PacketRouter
+
+class AsyncNeblinaComm(PacketRouter):
+    """ asyncio counterpart of neblinaAPI.NeblinaComm.
+        The file descriptor of the port is set non-blocking and read by
+        the event loop (add_reader), so one loop can serve many boards
+        without a thread each. POSIX only (the port must have fileno()).
+
+        Packets are routed like in neblinareader.NeblinaReader (see
+        PacketRouter), all on the event loop. Streams are async
+        iterators. Answers that do not come in time raise
+        neb.NebTimeoutError, as in NeblinaComm.
+    """
+    def __init__(self, serialcom, queueSize=PacketQueueSize):
+        PacketRouter.__init__(self, queueSize)
+        self.sc = serialcom
+        self.fd = serialcom.fileno()
+        self.timeout = getattr(serialcom, 'timeout', None)
+        self.decoder = nebslip.SlipDecoder(validate=True, checkCRC=False)
+        self.commandFrames = nebslip.FrameCache()
+        self.loop = None
+        # Set when the port hung up or failed, see fail()
+        self.error = None
+        self.badPackets = 0
+
+    def open(self):
+        self.loop = asyncio.get_running_loop()
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self.onReadable)
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop = None
+            os.set_blocking(self.fd, True)
+        self.cancelWaiters()
+
+    def fail(self, error):
+        """ Stops reading the port and hands error to every waiter """
+        self.error = error
+        if self.loop is not None:
+            self.loop.remove_reader(self.fd)
+        self.failWaiters(error)
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        self.close()
+
+    def onReadable(self):
+        try:
+            data = os.read(self.fd, nebslip.ReadChunkSize)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.fail(ConnectionError('Reading the port failed: {0}'.format(e)))
+            return
+        if not data:
+            self.fail(ConnectionError('The port was closed'))
+            return
+        frames = self.decoder.frames
+        self.decoder.feed(data)
+        while frames:
+            self.dispatch(frames.popleft())
+
+    def dispatch(self, packetString):
+        try:
+            packet = neb.NebLazyResponsePacket(packetString)
+        except (neb.CRCError, neb.InvalidPacketFormatError):
+            self.badPackets += 1
+            return
+        self.route(neb.packetKey(packetString), packet)
+
+    def expect(self, keys):
+        """ Future completed with the next packet matching one of the
+            header keys (any packet if keys is None).
+        """
+        if self.error is not None:
+            raise self.error
+        future = self.loop.create_future()
+        self.addWaiter(future, keys)
+        future.add_done_callback(self.discardWaiter)
+        return future
+
+    async def waitFor(self, future, timeout, packetType, subSystem, command):
+        """ Result of a future, NebTimeoutError if it does not come in time """
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise neb.NebTimeoutError(packetType, subSystem, command, timeout) from None
+
+    async def get(self, keys=None, timeout=None, expectedKey=None):
+        """ Next packet matching one of the header keys, queued or not.
+            A timeout raises NebTimeoutError, naming expectedKey (by
+            default the first of keys). Raises ConnectionError once the
+            port hung up and the queues are empty.
+        """
+        packet = self.takeQueued(keys)
+        if packet is not None:
+            return packet
+        if expectedKey is None and keys:
+            expectedKey = keys[0]
+        packetType, subSystem, command = (None, None, None) if expectedKey is None \
+            else neb.splitHeaderKey(expectedKey)
+        return await self.waitFor(self.expect(keys), timeout, packetType, subSystem, command)
+
+    def sendCommand(self, subsystem, command, enable=True, **kwargs):
+        frame = commandFrame(self.commandFrames, subsystem, command, enable, **kwargs)
+        self.sc.write(frame)
+
+    async def command(self, subsystem, command, enable=True,\
+        packetTypes=(neb.PacketType_Ack,), **kwargs):
+        """ Sends a command and waits for its answers, one packet of each
+            of packetTypes. Error log responses complete them as well.
+            Returns the last answer.
+        """
+        errorKey = neb.headerKey(neb.PacketType_ErrorLogResp, subsystem, command)
+        futures = [self.expect((neb.headerKey(packetType, subsystem, command), errorKey))\
+            for packetType in packetTypes]
+        self.sendCommand(subsystem, command, enable, **kwargs)
+        packet = None
+        try:
+            for packetType, future in zip(packetTypes, futures):
+                packet = await self.waitFor(future, self.timeout, packetType, subsystem, command)
+                if packet.header.packetType == neb.PacketType_ErrorLogResp:
+                    break
+        finally:
+            # Answers that will not come must not take later packets
+            for future in futures:
+                future.cancel()
+        return packet
+
+    async def waitForPacket(self, packetType, subSystem, command):
+        return await self.get((neb.headerKey(packetType, subSystem, command),\
+            neb.headerKey(neb.PacketType_ErrorLogResp, subSystem, command)), self.timeout)
+
+    # Motine Engine commands
+    async def motionStream(self, streamingType, numPackets=None):
+        """ Async iterator over the packets of a stream. Streaming is
+            stopped when the iteration ends or the iterator is closed.
+        """
+        streamKey = (neb.headerKey(neb.PacketType_RegularResponse,\
+            neb.Subsys_MotionEngine, streamingType),)
+        await self.command(neb.Subsys_MotionEngine, streamingType, True)
+        try:
+            while numPackets == None or numPackets > 0:
+                yield await self.get(streamKey, self.timeout)
+                if numPackets != None:
+                    numPackets -= 1
+        finally:
+            await self.command(neb.Subsys_MotionEngine, streamingType, False)
+
+    async def motionSetDownsample(self, factor):
+        await self.command(neb.Subsys_MotionEngine, neb.MotCmd_Downsample, factor)
+
+    async def motionSetAccFullScale(self, factor):
+        await self.command(neb.Subsys_MotionEngine, neb.MotCmd_AccRange, factor)
+
+    async def motionStopStreams(self):
+        await self.command(neb.Subsys_MotionEngine, neb.MotCmd_DisableStreaming, True)
+
+    async def motionResetTimestamp(self):
+        await self.command(neb.Subsys_MotionEngine, neb.MotCmd_ResetTimeStamp, True)
+
+    async def EEPROMRead(self, readPageNumber):
+        packet = await self.command(neb.Subsys_EEPROM, neb.EEPROMCmd_Read,\
+            packetTypes=(neb.PacketType_Ack, neb.PacketType_RegularResponse),\
+            pageNumber=readPageNumber)
+        return packet.data.dataBytes
+
+    async def EEPROMWrite(self, writePageNumber, dataString):
+        await self.command(neb.Subsys_EEPROM, neb.EEPROMCmd_Write,\
+            pageNumber=writePageNumber, dataBytes=dataString)
+
+    async def getBatteryLevel(self):
+        packet = await self.command(neb.Subsys_PowerManagement, neb.PowCmd_GetBatteryLevel,\
+            packetTypes=(neb.PacketType_Ack, neb.PacketType_RegularResponse))
+        return packet.data.batteryLevel
+
+    async def getTemperature(self):
+        packet = await self.command(neb.Subsys_PowerManagement, neb.PowCmd_GetTemperature,\
+            packetTypes=(neb.PacketType_Ack, neb.PacketType_RegularResponse))
+        return packet.data.temperature
+
+    async def flashGetSessions(self):
+        packet = await self.command(neb.Subsys_Storage, neb.StorageCmd_NumSessions,\
+            packetTypes=(neb.PacketType_RegularResponse,))
+        return packet.data.numSessions
+
+    async def flashGetSessionInfo(self, sessionID):
+        packet = await self.command(neb.Subsys_Storage, neb.StorageCmd_SessionInfo,\
+            packetTypes=(neb.PacketType_RegularResponse,), sessionID=sessionID)
+        if(packet.data.sessionLength == 0xFFFFFFFF):
+            return None
+        else:
+            return (packet.data.sessionID, packet.data.sessionLength)
+
+    async def flashPlayback(self, pbSessionID):
+        """ Plays a session back into a StreamStore. Returns None if the
+            session does not exist.
+        """
+        packet = await self.command(neb.Subsys_Storage, neb.StorageCmd_Playback, True,\
+            packetTypes=(neb.PacketType_RegularResponse,), sessionID=pbSessionID)
+        if(packet.header.packetType==neb.PacketType_ErrorLogResp):
+            return None
+        store = nebstore.StreamStore()
+        untilKey = neb.headerKey(neb.PacketType_RegularResponse,\
+            neb.Subsys_Storage, neb.StorageCmd_Playback)
+        while True:
+            packet = await self.get(None, self.timeout, untilKey)
+            if neb.packetKey(packet.packetString) == untilKey:
+                return store
+            if packet.header.subSystem != neb.Subsys_Debug:
+                store.append(packet.packetString)
+
+    async def getLEDs(self, ledIndicesList):
+        packet = await self.command(neb.Subsys_LED, neb.LEDCmd_GetVal,\
+            packetTypes=(neb.PacketType_RegularResponse,), ledIndices=ledIndicesList)
+        return packet.data.ledTupleList
+
+    def setLEDs(self, ledValues):
+        self.sendCommand(neb.Subsys_LED, neb.LEDCmd_SetVal, ledValueTupleList=ledValues)
+
+    async def debugFWVersions(self):
+        packet = await self.command(neb.Subsys_Debug, neb.DebugCmd_FWVersions,\
+            packetTypes=(neb.PacketType_RegularResponse,))
+        return (packet.data.apiRelease,
+                packet.data.mcuFWVersion,
+                packet.data.bleFWVersion,
+                packet.data.deviceID)
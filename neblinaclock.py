@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# Neblina multi-board clock synchronization
+# (C) 2015 Motsai Research Inc.
+
+import time
+from collections import deque
+import neblina as neb
+import neblinastore as nebstore
+
+# Length (seconds of board time) of the windows over which the smallest
+# host/board time difference is kept, and number of windows in the fit
+ClockWindowLength   =   1.0
+ClockNumWindows     =   60
+
+# Board timestamps are 32-bit microsecond counters
+TimestampWrap       =   1 << 32
+TimestampPeriod     =   1e-6
+
+class BoardClock(object):
+    """ Maps the timestamps of a board to host time (time.monotonic).
+        A board timestamp t is taken at host time offset + (1+drift)*t.
+        Each streamed packet gives an upper bound of that time: the host
+        time at which it was read, which adds the transport latency. The
+        smallest host/board difference of each window is kept and a line
+        is fitted through those lower envelope points, which gives the
+        offset and the drift.
+    """
+    def __init__(self, zeroTime=None, windowLength=ClockWindowLength, numWindows=ClockNumWindows):
+        self.windowLength = windowLength
+        self.windows = deque(maxlen=numWindows)
+        self.window = None
+        self.lastTimestamp = None
+        self.numWraps = 0
+        # Until packets come in, the host time of the timestamp reset
+        self.offset = zeroTime
+        self.drift = 0.0
+
+    def boardTime(self, timestamp):
+        """ Board time in seconds, with the counter wraparounds added """
+        numWraps = self.numWraps
+        if self.lastTimestamp is not None and \
+            self.lastTimestamp - timestamp > TimestampWrap//2:
+            numWraps += 1
+        return (timestamp + numWraps*TimestampWrap)*TimestampPeriod
+
+    def addSample(self, timestamp, hostTime):
+        boardTime = self.boardTime(timestamp)
+        if self.lastTimestamp is not None and \
+            self.lastTimestamp - timestamp > TimestampWrap//2:
+            self.numWraps += 1
+        self.lastTimestamp = timestamp
+        difference = hostTime - boardTime
+        window = self.window
+        if window is None or boardTime - window[0] >= self.windowLength:
+            if window is not None:
+                self.windows.append((window[1], window[2]))
+            self.window = [boardTime, boardTime, difference]
+            self.fit()
+        elif difference < window[2]:
+            window[1] = boardTime
+            window[2] = difference
+            self.fit()
+
+    def fit(self):
+        points = list(self.windows)
+        points.append((self.window[1], self.window[2]))
+        numPoints = len(points)
+        meanTime = sum(point[0] for point in points)/numPoints
+        meanDifference = sum(point[1] for point in points)/numPoints
+        variance = sum((point[0] - meanTime)**2 for point in points)
+        if numPoints < 2 or variance == 0.0:
+            self.offset = meanDifference
+            self.drift = 0.0
+            return
+        self.drift = sum((point[0] - meanTime)*(point[1] - meanDifference)\
+            for point in points)/variance
+        self.offset = meanDifference - self.drift*meanTime
+
+    def hostTime(self, timestamp):
+        boardTime = self.boardTime(timestamp)
+        return self.offset + (1.0 + self.drift)*boardTime
+
+class ClockSync(object):
+    """ Puts the boards of a NeblinaHub on a common host timeline.
+        resetTimestamps() sends MotCmd_ResetTimeStamp to all the boards
+        back to back and takes the midpoint between sending and the ack
+        as the host time of each reset. update() then refines the offset
+        and drift of each board with the timestamps of streamed packets.
+    """
+    def __init__(self, hub, windowLength=ClockWindowLength, numWindows=ClockNumWindows):
+        self.hub = hub
+        self.windowLength = windowLength
+        self.numWindows = numWindows
+        self.clocks = {}
+        self.sendTimes = {}
+        self.ackTimes = {}
+
+    def resetTimestamps(self, timeout=1.0):
+        """ Returns the IDs of the boards that acknowledged the reset.
+            Other packets read meanwhile go to the hub onPacket callback.
+        """
+        hub = self.hub
+        ackKey = neb.headerKey(neb.PacketType_Ack, neb.Subsys_MotionEngine, neb.MotCmd_ResetTimeStamp)
+        self.ackTimes = {}
+        self.sendTimes = hub.sendCommand(neb.Subsys_MotionEngine, neb.MotCmd_ResetTimeStamp)
+        deadline = time.monotonic() + timeout
+        while len(self.ackTimes) < len(self.sendTimes):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for deviceID, packet in hub.readReady(remaining):
+                if neb.packetKey(packet.packetString) == ackKey and deviceID not in self.ackTimes:
+                    self.ackTimes[deviceID] = hub.devices[deviceID].readTime
+                elif hub.onPacket is not None:
+                    hub.onPacket(deviceID, packet)
+        for deviceID, ackTime in self.ackTimes.items():
+            sendTime = self.sendTimes[deviceID]
+            self.clocks[deviceID] = BoardClock(sendTime + (ackTime - sendTime)/2,\
+                self.windowLength, self.numWindows)
+        return list(self.ackTimes)
+
+    def update(self, deviceID, packet):
+        """ Feeds a packet received through the hub. Only streamed motion
+            engine packets are used (timestamp in the first 4 data bytes).
+        """
+        packetString = packet.packetString
+        clock = self.clocks.get(deviceID)
+        if clock is None or packetString[0] != neb.Subsys_MotionEngine or \
+            packetString[3] not in nebstore.StreamColumnFormats:
+            return
+        timestamp = int.from_bytes(packetString[4:8], 'little')
+        clock.addSample(timestamp, self.hub.devices[deviceID].readTime)
+
+    def hostTime(self, deviceID, timestamp):
+        """ Host time (time.monotonic) of a board timestamp """
+        return self.clocks[deviceID].hostTime(timestamp)
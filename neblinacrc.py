@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Neblina CRC routines
+# (C) 2015 Motsai Research Inc.
+
+# Position of the CRC byte within a Neblina packet header.
+# The CRC is computed over the whole packet with this byte taken as 0xFF.
+CRCPosition     =   2
+CRCPlaceholder  =   0xFF
+
+def _crc8Step(crc):
+    ee = crc
+    ff = (ee) ^ (ee>>4) ^ (ee>>7)
+    return ((ff<<1)%256) ^ ((ff<<4) % 256)
+
+# The shift/XOR step only depends on (crc ^ byte), so the whole update
+# folds into a single 256-entry lookup: crc = CRCTable[crc ^ byte]
+CRCTable = bytes(_crc8Step(ii) for ii in range(256))
+
+def _byteView(data):
+    view = memoryview(data)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+def crc8(data, crc=0):
+    """ Plain CRC-8 of a bytes-like object.
+        An intermediate CRC can be passed in to continue a computation.
+    """
+    table = CRCTable
+    for byte in _byteView(data):
+        crc = table[crc ^ byte]
+    return crc
+
+def nebCRC8(packet):
+    """ CRC of a complete Neblina packet.
+        The CRC byte of the header is treated as 0xFF. The packet is
+        neither copied nor modified so bytes, bytearray and memoryview
+        objects can be passed in directly.
+    """
+    view = _byteView(packet)
+    if len(view) <= CRCPosition:
+        return crc8(view)
+    table = CRCTable
+    crc = table[table[table[view[0]] ^ view[1]] ^ CRCPlaceholder]
+    for byte in view[CRCPosition+1:]:
+        crc = table[crc ^ byte]
+    return crc
+
+class NebCRC8(object):
+    """ Incremental Neblina packet CRC.
+        Packet bytes are fed in order through update(), in as many pieces
+        as needed (e.g. header then data). The byte landing on the CRC
+        position of the packet is treated as 0xFF.
+    """
+    def __init__(self, data=None):
+        self.crc = 0
+        self.position = 0
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        view = _byteView(data)
+        length = len(view)
+        crc = self.crc
+        offset = CRCPosition - self.position
+        if 0 <= offset < length:
+            crc = crc8(view[:offset], crc)
+            crc = CRCTable[crc ^ CRCPlaceholder]
+            view = view[offset+1:]
+        self.crc = crc8(view, crc)
+        self.position += length
+        return self
+
+    def copy(self):
+        other = NebCRC8()
+        other.crc = self.crc
+        other.position = self.position
+        return other
+
+    def digest(self):
+        return self.crc
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# Neblina multi-board hub
+# (C) 2015 Motsai Research Inc.
+
+import os
+import time
+import selectors
+import neblina as neb
+import neblinaslip as nebslip
+from neblinaAPI import commandFrame
+
+class HubDevice(object):
+    """docstring for HubDevice
+        State of one board of a NeblinaHub.
+    """
+    __slots__ = ('deviceID', 'sc', 'fd', 'decoder', 'numPackets', 'badPackets', 'readTime')
+    def __init__(self, deviceID, serialcom):
+        self.deviceID = deviceID
+        self.sc = serialcom
+        self.fd = serialcom.fileno()
+        self.decoder = nebslip.SlipDecoder(validate=True, checkCRC=False)
+        self.numPackets = 0
+        self.badPackets = 0
+        # Host time (time.monotonic) of the last read from the port
+        self.readTime = None
+
+class NeblinaHub(object):
+    """ Serves several boards from a single thread.
+        The ports are set non-blocking and multiplexed with selectors
+        (epoll on Linux). Each port has its own incremental SLIP decoder
+        and packets are delivered as (deviceID, packet) pairs. Commands
+        are either sent to one board or broadcast to all. POSIX only
+        (the ports must have fileno()).
+
+        A board whose port fails or hangs up is removed without stopping
+        the others. Its error is kept in deviceErrors and handed to
+        onDeviceError(deviceID, error) if given.
+    """
+    def __init__(self, onPacket=None, onDeviceError=None):
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+        self.deviceErrors = {}
+        self.onPacket = onPacket
+        self.onDeviceError = onDeviceError
+        self.commandFrames = nebslip.FrameCache()
+
+    def addDevice(self, deviceID, serialcom):
+        device = HubDevice(deviceID, serialcom)
+        os.set_blocking(device.fd, False)
+        self.selector.register(device.fd, selectors.EVENT_READ, device)
+        self.devices[deviceID] = device
+        return device
+
+    def removeDevice(self, deviceID):
+        device = self.devices.pop(deviceID)
+        self.selector.unregister(device.fd)
+        try:
+            os.set_blocking(device.fd, True)
+        except OSError:
+            # The port is already gone
+            pass
+        return device.sc
+
+    def deviceIDs(self):
+        return list(self.devices)
+
+    def close(self):
+        for deviceID in self.deviceIDs():
+            self.removeDevice(deviceID)
+        self.selector.close()
+
+    def readDevice(self, device, packets):
+        try:
+            data = os.read(device.fd, nebslip.ReadChunkSize)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. the board was unplugged
+            self.deviceFailed(device, e)
+            return
+        device.readTime = time.monotonic()
+        if not data:
+            self.deviceFailed(device, ConnectionError('The port was closed'))
+            return
+        frames = device.decoder.frames
+        device.decoder.feed(data)
+        while frames:
+            packetString = frames.popleft()
+            try:
+                packet = neb.NebLazyResponsePacket(packetString)
+            except (neb.CRCError, neb.InvalidPacketFormatError):
+                device.badPackets += 1
+                continue
+            device.numPackets += 1
+            packets.append((device.deviceID, packet))
+
+    def deviceFailed(self, device, error):
+        self.removeDevice(device.deviceID)
+        self.deviceErrors[device.deviceID] = error
+        if self.onDeviceError is not None:
+            self.onDeviceError(device.deviceID, error)
+
+    def readReady(self, timeout=None):
+        packets = []
+        for selectorKey, events in self.selector.select(timeout):
+            self.readDevice(selectorKey.data, packets)
+        return packets
+
+    def poll(self, timeout=None):
+        """ Reads every port with data waiting, waiting up to timeout
+            seconds (forever if None) for one to be ready. Returns the
+            received (deviceID, packet) pairs, or hands them to onPacket.
+        """
+        packets = self.readReady(timeout)
+        if self.onPacket is not None:
+            for deviceID, packet in packets:
+                self.onPacket(deviceID, packet)
+            return []
+        return packets
+
+    def iterPackets(self, timeout=None):
+        """ Yields (deviceID, packet) pairs as they arrive. Stops when no
+            port was ready within timeout seconds.
+        """
+        while self.devices:
+            ready = self.selector.select(timeout)
+            if not ready:
+                return
+            packets = []
+            for selectorKey, events in ready:
+                self.readDevice(selectorKey.data, packets)
+            for packet in packets:
+                yield packet
+
+    def sendCommand(self, subsystem, command, enable=True, deviceIDs=None, **kwargs):
+        """ Sends a command to some boards (deviceIDs) or to all of them.
+            The frame is encoded once for all of them. Returns the host
+            time (time.monotonic) at which each board was sent the command.
+        """
+        frame = commandFrame(self.commandFrames, subsystem, command, enable, **kwargs)
+        if deviceIDs is None:
+            deviceIDs = self.devices
+        sendTimes = {}
+        for deviceID in deviceIDs:
+            self.devices[deviceID].sc.write(frame)
+            sendTimes[deviceID] = time.monotonic()
+        return sendTimes
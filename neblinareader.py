@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# Neblina background packet reader
+# (C) 2015 Motsai Research Inc.
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+import neblina as neb
+
+# Number of packets kept per (packet type, subsystem, command) queue
+PacketQueueSize     =   4096
+
+# How often (seconds) the reader thread checks whether it must stop
+ReaderPollInterval  =   0.1
+
+class PacketRouter(object):
+    """ Routes packets by header key (packet type, subsystem and command).
+        A packet is handed to the oldest future waiting for its key (see
+        addWaiter()), then to the oldest future waiting for any packet.
+        Otherwise it is queued per header key until taken with
+        takeQueued(). Queues are bounded: when one is full its oldest
+        packet is dropped and counted in droppedPackets, and per header
+        key in dropped. Not thread-safe, see NeblinaReader.
+    """
+    def __init__(self, queueSize=PacketQueueSize):
+        self.queueSize = queueSize
+        self.queues = {}
+        self.waiters = {}
+        self.anyWaiters = deque()
+        self.sequence = count()
+        self.numPackets = 0
+        self.droppedPackets = 0
+        self.dropped = {}
+
+    def claim(self, future):
+        """ Whether a future can still be given a result """
+        return not future.done()
+
+    def addWaiter(self, future, keys):
+        """ Registers a future for the header keys (any key if None) """
+        future.keys = None if keys is None else tuple(keys)
+        if future.keys is None:
+            self.anyWaiters.append(future)
+            return
+        for key in future.keys:
+            self.waiters.setdefault(key, deque()).append(future)
+
+    def discardWaiter(self, future):
+        # A future waiting on several keys is removed from all of them,
+        # empty deques with it
+        if future.keys is None:
+            if future in self.anyWaiters:
+                self.anyWaiters.remove(future)
+            return
+        for key in future.keys:
+            futures = self.waiters.get(key)
+            if futures is None:
+                continue
+            if future in futures:
+                futures.remove(future)
+            if not futures:
+                del self.waiters[key]
+
+    def pendingFutures(self):
+        # A future waiting on several keys is in several deques
+        futures = set(self.anyWaiters)
+        for keyFutures in self.waiters.values():
+            futures.update(keyFutures)
+        return futures
+
+    def cancelWaiters(self):
+        futures = self.pendingFutures()
+        self.waiters.clear()
+        self.anyWaiters.clear()
+        for future in futures:
+            future.cancel()
+
+    def failWaiters(self, error):
+        futures = self.pendingFutures()
+        self.waiters.clear()
+        self.anyWaiters.clear()
+        for future in futures:
+            if self.claim(future):
+                future.set_exception(error)
+
+    def route(self, key, packet):
+        """ Hands a packet to its oldest waiter, or queues it. Returns
+            True when the packet was queued.
+        """
+        self.numPackets += 1
+        for futures in (self.waiters.get(key), self.anyWaiters):
+            while futures:
+                future = futures.popleft()
+                self.discardWaiter(future)
+                if self.claim(future):
+                    future.set_result(packet)
+                    return False
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = deque(maxlen=self.queueSize)
+            self.queues[key] = queue
+        elif len(queue) == self.queueSize:
+            self.droppedPackets += 1
+            self.dropped[key] = self.dropped.get(key, 0) + 1
+        queue.append((next(self.sequence), packet))
+        return True
+
+    def oldestQueue(self, keys):
+        queues = self.queues
+        if keys is None:
+            candidates = [queue for queue in queues.values() if queue]
+        else:
+            candidates = [queues[key] for key in keys if queues.get(key)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda queue: queue[0][0])
+
+    def takeQueued(self, keys):
+        """ Oldest queued packet matching one of the header keys (any
+            packet if keys is None), or None
+        """
+        queue = self.oldestQueue(keys)
+        if queue is None:
+            return None
+        return queue.popleft()[1]
+
+    def discardQueued(self, keys=None):
+        for key, queue in self.queues.items():
+            if keys is None or key in keys:
+                queue.clear()
+
+class NeblinaReader(PacketRouter):
+    """ Reads the packets of a board in a background thread.
+        The thread owns the SLIP reader and decodes every frame as it
+        arrives. Packets are routed by header key (see PacketRouter): to
+        the oldest future waiting for them (see expect()), or else to a
+        bounded queue until taken with get(). All the routing is done
+        under self.condition.
+        If reading fails (the port was closed or unplugged), the thread
+        stops, the waiting futures get the exception, and get() and
+        expect() raise it once the queues are empty.
+    """
+    def __init__(self, slipReader, queueSize=PacketQueueSize):
+        PacketRouter.__init__(self, queueSize)
+        self.slipReader = slipReader
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.error = None
+        self.badPackets = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='NeblinaReader')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        # Callers still waiting would never be served
+        with self.condition:
+            self.cancelWaiters()
+            self.condition.notify_all()
+
+    def run(self):
+        while self.running:
+            try:
+                packetString = self.slipReader.receiveFrame(time.monotonic() + ReaderPollInterval)
+            except TimeoutError:
+                continue
+            except Exception as e:
+                self.fail(e)
+                return
+            try:
+                packet = neb.NebLazyResponsePacket(packetString)
+            except (neb.CRCError, neb.InvalidPacketFormatError):
+                self.badPackets += 1
+                continue
+            self.dispatch(neb.packetKey(packetString), packet)
+
+    def fail(self, error):
+        with self.condition:
+            self.error = error
+            self.running = False
+            self.failWaiters(error)
+            self.condition.notify_all()
+
+    def claim(self, future):
+        return future.set_running_or_notify_cancel()
+
+    def dispatch(self, key, packet):
+        with self.condition:
+            if self.route(key, packet):
+                self.condition.notify_all()
+
+    def removeWaiter(self, future):
+        # Done callback: futures cancelled by their caller (e.g. after a
+        # timeout) must not wait for a packet that may never come
+        with self.condition:
+            self.discardWaiter(future)
+
+    def expect(self, keys):
+        """ Future completed with the next packet matching one of the
+            header keys (see neb.headerKey). Register it before sending the
+            command, so the answer cannot be queued in the meantime.
+        """
+        future = Future()
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+            self.addWaiter(future, keys)
+        future.add_done_callback(self.removeWaiter)
+        return future
+
+    def get(self, keys=None, timeout=None):
+        """ Takes the oldest queued packet matching one of the header keys,
+            or any packet when keys is None. Waits up to timeout seconds
+            (forever if None) and returns None when nothing came in.
+        """
+        with self.condition:
+            if self.oldestQueue(keys) is None:
+                self.condition.wait_for(lambda: not self.running or \
+                    self.oldestQueue(keys) is not None, timeout)
+            packet = self.takeQueued(keys)
+            if packet is None and self.error is not None:
+                raise self.error
+            return packet
+
+    def discard(self, keys=None):
+        """ Empties the queues of the header keys, or all of them """
+        with self.condition:
+            self.discardQueued(keys)
+
+    def queued(self, packetType, subSystem, command):
+        """ Number of packets waiting in a queue """
+        with self.condition:
+            queue = self.queues.get(neb.headerKey(packetType, subSystem, command))
+            return len(queue) if queue else 0
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# Neblina SLIP framing
+# (C) 2015 Motsai Research Inc.
+
+import io
+import time
+import select
+from collections import deque, OrderedDict
+import neblinacrc as nebcrc
+
+# SLIP special characters
+SLIP_END        =   b'\xc0'
+SLIP_ESC        =   b'\xdb'
+SLIP_ESC_END    =   b'\xdb\xdc'
+SLIP_ESC_ESC    =   b'\xdb\xdd'
+
+# Size of the buffer used for bulk reads from the serial port
+ReadChunkSize   =   4096
+
+# Number of frames kept by a FrameCache
+FrameCacheSize  =   64
+
+# Neblina frame layout used to validate decoded frames
+HeaderLength        =   4
+LengthPosition      =   1
+MaxFrameLength      =   HeaderLength + 255
+# Worst case where every byte of the largest frame is escaped
+MaxRawFrameLength   =   2*MaxFrameLength
+
+# Reasons for dropping bytes from the stream
+FrameError_BadLength    =   0x00 # decoded length does not match the header
+FrameError_BadEscape    =   0x01 # ESC not followed by ESC_END or ESC_ESC
+FrameError_CRC          =   0x02 # CRC byte does not match the frame content
+FrameError_Overflow     =   0x03 # no END byte where a frame must have ended
+
+FrameErrorStrings = {
+    FrameError_BadLength    :   "Bad Length",
+    FrameError_BadEscape    :   "Bad Escape",
+    FrameError_CRC          :   "CRC Mismatch",
+    FrameError_Overflow     :   "Overflow",
+}
+
+def encode(packet):
+    """ Escapes a packet and terminates it with a SLIP END byte """
+    return bytes(packet).replace(SLIP_ESC, SLIP_ESC_ESC)\
+        .replace(SLIP_END, SLIP_ESC_END) + SLIP_END
+
+def encodeFrame(packet):
+    """ Encodes a packet to be sent. The leading END byte flushes any line
+        noise accumulated by the receiver before the packet.
+    """
+    return SLIP_END + encode(packet)
+
+def decode(frame):
+    """ Unescapes the content of a single frame (without its END byte) """
+    if SLIP_ESC in frame:
+        frame = frame.replace(SLIP_ESC_END, SLIP_END)\
+            .replace(SLIP_ESC_ESC, SLIP_ESC)
+    return bytes(frame)
+
+def decodeFrames(data, validate=False, checkCRC=True):
+    """ Splits a complete SLIP stream (e.g. the content of a capture file)
+        into a list of unescaped frames.
+    """
+    decoder = SlipDecoder(validate, checkCRC)
+    decoder.feed(data)
+    return list(decoder.frames)
+
+class SlipDecoder(object):
+    """ Incremental SLIP decoder.
+        Chunks of raw bytes of any size are passed to feed(). Every frame
+        completed by a chunk is unescaped and queued in self.frames. The
+        trailing incomplete frame is kept until the next chunk.
+
+        With validate set, frames that cannot be Neblina packets are
+        dropped instead of queued and the decoder resynchronizes on the
+        next END byte. Dropped frames and bytes are counted per cause in
+        droppedFrames and droppedBytes. The CRC check can be left out with
+        checkCRC, for callers that only check the CRC of the frames they
+        actually decode.
+    """
+    def __init__(self, validate=False, checkCRC=True):
+        self.validate = validate
+        self.checkCRC = checkCRC
+        self.buffer = bytearray()
+        self.frames = deque()
+        self.synchronized = True
+        self.resetStatistics()
+
+    def resetStatistics(self):
+        self.numFrames = 0
+        self.droppedFrames = dict.fromkeys(FrameErrorStrings, 0)
+        self.droppedBytes = dict.fromkeys(FrameErrorStrings, 0)
+
+    def drop(self, cause, numBytes, numFrames=1):
+        self.droppedFrames[cause] += numFrames
+        self.droppedBytes[cause] += numBytes
+
+    def checkFrame(self, rawFrame):
+        """ Returns the decoded frame, or the FrameError code of a frame
+            that cannot be a valid Neblina packet.
+        """
+        if SLIP_ESC in rawFrame and rawFrame.count(SLIP_ESC) != \
+            rawFrame.count(SLIP_ESC_END) + rawFrame.count(SLIP_ESC_ESC):
+            return FrameError_BadEscape
+        frame = decode(rawFrame)
+        frameLength = len(frame)
+        if frameLength < HeaderLength or \
+            frameLength != HeaderLength + frame[LengthPosition]:
+            return FrameError_BadLength
+        if self.checkCRC and nebcrc.nebCRC8(frame) != frame[nebcrc.CRCPosition]:
+            return FrameError_CRC
+        return frame
+
+    def addFrame(self, rawFrame):
+        if self.validate:
+            frame = self.checkFrame(rawFrame)
+            if type(frame) is int:
+                # Count the END byte along with the frame
+                self.drop(frame, len(rawFrame)+1)
+                return
+        else:
+            frame = decode(rawFrame)
+        self.frames.append(frame)
+        self.numFrames += 1
+
+    def feed(self, data):
+        buffer = self.buffer
+        # END bytes can only be found in the new data
+        searchStart = len(buffer)
+        buffer += data
+        end = buffer.find(SLIP_END, searchStart)
+        if end < 0:
+            # Garbage or a lost END byte, skip everything up to the next END
+            if self.validate and len(buffer) > MaxRawFrameLength:
+                self.drop(FrameError_Overflow, len(buffer), int(self.synchronized))
+                self.synchronized = False
+                del buffer[:]
+            return 0
+        numFrames = self.numFrames
+        start = 0
+        if not self.synchronized:
+            self.drop(FrameError_Overflow, end+1, 0)
+            self.synchronized = True
+            start = end+1
+            end = buffer.find(SLIP_END, start)
+        while end >= 0:
+            # Back-to-back END bytes delimit empty frames, skip them
+            if end > start:
+                self.addFrame(buffer[start:end])
+            start = end+1
+            end = buffer.find(SLIP_END, start)
+        del buffer[:start]
+        return self.numFrames - numFrames
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.frames.clear()
+        self.synchronized = True
+
+class SlipReader(object):
+    """ Reads SLIP frames from a serial port (or any binary stream).
+        Whatever is waiting on the port is read in one call into a
+        preallocated buffer and every complete frame is queued, so most
+        calls to receiveFrame() are served without touching the port.
+    """
+    def __init__(self, stream, chunkSize=ReadChunkSize, validate=True, checkCRC=True):
+        self.stream = stream
+        self.decoder = SlipDecoder(validate, checkCRC)
+        self.chunk = bytearray(chunkSize)
+        self.chunkView = memoryview(self.chunk)
+
+    def bytesWaiting(self):
+        stream = self.stream
+        if hasattr(stream, 'in_waiting'):
+            return stream.in_waiting
+        elif hasattr(stream, 'inWaiting'):
+            return stream.inWaiting()
+        # Regular files: read as much as the buffer can hold
+        return len(self.chunk)
+
+    def fill(self):
+        """ Reads the available bytes into the decoder.
+            Blocks (up to the stream timeout) for at least one byte when
+            nothing is waiting. Returns the number of bytes read.
+        """
+        size = min(max(self.bytesWaiting(), 1), len(self.chunk))
+        view = self.chunkView[:size]
+        numBytes = self.stream.readinto(view)
+        if numBytes:
+            self.decoder.feed(view[:numBytes])
+        return numBytes or 0
+
+    def waitReadable(self, timeout):
+        """ Waits up to timeout seconds for the stream to be readable.
+            Streams without a file descriptor are taken as readable, their
+            reads are then bounded by their own timeout.
+        """
+        stream = self.stream
+        if (hasattr(stream, 'in_waiting') or hasattr(stream, 'inWaiting')) and self.bytesWaiting() > 0:
+            return True
+        try:
+            fd = self.stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return True
+        return bool(select.select([fd], [], [], max(timeout, 0.0))[0])
+
+    def receiveFrame(self, deadline=None):
+        """ Returns the next frame. Without a deadline (time.monotonic),
+            raises TimeoutError as soon as a read of the stream times out.
+            With one, keeps reading until the deadline passes.
+        """
+        frames = self.decoder.frames
+        while not frames:
+            if deadline is None:
+                if self.fill() == 0:
+                    raise TimeoutError('No SLIP frame received before the read timed out')
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.waitReadable(remaining):
+                raise TimeoutError('No SLIP frame received before the deadline')
+            self.fill()
+        return frames.popleft()
+
+    def pendingFrames(self):
+        return len(self.decoder.frames)
+
+    def reset(self):
+        self.decoder.reset()
+
+class FrameCache(object):
+    """ Bounded cache of encoded frames, least recently used first out.
+        get() returns the cached frame of a key, or builds it with the
+        given function and keeps it.
+    """
+    def __init__(self, maxFrames=FrameCacheSize):
+        self.maxFrames = maxFrames
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get(self, key, build):
+        frames = self.frames
+        frame = frames.get(key)
+        if frame is not None:
+            frames.move_to_end(key)
+            self.hits += 1
+            return frame
+        self.misses += 1
+        frame = build()
+        frames[key] = frame
+        if len(frames) > self.maxFrames:
+            frames.popitem(last=False)
+        return frame
+
+    def clear(self):
+        self.frames.clear()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# Neblina columnar packet store
+# (C) 2015 Motsai Research Inc.
+
+import struct
+from array import array
+from bisect import bisect_left
+import neblina as neb
+import neblinacrc as nebcrc
+
+# Column names of each motion engine stream, one per field of its data
+# format in neblina.py (the garbage bytes are not kept)
+StreamColumnNames = {
+    neb.MotCmd_MotionState      :   (neb.Neblina_MotionState_fmt, ['timestamp', 'startStop']),
+    neb.MotCmd_IMU_Data         :   (neb.Neblina_IMU_fmt, ['timestamp',\
+        'accelX', 'accelY', 'accelZ', 'gyroX', 'gyroY', 'gyroZ']),
+    neb.MotCmd_Quaternion       :   (neb.Neblina_Quat_t_fmt, ['timestamp', 'q0', 'q1', 'q2', 'q3']),
+    neb.MotCmd_EulerAngle       :   (neb.Neblina_Euler_fmt, ['timestamp',\
+        'yaw', 'pitch', 'roll', 'demoHeading']),
+    neb.MotCmd_ExtForce         :   (neb.Neblina_ExternalForce_fmt, ['timestamp',\
+        'forceX', 'forceY', 'forceZ']),
+    neb.MotCmd_TrajectoryInfo   :   (neb.Neblina_TrajectoryDistance_fmt, ['timestamp',\
+        'yawError', 'pitchError', 'rollError', 'count', 'progress']),
+    neb.MotCmd_Pedometer        :   (neb.Neblina_Pedometer_fmt, ['timestamp',\
+        'stepCount', 'stepsPerMinute', 'walkingDirection']),
+    neb.MotCmd_MAG_Data         :   (neb.Neblina_MAG_fmt, ['timestamp',\
+        'magX', 'magY', 'magZ', 'accelX', 'accelY', 'accelZ']),
+    neb.MotCmd_FingerGesture    :   (neb.Neblina_FingerGesture_fmt, ['timestamp', 'gesture']),
+    neb.MotCmd_RotationInfo     :   (neb.Neblina_RotationInfo_fmt, ['timestamp', 'rotationCount', 'rpm']),
+}
+
+def columnFormat(dataFormat, names):
+    """ Struct format of the columns of a data format, its garbage ('s')
+        fields skipped as padding, and its (column name, array typecode)
+        pairs. Fixed point fields are stored as sent, see
+        neb.StreamScales.
+    """
+    fields = []
+    typecodes = []
+    for field in dataFormat[1:].split():
+        count = int(field[:-1] or 1)
+        if field[-1] == 's':
+            fields.append('{0}x'.format(count))
+        else:
+            fields.append(field)
+            typecodes += [field[-1]]*count
+    if len(names) != len(typecodes):
+        raise ValueError('{0} column names for the {1} fields of {2}'\
+            .format(len(names), len(typecodes), dataFormat))
+    return dataFormat[0] + ' '.join(fields), list(zip(names, typecodes))
+
+# Struct format and columns of each motion engine stream
+StreamColumnFormats = dict((command, columnFormat(dataFormat, names))\
+    for command, (dataFormat, names) in StreamColumnNames.items())
+
+class StreamColumns(object):
+    """ Fields of one stream type, one growable array per field.
+        column() returns zero-copy memoryviews of the arrays. Python does
+        not allow an array to grow while a view of it is alive, so views
+        must be released before appending more packets.
+    """
+    __slots__ = ('ctrlByte', 'command', 'dataLength', 'struct', 'names', 'columns')
+    def __init__(self, ctrlByte, command, dataLength=16):
+        fmt, fields = StreamColumnFormats[command]
+        self.ctrlByte = ctrlByte
+        self.command = command
+        self.dataLength = dataLength
+        self.struct = struct.Struct(fmt)
+        self.names = [name for name, typecode in fields]
+        self.columns = [array(typecode) for name, typecode in fields]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, packetString, offset=4):
+        values = self.struct.unpack_from(packetString, offset)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def column(self, name, start=0, stop=None):
+        """ Zero-copy view of a column, optionally limited to [start, stop) """
+        return memoryview(self.columns[self.names.index(name)])[start:stop]
+
+    def scaledColumn(self, name, start=0, stop=None):
+        """ Column converted to floats as done by the matching data class """
+        scale = neb.StreamScales.get(self.command, {}).get(name)
+        values = self.column(name, start, stop)
+        if scale is None:
+            return values
+        return array('d', (value/scale for value in values))
+
+    def timeRange(self, startTime, stopTime=None):
+        """ Index range [start, stop) of the samples with startTime <=
+            timestamp < stopTime. Timestamps must be increasing.
+        """
+        timestamps = self.columns[0]
+        start = bisect_left(timestamps, startTime)
+        if stopTime is None:
+            return start, len(timestamps)
+        return start, bisect_left(timestamps, stopTime, start)
+
+    def __getitem__(self, index):
+        """ Views of all columns, by column name, for an index slice """
+        if not isinstance(index, slice):
+            return dict(zip(self.names, (column[index] for column in self.columns)))
+        return dict((name, memoryview(column)[index]) for name, column in zip(self.names, self.columns))
+
+    def timeSlice(self, startTime, stopTime=None):
+        return self[slice(*self.timeRange(startTime, stopTime))]
+
+    def iterPackets(self):
+        """ Rebuilds the packet strings, garbage bytes set to zero and the
+            CRC computed again
+        """
+        header = struct.Struct(neb.Neblina_PacketHeader_fmt)
+        dataPadding = bytes(self.dataLength - self.struct.size)
+        for values in zip(*self.columns):
+            packetString = bytearray(header.pack(self.ctrlByte, self.dataLength, 0, self.command))
+            packetString += self.struct.pack(*values)
+            packetString += dataPadding
+            packetString[nebcrc.CRCPosition] = nebcrc.nebCRC8(packetString)
+            yield bytes(packetString)
+
+class StreamStore(object):
+    """ Columnar store of received response packets.
+        Motion engine stream packets are appended field by field into a
+        StreamColumns per (ctrlByte, command), which costs a few bytes per
+        sample. Any other packet is kept as its raw packet string. The
+        order of arrival is kept as one source index per packet.
+    """
+    def __init__(self):
+        self.streams = {}
+        self.otherPackets = []
+        # StreamColumns in order of creation, and source of every packet:
+        # 0 for otherPackets, i+1 for sources[i]
+        self.sources = []
+        self.sourceIndices = {}
+        self.order = array('H')
+
+    def __len__(self):
+        return len(self.order)
+
+    def append(self, packetString):
+        ctrlByte = packetString[0]
+        command = packetString[3]
+        key = (ctrlByte << 8) | command
+        columns = self.streams.get(key)
+        if columns is None:
+            if ctrlByte != neb.Subsys_MotionEngine or command not in StreamColumnFormats:
+                self.otherPackets.append(bytes(packetString))
+                self.order.append(0)
+                return
+            columns = StreamColumns(ctrlByte, command, packetString[1])
+            self.streams[key] = columns
+            self.sources.append(columns)
+            self.sourceIndices[key] = len(self.sources)
+        columns.append(packetString)
+        self.order.append(self.sourceIndices[key])
+
+    def extend(self, packets):
+        """ Appends decoded packets, so a store can consume a stream """
+        for packet in packets:
+            self.append(packet.packetString)
+
+    def stream(self, command, subSystem=neb.Subsys_MotionEngine,\
+        packetType=neb.PacketType_RegularResponse):
+        """ Columns of a stream type, or None if none was received """
+        return self.streams.get(neb.headerKey(packetType, subSystem, command))
+
+    def iterPackets(self):
+        """ Packet strings of the store, in the order they were appended.
+            Stream packets are rebuilt from their columns (see
+            StreamColumns.iterPackets()): their garbage bytes are zeros.
+        """
+        sources = [iter(self.otherPackets)] + [columns.iterPackets() for columns in self.sources]
+        for index in self.order:
+            yield next(sources[index])
+
+def iterPacketFile(fileName, chunkSize=1 << 16):
+    """ Yields the packet strings of a file of raw packets laid end to end
+        (see NeblinaComm.flashPlayback()). Each packet is delimited by the
+        length in its header.
+    """
+    headerLength = neb.Neblina_PacketHeader_struct.size
+    with open(fileName, 'rb') as packetFile:
+        buffer = b''
+        while True:
+            chunk = packetFile.read(chunkSize)
+            if not chunk:
+                break
+            buffer += chunk
+            offset = 0
+            while len(buffer) - offset >= headerLength:
+                packetLength = headerLength + buffer[offset + 1]
+                if len(buffer) - offset < packetLength:
+                    break
+                yield buffer[offset:offset + packetLength]
+                offset += packetLength
+            buffer = buffer[offset:]
+
+def readPacketFile(fileName, store=None):
+    """ Loads a file of raw packets into a StreamStore """
+    if store is None:
+        store = StreamStore()
+    for packetString in iterPacketFile(fileName):
+        store.append(packetString)
+    return store
@@ -1,6 +1,7 @@
 import unittest
 import neblina as neb
 import neblinaAPI as nebapi
+import neblinaslip as nebslip
 import slip
 import binascii
 import struct
@@ -114,7 +115,7 @@ class ut_IntegrationTests(unittest.TestCase):
         self.comm.debugUnitTestEnable(True)
         for idx,packetBytes in enumerate(testInputVectorPacketList):
             # print('Sending {0} to stream'.format(binascii.hexlify(packetBytes)))
-            self.comm.comslip.sendPacketToStream(self.comm.sc, packetBytes)
+            self.comm.sc.write(nebslip.encodeFrame(packetBytes))
             packet = self.comm.waitForPacket(neb.PacketType_RegularResponse, \
                 neb.Subsys_Debug, neb.DebugCmd_UnitTestMotionData)
             self.assertEqual(testOutputVectorPacketList[idx], packet.stringEncode())
@@ -3,13 +3,132 @@
 # (C) 2015 Motsai Research Inc.
 
 import os
+import io
+import asyncio
+import queue
+import socket
+import threading
+import time
 import unittest
 import slip
 import binascii
 import struct
+from array import array
 import neblina as neb
+import neblinaAPI as nebapi
+import neblinaasync as nebasync
+import neblinareader as nebreader
+import neblinaclock as nebclock
+import neblinahub as nebhub
+import neblinaarray as nebarray
+import neblinacrc as nebcrc
+import neblinaslip as nebslip
+import neblinastore as nebstore
 import neblinasim as nebsim
 
+# Serial port stand-in that answers every command with an ack
+class FakeBoardPort(object):
+    def __init__(self, packetStrings=()):
+        self.timeout = 0.05
+        self.incoming = queue.Queue()
+        self.buffer = bytearray()
+        self.commandDecoder = nebslip.SlipDecoder()
+        self.commands = []
+        # Commands answered with an error log response instead of an ack
+        self.errorCommands = set()
+        # Raised by reads once set, like an unplugged port
+        self.readError = None
+        # Packets sent after the ack of the command enabling a stream, all
+        # at once or streamRate packets per second until it is disabled
+        self.streams = {}
+        self.streamRate = None
+        self.streamStopped = threading.Event()
+        # Packets sent after the ack of a (subsystem, command), or a function
+        # of the command packet returning them
+        self.answers = {}
+        for packetString in packetStrings:
+            self.send(nebslip.encode(packetString))
+
+    def write(self, data):
+        self.commandDecoder.feed(data)
+        while self.commandDecoder.frames:
+            packetString = bytearray(self.commandDecoder.frames.popleft())
+            self.commands.append(bytes(packetString))
+            packetType = neb.PacketType_ErrorLogResp if packetString[3] in self.errorCommands \
+                else neb.PacketType_Ack
+            packetString[0] = (packetString[0] & neb.Subsys_BitMask) | \
+                (packetType << neb.PacketType_BitPosition)
+            packetString[2] = nebcrc.nebCRC8(packetString)
+            self.send(nebslip.encode(packetString))
+            if packetString[3] in self.streams and not packetString[8]:
+                self.streamStopped.set()
+            elif packetString[3] in self.streams and self.streamRate is not None:
+                self.streamStopped.clear()
+                threading.Thread(target=self.sendStream, args=(self.streams[packetString[3]],),\
+                    daemon=True).start()
+            elif packetString[3] in self.streams:
+                self.send(b''.join(nebslip.encode(streamString) \
+                    for streamString in self.streams[packetString[3]]))
+            answerStrings = self.answers.get((packetString[0] & neb.Subsys_BitMask, packetString[3]))
+            if callable(answerStrings):
+                answerStrings = answerStrings(packetString)
+            if answerStrings:
+                self.send(b''.join(nebslip.encode(answerString) for answerString in answerStrings))
+
+    def sendStream(self, streamStrings):
+        for streamString in streamStrings:
+            if self.streamStopped.wait(1.0/self.streamRate):
+                return
+            self.send(nebslip.encode(streamString))
+
+    def send(self, data):
+        self.incoming.put(data)
+
+    def reset_input_buffer(self):
+        del self.buffer[:]
+        try:
+            while True:
+                self.incoming.get_nowait()
+        except queue.Empty:
+            pass
+
+    def readinto(self, view):
+        if self.readError is not None:
+            raise self.readError
+        if not self.buffer:
+            try:
+                self.buffer += self.incoming.get(timeout=self.timeout)
+            except queue.Empty:
+                return 0
+        numBytes = min(len(view), len(self.buffer))
+        view[:numBytes] = self.buffer[:numBytes]
+        del self.buffer[:numBytes]
+        return numBytes
+
+# Same, with a file descriptor the event loop can watch
+class FakeBoardSocket(FakeBoardPort):
+    def __init__(self, packetStrings=()):
+        self.hostSocket, self.boardSocket = socket.socketpair()
+        FakeBoardPort.__init__(self, packetStrings)
+
+    def send(self, data):
+        self.boardSocket.sendall(data)
+
+    def fileno(self):
+        return self.hostSocket.fileno()
+
+    def close(self):
+        self.hostSocket.close()
+        self.boardSocket.close()
+
+def createResponse(subSystem, command, dataString):
+    packetString = bytearray(struct.pack(neb.Neblina_PacketHeader_fmt,\
+        subSystem | (neb.PacketType_RegularResponse << neb.PacketType_BitPosition),\
+        16, 0, command))
+    packetString += dataString.ljust(16, b'\x00')
+    packetString[nebcrc.CRCPosition] = nebcrc.nebCRC8(packetString)
+    return bytes(packetString)
+
 # Unit testing class
 class ut_NeblinaPackets(unittest.TestCase):
     
@@ -510,6 +629,989 @@ class ut_NeblinaPackets(unittest.TestCase):
             self.assertEqual( packets[idx].data.accel[1], packet.data.accel[1] )
             self.assertEqual( packets[idx].data.accel[2], packet.data.accel[2] )
 
+    def testCRC(self):
+        print("\n*** Testing Table-Driven CRC ***")
+        def referenceCRC(packetBytes):
+            packetBytes = bytearray(packetBytes)
+            packetBytes[2] = 255
+            crc = 0
+            for byte in packetBytes:
+                ee = (crc) ^ (byte)
+                ff = (ee) ^ (ee>>4) ^ (ee>>7)
+                crc = ((ff<<1)%256) ^ ((ff<<4) % 256)
+            return crc
+        filepath = os.path.join( os.path.dirname( __file__ ), "SampleData/IMUStream.bin" )
+        packetStrings = self.getTestStream(filepath)
+        packetStrings += [packet.stringEncode() for packet in nebsim.createRandomMAGDataPacketList(50.0, 50, 1.0)]
+        for packetString in packetStrings:
+            expected = referenceCRC(packetString)
+            self.assertEqual(nebcrc.nebCRC8(packetString), expected)
+            self.assertEqual(nebcrc.nebCRC8(memoryview(packetString)), expected)
+            # The input must not be modified
+            packetBytes = bytearray(packetString)
+            self.assertEqual(neb.genNebCRC8(packetBytes), expected)
+            self.assertEqual(packetBytes, bytearray(packetString))
+            # Feeding the header and the data separately gives the same result
+            crc = nebcrc.NebCRC8(packetString[:4])
+            crc.update(packetString[4:])
+            self.assertEqual(crc.digest(), expected)
+            # Split right before the CRC byte as well
+            crc = nebcrc.NebCRC8(packetString[:2]).update(packetString[2:])
+            self.assertEqual(crc.digest(), expected)
+
+    def testBatchCRC(self):
+        print("\n*** Testing Batch CRC Validation ***")
+        packetStrings = []
+        for filename in ["SampleData/EulerAngleStream.bin", "SampleData/IMUStream.bin", "SampleData/MAGStream.bin"]:
+            filepath = os.path.join( os.path.dirname( __file__ ), filename )
+            packetStrings += [packet for packet in self.getTestStream(filepath) if len(packet) == 20]
+        packetArray = nebarray.toPacketArray(packetStrings)
+        self.assertEqual(packetArray.shape, (len(packetStrings), 20))
+        crcs = nebarray.computeCRCs(packetArray)
+        mask = nebarray.validateCRCs(packetArray)
+        for idx,packetString in enumerate(packetStrings):
+            expected = nebcrc.nebCRC8(packetString)
+            self.assertEqual(crcs[idx], expected)
+            self.assertEqual(mask[idx], expected == packetString[2])
+        # The Euler angle capture holds intentional CRC errors
+        self.assertGreater(len(mask) - mask.sum(), 0)
+        # A flat buffer of packets gives the same result
+        self.assertTrue((nebarray.validateCRCs(b''.join(packetStrings)) == mask).all())
+        # Rows must match the list indices, short frames are not skipped
+        with self.assertRaises(ValueError):
+            nebarray.toPacketArray(packetStrings[:3] + [packetStrings[3][:19]] + packetStrings[4:])
+
+    def testSlipDecoder(self):
+        print("\n*** Testing In-Tree SLIP Framing ***")
+        filepath = os.path.join( os.path.dirname( __file__ ), "SampleData/MAGStream.bin" )
+        with open(filepath, "rb") as testFile:
+            streamBytes = testFile.read()
+        expected = nebslip.decodeFrames(streamBytes)
+        packets, errorList = self.buildPacketList(expected)
+        self.assertEqual(len(errorList), 1)
+        self.assertEqual(packets[11].data.mag[0], 1009)
+        self.assertEqual(packets[11].data.accel[2], -15106)
+
+        # Feeding the stream in chunks of any size yields the same frames
+        for chunkSize in [1, 3, 20, 21, 64]:
+            decoder = nebslip.SlipDecoder()
+            for start in range(0, len(streamBytes), chunkSize):
+                decoder.feed(streamBytes[start:start+chunkSize])
+            self.assertEqual(list(decoder.frames), expected)
+
+        # Bulk reads from a stream
+        with open(filepath, "rb") as testFile:
+            reader = nebslip.SlipReader(testFile, chunkSize=50, validate=False)
+            for frame in expected:
+                self.assertEqual(reader.receiveFrame(), frame)
+            self.assertRaises(TimeoutError, reader.receiveFrame)
+
+        # Escaped bytes survive a round trip
+        packets = [b'\xc0\xdb\x01', b'\xdb\xdc', b'\xdb\xdd\xc0', b'\x00'*20]
+        encoded = b''.join(nebslip.encode(packet) for packet in packets)
+        self.assertEqual(nebslip.decodeFrames(encoded), packets)
+
+    def testSlipResync(self):
+        print("\n*** Testing SLIP Resynchronization ***")
+        goodPackets = [packet.stringEncode() for packet in nebsim.createRandomIMUDataPacketList(50.0, 6, 1.0)]
+        goodFrames = [nebslip.encode(packet) for packet in goodPackets]
+        badCRC = bytearray(goodPackets[0])
+        badCRC[2] ^= 0xFF
+        stream = goodFrames[0] + \
+            nebslip.encode(goodPackets[1][:12]) + \
+            goodFrames[1] + \
+            b'\x01\x10\xdb\x01' + nebslip.SLIP_END + \
+            goodFrames[2] + \
+            nebslip.encode(badCRC) + \
+            goodFrames[3] + \
+            b'\x55'*(nebslip.MaxRawFrameLength+10) + nebslip.SLIP_END + \
+            goodFrames[4] + goodFrames[5]
+        decoder = nebslip.SlipDecoder(validate=True)
+        for start in range(0, len(stream), 7):
+            decoder.feed(stream[start:start+7])
+        self.assertEqual(list(decoder.frames), goodPackets)
+        self.assertEqual(decoder.numFrames, 6)
+        self.assertEqual(decoder.droppedFrames[nebslip.FrameError_BadLength], 1)
+        self.assertEqual(decoder.droppedBytes[nebslip.FrameError_BadLength], 13)
+        self.assertEqual(decoder.droppedFrames[nebslip.FrameError_BadEscape], 1)
+        self.assertEqual(decoder.droppedFrames[nebslip.FrameError_CRC], 1)
+        self.assertEqual(decoder.droppedFrames[nebslip.FrameError_Overflow], 1)
+        self.assertEqual(decoder.droppedBytes[nebslip.FrameError_Overflow], nebslip.MaxRawFrameLength+11)
+
+    def testDecodeStreamRecords(self):
+        print("\n*** Testing Record Array Stream Decoding ***")
+        for command,(dtype,dataFormat) in nebarray.StreamDtypes.items():
+            self.assertEqual(dtype.itemsize, 4+struct.calcsize(dataFormat))
+        packetStrings = [packet.stringEncode() for packet in nebsim.createRandomIMUDataPacketList(50.0, 100, 1.0)]
+        records = nebarray.decodeStream(b''.join(packetStrings), neb.MotCmd_IMU_Data)
+        self.assertEqual(len(records), 100)
+        for idx,packetString in enumerate(packetStrings):
+            packet = neb.NebResponsePacket(packetString)
+            self.assertEqual(records['command'][idx], neb.MotCmd_IMU_Data)
+            self.assertEqual(records['timestamp'][idx], packet.data.timestamp)
+            self.assertEqual(list(records['accel'][idx]), list(packet.data.accel))
+            self.assertEqual(list(records['gyro'][idx]), list(packet.data.gyro))
+
+        # Pick the valid Euler angle packets out of a capture
+        filepath = os.path.join( os.path.dirname( __file__ ), "SampleData/EulerAngleStream.bin" )
+        packets, errorList = self.buildPacketListFromSLIP("SampleData/EulerAngleStream.bin")
+        packetArray = nebarray.toPacketArray([packet for packet in self.getTestStream(filepath)\
+            if len(packet) == nebarray.PacketSize])
+        mask = nebarray.validateCRCs(packetArray) & nebarray.streamMask(packetArray, neb.MotCmd_EulerAngle)
+        records = nebarray.scaleStream(nebarray.decodeStream(packetArray[mask], neb.MotCmd_EulerAngle),\
+            neb.MotCmd_EulerAngle)
+        self.assertEqual(len(records), len(packets))
+        for idx,packet in enumerate(packets):
+            self.assertEqual(records['timestamp'][idx], packet.data.timestamp)
+            self.assertEqual(records['yaw'][idx], packet.data.yaw)
+            self.assertEqual(records['pitch'][idx], packet.data.pitch)
+            self.assertEqual(records['roll'][idx], packet.data.roll)
+
+    def testDecodeInPlace(self):
+        print("\n*** Testing In-Place Decoding With Precompiled Structs ***")
+        packetString = nebsim.createRandomIMUDataPacketList(50.0, 1, 1.0)[0].stringEncode()
+        # Data objects can be unpacked straight out of a larger buffer
+        captureBytes = b'\x00'*7 + packetString
+        imuData = neb.IMUData(memoryview(captureBytes), 7+4)
+        packet = neb.NebResponsePacket(bytearray(packetString))
+        self.assertEqual(imuData.timestamp, packet.data.timestamp)
+        self.assertEqual(imuData.accel, packet.data.accel)
+        self.assertEqual(imuData.gyro, packet.data.gyro)
+        self.assertEqual(neb.Neblina_IMU_struct.format, neb.Neblina_IMU_fmt)
+        self.assertEqual(neb.Neblina_PacketHeader_struct.size, 4)
+        # The data must be exactly the size of its format
+        with self.assertRaises(neb.InvalidPacketFormatError):
+            neb.IMUData(packetString + b'\x00', 4)
+        with self.assertRaises(neb.InvalidPacketFormatError):
+            neb.IMUData(packetString[:-1], 4)
+
+    def testLazyResponsePacket(self):
+        print("\n*** Testing Lazy Response Packet Decoding ***")
+        packets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)
+        for packet in packets:
+            packetString = packet.stringEncode()
+            lazyPacket = neb.NebLazyResponsePacket(packetString)
+            self.assertEqual(lazyPacket.header.subSystem, neb.Subsys_MotionEngine)
+            self.assertEqual(lazyPacket.header.command, neb.MotCmd_EulerAngle)
+            self.assertIsNone(lazyPacket.decodedData)
+            self.assertEqual(lazyPacket.data.timestamp, packet.data.timestamp)
+            self.assertEqual(lazyPacket.data.yaw, packet.data.yaw)
+            self.assertIs(lazyPacket.data, lazyPacket.decodedData)
+            self.assertEqual(lazyPacket.stringEncode(), packetString)
+        badCRC = bytearray(packets[0].stringEncode())
+        badCRC[2] ^= 0x01
+        self.assertRaises(neb.CRCError, neb.NebLazyResponsePacket, bytes(badCRC))
+
+    def testResponseDispatch(self):
+        print("\n*** Testing Response Dispatch Table ***")
+        for subSystem, constructors in neb.ResponsePacketDataConstructors.items():
+            for command, dataConstructor in constructors.items():
+                for packetType in (neb.PacketType_RegularResponse, neb.PacketType_Ack):
+                    ctrlByte = subSystem | (packetType << neb.PacketType_BitPosition)
+                    self.assertEqual(neb.lookupResponse(ctrlByte, command), \
+                        (packetType, subSystem, dataConstructor))
+
+        # Unknown subsystem/command combinations keep their raw data
+        packetString = bytearray(b'\x00\x10\x00\xEE' + bytes(range(16)))
+        packetString[2] = nebcrc.nebCRC8(packetString)
+        packet = neb.NebResponsePacket(bytes(packetString))
+        self.assertIsInstance(packet.data, neb.UnknownData)
+        self.assertEqual(packet.data.dataBytes, bytes(range(16)))
+        self.assertEqual(packet.stringEncode(), bytes(packetString))
+        self.assertIn('Unknown Command', str(packet.header))
+        lazyPacket = neb.NebLazyResponsePacket(bytes(packetString))
+        self.assertIsInstance(lazyPacket.data, neb.UnknownData)
+
+        # Command packets are still rejected
+        commandString = bytearray(packetString)
+        commandString[0] = neb.Subsys_MotionEngine | (neb.PacketType_Command << neb.PacketType_BitPosition)
+        self.assertRaises(neb.InvalidPacketFormatError, neb.NebResponsePacket, bytes(commandString))
+
+    def testWaitForPacketFiltering(self):
+        print("\n*** Testing Header Filtering of Received Packets ***")
+        streamPackets = nebsim.createRandomIMUDataPacketList(50.0, 100)
+        ackString = bytearray(struct.pack(neb.Neblina_PacketHeader_fmt, \
+            neb.Subsys_Storage | (neb.PacketType_Ack << neb.PacketType_BitPosition), \
+            16, 0, neb.StorageCmd_EraseAll)) + bytearray(16)
+        ackString[2] = nebcrc.nebCRC8(ackString)
+
+        # Streamed packets with a broken CRC must not get in the way
+        badStreamString = bytearray(streamPackets[0].stringEncode())
+        badStreamString[2] ^= 0x01
+        packetStrings = [bytes(badStreamString)] + \
+            [packet.stringEncode() for packet in streamPackets] + [bytes(ackString)]
+        stream = b''.join(nebslip.encode(packetString) for packetString in packetStrings)
+
+        comm = nebapi.NeblinaComm(io.BytesIO(stream))
+        rejectedList = []
+        packet = comm.waitForAck(neb.Subsys_Storage, neb.StorageCmd_EraseAll, rejectedList.append)
+        self.assertEqual(packet.header.packetType, neb.PacketType_Ack)
+        self.assertEqual(packet.header.subSystem, neb.Subsys_Storage)
+        self.assertEqual(packet.header.command, neb.StorageCmd_EraseAll)
+        self.assertEqual(rejectedList, packetStrings[:-1])
+
+        # Predicates see the raw packet bytes
+        comm = nebapi.NeblinaComm(io.BytesIO(stream))
+        packet = comm.receivePacketMatching(lambda packetString: packetString[2] != badStreamString[2])
+        self.assertEqual(packet.data.timestamp, streamPackets[0].data.timestamp)
+        self.assertRaises(neb.NebTimeoutError, comm.waitForPacket, neb.PacketType_RegularResponse, \
+            neb.Subsys_Debug, neb.DebugCmd_SetInterface, timeout=0.05)
+
+    def testBatchStreamEncoding(self):
+        print("\n*** Testing Batch Encoding of Stream Packets ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 500)
+        # Make sure escaped bytes are part of the stream
+        imuPackets.append(neb.NebResponsePacket.createIMUResponsePacket(0xC0DBC0DB, [-64, 219, 192], [-9280, 0, -9536]))
+        timestamps = [packet.data.timestamp for packet in imuPackets]
+        accel = [list(packet.data.accel) for packet in imuPackets]
+        gyro = [list(packet.data.gyro) for packet in imuPackets]
+        records = nebarray.createStreamPackets(neb.MotCmd_IMU_Data, timestamps, accel=accel, gyro=gyro)
+        packetStrings = [packet.stringEncode() for packet in imuPackets]
+        self.assertEqual(nebarray.packetView(records).tobytes(), b''.join(packetStrings))
+        expected = b''.join(nebslip.encode(packetString) for packetString in packetStrings)
+        self.assertEqual(nebarray.encodeSlipStream(records), expected)
+        self.assertEqual(nebslip.decodeFrames(expected, True), packetStrings)
+
+        eulerPackets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)
+        records = nebarray.createStreamPackets(neb.MotCmd_EulerAngle, \
+            [packet.data.timestamp for packet in eulerPackets], \
+            yaw=[packet.data.yaw for packet in eulerPackets], \
+            pitch=[packet.data.pitch for packet in eulerPackets], \
+            roll=[packet.data.roll for packet in eulerPackets], \
+            demoHeading=[packet.data.demoHeading for packet in eulerPackets])
+        stream = io.BytesIO()
+        numBytes = nebarray.writeSlipStream(stream, records)
+        expected = b''.join(nebslip.encode(packet.stringEncode()) for packet in eulerPackets)
+        self.assertEqual(numBytes, len(expected))
+        self.assertEqual(stream.getvalue(), expected)
+
+    def testCommandFrameCache(self):
+        print("\n*** Testing Command Frame Cache ***")
+        commandPacket = neb.NebCommandPacket(neb.Subsys_LED, neb.LEDCmd_SetVal, ledValueTupleList=[(0, 128), (1, 64)])
+        packetString = commandPacket.stringEncode()
+        self.assertIs(commandPacket.stringEncode(), packetString)
+        self.assertEqual(packetString[2], nebcrc.nebCRC8(packetString))
+        self.assertEqual(commandPacket.header.crc, packetString[2])
+        self.assertEqual(packetString, commandPacket.header.encode() + commandPacket.data.encode())
+
+        stream = io.BytesIO()
+        comm = nebapi.NeblinaComm(stream)
+        for ii in range(3):
+            comm.sendCommand(neb.Subsys_LED, neb.LEDCmd_SetVal, ledValueTupleList=[(0, 128), (1, 64)])
+            comm.sendCommand(neb.Subsys_MotionEngine, neb.MotCmd_DisableStreaming, True)
+        self.assertEqual(comm.commandFrames.misses, 2)
+        self.assertEqual(comm.commandFrames.hits, 4)
+        frames = nebslip.decodeFrames(stream.getvalue())
+        self.assertEqual(len(frames), 6)
+        self.assertEqual(frames[0], packetString)
+        self.assertEqual(frames[1], neb.NebCommandPacket(neb.Subsys_MotionEngine, \
+            neb.MotCmd_DisableStreaming, True).stringEncode())
+
+        # Buffer arguments are cached by content, unhashable ones bypass the cache
+        stream.seek(0)
+        stream.truncate()
+        pageBytes = bytearray(b'page0001')
+        comm.sendCommand(neb.Subsys_EEPROM, neb.EEPROMCmd_Write, pageNumber=1, dataBytes=pageBytes)
+        pageBytes[7:8] = b'2'
+        comm.sendCommand(neb.Subsys_EEPROM, neb.EEPROMCmd_Write, pageNumber=1, dataBytes=pageBytes)
+        class UnhashableInt(int):
+            __hash__ = None
+        vectors = [(array('h', [1, 2, 3]), [4, 5, 6]), (array('h', [1, 2, 3]), [4, 5, UnhashableInt(7)])]
+        for accel, gyro in vectors:
+            comm.sendCommand(neb.Subsys_Debug, neb.DebugCmd_UnitTestMotionData,\
+                timestamp=0, accel=accel, gyro=gyro, mag=[7, 8, 9])
+        frames = nebslip.decodeFrames(stream.getvalue())
+        self.assertEqual([frame[6:14] for frame in frames[:2]], [b'page0001', b'page0002'])
+        self.assertEqual([struct.unpack_from('<3h', frame, 14) for frame in frames[2:]], [(4, 5, 6), (4, 5, 7)])
+        self.assertEqual(len(comm.commandFrames), 5)
+
+        # Least recently used frames are dropped first
+        cache = nebslip.FrameCache(2)
+        cache.get('a', lambda: b'a')
+        cache.get('b', lambda: b'b')
+        cache.get('a', lambda: b'a')
+        cache.get('c', lambda: b'c')
+        self.assertEqual(list(cache.frames), ['a', 'c'])
+
+    def testBackgroundReader(self):
+        print("\n*** Testing Background Packet Reader ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 100)
+        port = FakeBoardPort([packet.stringEncode() for packet in imuPackets])
+        comm = nebapi.NeblinaComm(port)
+        comm.startReader()
+        try:
+            # Streamed packets received while waiting for the ack are kept
+            comm.motionStopStreams()
+            self.assertEqual(comm.reader.queued(neb.PacketType_RegularResponse, \
+                neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data), len(imuPackets))
+            for packet in imuPackets:
+                self.assertEqual(comm.receivePacket().data.timestamp, packet.data.timestamp)
+
+            future = comm.submitCommand(neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 20)
+            packet = future.result(1.0)
+            self.assertEqual(packet.header.packetType, neb.PacketType_Ack)
+            self.assertEqual(packet.header.command, neb.MotCmd_Downsample)
+            self.assertIsNone(comm.reader.get(timeout=0.01))
+            self.assertEqual(comm.reader.droppedPackets, 0)
+
+            # Futures given up by their caller do not stay registered
+            future = comm.reader.expect((neb.headerKey(neb.PacketType_ErrorLogResp, \
+                neb.Subsys_MotionEngine, neb.MotCmd_Downsample),))
+            future.cancel()
+            self.assertEqual(comm.reader.waiters, {})
+
+            # A failed read is handed to the callers instead of killing the thread silently
+            future = comm.reader.expect((neb.headerKey(neb.PacketType_Ack, \
+                neb.Subsys_MotionEngine, neb.MotCmd_AccRange),))
+            port.readError = OSError('Port unplugged')
+            with self.assertRaises(OSError):
+                future.result(1.0)
+            with self.assertRaises(OSError):
+                comm.reader.get(timeout=1.0)
+            with self.assertRaises(OSError):
+                comm.reader.expect((neb.headerKey(neb.PacketType_Ack, \
+                    neb.Subsys_MotionEngine, neb.MotCmd_AccRange),))
+        finally:
+            comm.stopReader()
+
+        # Stopping the reader ends a batch waiting for its answers
+        comm = nebapi.NeblinaComm(FakeBoardPort())
+        reader = comm.startReader()
+        comm.sendCommand = lambda *args, **kwargs: None
+        stopper = threading.Timer(0.1, reader.stop)
+        stopper.start()
+        with self.assertRaisesRegex(ConnectionError, 'command 0'):
+            comm.sendCommands([(neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 20)], timeout=5.0)
+        stopper.join()
+        comm.stopReader()
+
+        with self.assertRaisesRegex(RuntimeError, 'startReader'):
+            comm.submitCommand(neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 20)
+
+        # Stopping does not wait for data on a quiet port
+        readFD, writeFD = os.pipe()
+        with open(readFD, 'rb', buffering=0) as stream:
+            reader = nebreader.NeblinaReader(nebslip.SlipReader(stream))
+            reader.start()
+            thread = reader.thread
+            reader.stop(2.0)
+            self.assertFalse(thread.is_alive())
+        os.close(writeFD)
+
+    def testAsyncComm(self):
+        print("\n*** Testing asyncio Communication ***")
+        eulerPackets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)
+        port = FakeBoardSocket()
+        async def run():
+            async with nebasync.AsyncNeblinaComm(port) as comm:
+                await comm.motionSetDownsample(20)
+                # Samples of the stream start coming in once it is enabled
+                port.send(b''.join(nebslip.encode(packet.stringEncode()) for packet in eulerPackets))
+                timestamps = [packet.data.timestamp async for packet in \
+                    comm.motionStream(neb.MotCmd_EulerAngle, numPackets=10)]
+                self.assertEqual(timestamps, [packet.data.timestamp for packet in eulerPackets[:10]])
+                self.assertEqual(comm.badPackets, 0)
+                # Timeouts are the same error as with NeblinaComm
+                with self.assertRaises(neb.NebTimeoutError) as context:
+                    await comm.get((neb.headerKey(neb.PacketType_RegularResponse,\
+                        neb.Subsys_Storage, neb.StorageCmd_NumSessions),), 0.05)
+                self.assertEqual(context.exception.command, neb.StorageCmd_NumSessions)
+                # Answered and timed out futures leave no deque behind
+                await asyncio.sleep(0)
+                self.assertEqual(comm.waiters, {})
+            self.assertTrue(os.get_blocking(port.fileno()))
+        try:
+            asyncio.run(asyncio.wait_for(run(), 5.0))
+        finally:
+            port.close()
+
+        commands = [(packetString[0] & neb.Subsys_BitMask, packetString[3], packetString[8]) \
+            for packetString in port.commands]
+        self.assertEqual(commands, [(neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 20),\
+            (neb.Subsys_MotionEngine, neb.MotCmd_EulerAngle, 1),\
+            (neb.Subsys_MotionEngine, neb.MotCmd_EulerAngle, 0)])
+
+        # The board hanging up fails the waiters instead of spinning on EOF
+        port = FakeBoardSocket()
+        async def hangUp():
+            async with nebasync.AsyncNeblinaComm(port) as comm:
+                future = comm.expect((neb.headerKey(neb.PacketType_Ack, \
+                    neb.Subsys_MotionEngine, neb.MotCmd_Downsample),))
+                port.boardSocket.close()
+                with self.assertRaises(ConnectionError):
+                    await asyncio.wait_for(future, 1.0)
+                with self.assertRaises(ConnectionError):
+                    await comm.get(timeout=1.0)
+        try:
+            asyncio.run(asyncio.wait_for(hangUp(), 5.0))
+        finally:
+            port.hostSocket.close()
+
+    def testPipelinedCommands(self):
+        print("\n*** Testing Pipelined Commands ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 20)
+        commands = [(neb.Subsys_MotionEngine, neb.MotCmd_DisableStreaming),
+            (neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 20),
+            (neb.Subsys_MotionEngine, neb.MotCmd_AccRange, 8),
+            (neb.Subsys_LED, neb.LEDCmd_SetVal, True, {'ledValueTupleList':[(0, 1)]}),
+            (neb.Subsys_MotionEngine, neb.MotCmd_Downsample, 40),
+            (neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data, True)]
+        for useReader in (False, True):
+            port = FakeBoardPort([packet.stringEncode() for packet in imuPackets])
+            port.errorCommands.add(neb.MotCmd_AccRange)
+            comm = nebapi.NeblinaComm(port)
+            if useReader:
+                comm.startReader()
+            try:
+                answers = comm.sendCommands(commands)
+            finally:
+                comm.stopReader()
+            self.assertEqual(len(port.commands), len(commands))
+            self.assertEqual([packet.header.command for packet in answers], \
+                [command[1] for command in commands])
+            self.assertEqual([packet.header.packetType for packet in answers], \
+                [neb.PacketType_Ack, neb.PacketType_Ack, neb.PacketType_ErrorLogResp,\
+                neb.PacketType_Ack, neb.PacketType_Ack, neb.PacketType_Ack])
+            # Each ack goes to its own command
+            self.assertEqual([packet.packetString[8] for packet in answers[1::3]], [20, 40])
+
+        # Missing answers come back as None
+        comm = nebapi.NeblinaComm(FakeBoardPort())
+        answers = comm.sendCommands(commands[:2], (neb.PacketType_Ack, neb.PacketType_RegularResponse), 0.2)
+        self.assertEqual(answers, [None, None])
+
+    def testHub(self):
+        print("\n*** Testing Multi-Board Hub ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 50)
+        magPackets = nebsim.createRandomMAGDataPacketList(50.0, 50)
+        ports = {'left':FakeBoardSocket([packet.stringEncode() for packet in imuPackets]),\
+            'right':FakeBoardSocket([packet.stringEncode() for packet in magPackets])}
+        brokenPort = FakeBoardSocket()
+        failures = []
+        hub = nebhub.NeblinaHub(onDeviceError=lambda deviceID, error: failures.append(deviceID))
+        try:
+            for deviceID, port in ports.items():
+                hub.addDevice(deviceID, port)
+            hub.addDevice('broken', brokenPort)
+            hub.sendCommand(neb.Subsys_MotionEngine, neb.MotCmd_ResetTimeStamp, deviceIDs=list(ports))
+            hub.sendCommand(neb.Subsys_LED, neb.LEDCmd_SetVal, deviceIDs=['right'], ledValueTupleList=[(0, 1)])
+            # A board unplugged with unread data: its reads fail with ECONNRESET
+            brokenPort.hostSocket.sendall(b'\xc0')
+            brokenPort.boardSocket.close()
+            received = dict((deviceID, []) for deviceID in ports)
+            for deviceID, packet in hub.iterPackets(0.1):
+                received[deviceID].append(packet)
+            self.assertEqual(failures, ['broken'])
+            self.assertIsInstance(hub.deviceErrors['broken'], OSError)
+            self.assertEqual(sorted(hub.deviceIDs()), ['left', 'right'])
+        finally:
+            brokenPort.hostSocket.close()
+            hub.close()
+            for port in ports.values():
+                port.close()
+        self.assertEqual([packet.data.timestamp for packet in received['left'][:-1]], \
+            [packet.data.timestamp for packet in imuPackets])
+        self.assertEqual([packet.header.command for packet in received['right'][-2:]], \
+            [neb.MotCmd_ResetTimeStamp, neb.LEDCmd_SetVal])
+        self.assertEqual([packet.data.mag[0] for packet in received['right'][:-2]], \
+            [packet.data.mag[0] for packet in magPackets])
+        self.assertEqual(len(ports['left'].commands), 1)
+        self.assertEqual(ports['left'].commands[0], ports['right'].commands[0])
+
+    def testClockSync(self):
+        print("\n*** Testing Multi-Board Clock Synchronization ***")
+        ports = {'left':FakeBoardSocket(), 'right':FakeBoardSocket()}
+        hub = nebhub.NeblinaHub()
+        try:
+            for deviceID, port in ports.items():
+                hub.addDevice(deviceID, port)
+            clockSync = nebclock.ClockSync(hub)
+            self.assertEqual(sorted(clockSync.resetTimestamps()), ['left', 'right'])
+            for deviceID in ports:
+                self.assertEqual(ports[deviceID].commands[0][3], neb.MotCmd_ResetTimeStamp)
+                zeroTime = clockSync.hostTime(deviceID, 0)
+                self.assertTrue(clockSync.sendTimes[deviceID] <= zeroTime <= clockSync.ackTimes[deviceID])
+
+            # Streamed packets refine the estimate
+            packet = neb.NebResponsePacket.createIMUResponsePacket(1000, [0, 0, 0], [0, 0, 0])
+            hub.devices['left'].readTime = 50.0
+            clockSync.update('left', neb.NebLazyResponsePacket(packet.stringEncode()))
+            self.assertAlmostEqual(clockSync.hostTime('left', 1000), 50.0)
+        finally:
+            hub.close()
+            for port in ports.values():
+                port.close()
+
+        # Offset and drift from latency-affected samples, across a wraparound
+        offset = 1234.5
+        drift = 50e-6
+        clock = nebclock.BoardClock()
+        for ii in range(20000):
+            timestamp = (4200000000 + ii*20000) % nebclock.TimestampWrap
+            boardTime = (4200000000 + ii*20000)*1e-6
+            latency = 0.002 + 0.010*((ii*7919) % 101)/100.0
+            clock.addSample(timestamp, offset + (1.0 + drift)*boardTime + latency)
+        self.assertLess(abs(clock.drift - drift), 2e-6)
+        boardTime = (4200000000 + 19999*20000)*1e-6
+        self.assertLess(abs(clock.hostTime(timestamp) - (offset + (1.0 + drift)*boardTime + 0.002)), 0.002)
+
+    def testDeadlinesAndRetries(self):
+        print("\n*** Testing Wait Deadlines and Command Retries ***")
+        port = FakeBoardPort()
+        port.timeout = 0.01
+        comm = nebapi.NeblinaComm(port, nebapi.RetryPolicy(attempts=3, timeout=0.05, backoff=2.0, maxTimeout=0.15))
+        self.assertEqual(list(comm.retryPolicy.timeouts()), [0.05, 0.1, 0.15])
+
+        # The deadline holds even when the port keeps timing out
+        startTime = time.monotonic()
+        self.assertRaises(neb.NebTimeoutError, comm.waitForPacket, neb.PacketType_RegularResponse, \
+            neb.Subsys_PowerManagement, neb.PowCmd_GetBatteryLevel, timeout=0.1)
+        elapsed = time.monotonic() - startTime
+        self.assertTrue(0.1 <= elapsed < 0.5)
+
+        # A board that never answers makes the retries give up with a typed error
+        packet = comm.commandWithRetry(neb.Subsys_Debug, neb.DebugCmd_SetInterface, True)
+        self.assertEqual(packet.header.packetType, neb.PacketType_Ack)
+        try:
+            comm.commandWithRetry(neb.Subsys_PowerManagement, neb.PowCmd_GetBatteryLevel, \
+                packetType=neb.PacketType_RegularResponse)
+            self.fail('No timeout raised')
+        except neb.NebTimeoutError as timeoutError:
+            self.assertIsInstance(timeoutError, TimeoutError)
+            self.assertEqual(timeoutError.attempts, 3)
+            self.assertEqual(timeoutError.timeout, 0.15)
+        self.assertEqual(len(port.commands), 4)
+
+        # Without a timeout, the wait lasts as long as packets keep coming
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 200)
+        port = FakeBoardPort()
+        port.timeout = 0.05
+        port.streams[neb.MotCmd_IMU_Data] = [packet.stringEncode() for packet in imuPackets]
+        port.streamRate = 200.0
+        comm = nebapi.NeblinaComm(port, nebapi.RetryPolicy(timeout=0.05))
+        comm.sendCommand(neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data, True)
+        answer = threading.Timer(0.3, port.send, [nebslip.encode(createResponse(neb.Subsys_Storage,\
+            neb.StorageCmd_NumSessions, struct.pack('<I H', 0, 2)))])
+        startTime = time.monotonic()
+        answer.start()
+        try:
+            packet = comm.waitForPacket(neb.PacketType_RegularResponse, neb.Subsys_Storage, neb.StorageCmd_NumSessions)
+        finally:
+            answer.join()
+            port.streamStopped.set()
+        self.assertEqual(packet.data.numSessions, 2)
+        self.assertGreaterEqual(time.monotonic() - startTime, 0.3)
+
+    def testStreamSubscriptions(self):
+        print("\n*** Testing Stream Subscriptions ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 50)
+        eulerPackets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)[:30]
+        port = FakeBoardPort()
+        port.streams[neb.MotCmd_IMU_Data] = [packet.stringEncode() for packet in imuPackets]
+        port.streams[neb.MotCmd_EulerAngle] = [packet.stringEncode() for packet in eulerPackets]
+        comm = nebapi.NeblinaComm(port, nebapi.RetryPolicy(attempts=2, timeout=0.2))
+
+        # Batches of N packets, the last one delivered when streaming stops
+        batches = []
+        numReceived = comm.motionStream(neb.MotCmd_IMU_Data, numPackets=50,\
+            consumer=batches.append, batchSize=16)
+        self.assertEqual(numReceived, 50)
+        self.assertEqual([len(batch) for batch in batches], [16, 16, 16, 2])
+        self.assertEqual([packet.data.timestamp for batch in batches for packet in batch],\
+            [packet.data.timestamp for packet in imuPackets])
+        self.assertEqual(comm.subscriptions, {})
+
+        # Several consumers and a sink, stopped by a consumer
+        port.commands = []
+        store = nebstore.StreamStore()
+        eulerBatches = []
+        def onEuler(packets):
+            eulerBatches.append(packets)
+            if sum(len(batch) for batch in eulerBatches) == len(eulerPackets):
+                comm.stopStreaming()
+        comm.subscribe(neb.MotCmd_IMU_Data, store)
+        comm.subscribe(neb.MotCmd_EulerAngle, onEuler, batchSize=10)
+        self.assertEqual(comm.runStreams(), len(imuPackets) + len(eulerPackets))
+        self.assertEqual(len(store.stream(neb.MotCmd_IMU_Data)), len(imuPackets))
+        self.assertEqual([len(batch) for batch in eulerBatches], [10, 10, 10])
+        commands = [(packetString[3], packetString[8]) for packetString in port.commands]
+        self.assertEqual(commands, [(neb.MotCmd_IMU_Data, 1), (neb.MotCmd_EulerAngle, 1),\
+            (neb.MotCmd_IMU_Data, 0), (neb.MotCmd_EulerAngle, 0)])
+
+        # Time windows: the batch is delivered once its window is over
+        for subscriptions in list(comm.subscriptions.values()):
+            for subscription in list(subscriptions):
+                comm.unsubscribe(subscription)
+        windows = []
+        comm.retryPolicy = nebapi.RetryPolicy(attempts=2, timeout=1.0)
+        comm.subscribe(neb.MotCmd_EulerAngle, windows.append, interval=0.1)
+        startTime = time.monotonic()
+        self.assertEqual(comm.runStreams(duration=0.3), len(eulerPackets))
+        self.assertLess(time.monotonic() - startTime, 1.0)
+        self.assertEqual([len(batch) for batch in windows], [len(eulerPackets)])
+
+        # A stream that never comes is disabled before giving up
+        port.commands = []
+        comm.subscriptions = {}
+        comm.retryPolicy = nebapi.RetryPolicy(attempts=2, timeout=0.2)
+        with self.assertRaises(neb.NebTimeoutError):
+            comm.motionStream(neb.MotCmd_Quaternion)
+        commands = [(packetString[3], packetString[8]) for packetString in port.commands]
+        self.assertEqual(commands, [(neb.MotCmd_Quaternion, 1), (neb.MotCmd_Quaternion, 1),\
+            (neb.MotCmd_Quaternion, 0)])
+
+    def testStreamIterator(self):
+        print("\n*** Testing Stream Iterator ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 50)
+        timestamps = [packet.data.timestamp for packet in imuPackets]
+        def openBoard():
+            port = FakeBoardPort()
+            port.streams[neb.MotCmd_IMU_Data] = [packet.stringEncode() for packet in imuPackets]
+            return port, nebapi.NeblinaComm(port, nebapi.RetryPolicy(attempts=2, timeout=0.5))
+        port, comm = openBoard()
+        streamKey = neb.headerKey(neb.PacketType_RegularResponse, neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data)
+
+        # Fixed size batches, the stream is disabled once numPackets came
+        batches = list(comm.iterStream(neb.MotCmd_IMU_Data, batch=16, numPackets=50))
+        self.assertEqual([len(batch) for batch in batches], [16, 16, 16, 2])
+        self.assertEqual([packet.data.timestamp for batch in batches for packet in batch], timestamps)
+        self.assertIsNone(comm.reader)
+        commands = [(packetString[3], packetString[8]) for packetString in port.commands]
+        self.assertEqual(commands, [(neb.MotCmd_IMU_Data, 1), (neb.MotCmd_IMU_Data, 0)])
+
+        # Closing the generator disables the stream
+        port, comm = openBoard()
+        packets = comm.iterStream(neb.MotCmd_IMU_Data)
+        self.assertEqual(next(packets).data.timestamp, timestamps[0])
+        packets.close()
+        commands = [(packetString[3], packetString[8]) for packetString in port.commands]
+        self.assertEqual(commands, [(neb.MotCmd_IMU_Data, 1), (neb.MotCmd_IMU_Data, 0)])
+
+        # A slow consumer gets the newest packets of a bounded buffer
+        port, comm = openBoard()
+        packets = comm.iterStream(neb.MotCmd_IMU_Data, bufferSize=10)
+        next(packets)
+        time.sleep(0.2)
+        newest = []
+        while not newest or newest[-1] != timestamps[-1]:
+            newest.append(next(packets).data.timestamp)
+        self.assertLessEqual(len(newest), 10)
+        self.assertEqual(newest, timestamps[-len(newest):])
+        self.assertGreaterEqual(comm.reader.dropped[streamKey], 30)
+        packets.close()
+
+        # or an error
+        port, comm = openBoard()
+        packets = comm.iterStream(neb.MotCmd_IMU_Data, bufferSize=10, overflow=nebapi.StreamOverflow_Raise)
+        with self.assertRaises(neb.StreamOverflowError):
+            for packet in packets:
+                time.sleep(0.05)
+        self.assertIsNone(comm.reader)
+
+    def testFlashPlaybackToFile(self):
+        print("\n*** Testing Flash Playback to a File ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 600)
+        eulerPackets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)[:100]
+        sessionPackets = [packet.stringEncode() for packet in imuPackets + eulerPackets]
+        port = FakeBoardPort()
+        sessionInfo = struct.pack('<I H', len(sessionPackets)*nebapi.FlashPacketSize, 3)
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_SessionInfo)] = \
+            [createResponse(neb.Subsys_Storage, neb.StorageCmd_SessionInfo, sessionInfo)]
+        playbackString = createResponse(neb.Subsys_Storage, neb.StorageCmd_Playback, struct.pack('<I B H', 0, 1, 3))
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_Playback)] = \
+            [playbackString] + sessionPackets + [playbackString]
+        comm = nebapi.NeblinaComm(port)
+
+        fileName = 'flashPlaybackTest.bin'
+        progress = []
+        try:
+            numPackets = comm.flashPlayback(3, fileName, lambda *args: progress.append(args))
+            self.assertEqual(numPackets, len(sessionPackets))
+            self.assertEqual(progress[0], (nebapi.PlaybackProgressPackets, len(sessionPackets)))
+            self.assertEqual(progress[-1], (len(sessionPackets), len(sessionPackets)))
+            self.assertEqual(os.path.getsize(fileName), len(sessionPackets)*nebarray.PacketSize)
+
+            # Read back, packet by packet and as a packet array
+            self.assertEqual(list(nebstore.iterPacketFile(fileName, chunkSize=1000)), sessionPackets)
+            store = nebstore.readPacketFile(fileName)
+            self.assertEqual(len(store.stream(neb.MotCmd_IMU_Data)), len(imuPackets))
+            packetArray = nebarray.loadPacketFile(fileName)
+            records = nebarray.decodeStream(packetArray[nebarray.streamMask(packetArray,\
+                neb.MotCmd_EulerAngle)], neb.MotCmd_EulerAngle)
+            self.assertEqual(records['timestamp'].tolist(), [packet.data.timestamp for packet in eulerPackets])
+
+            # Unknown session info: no total, the playback still runs
+            port = FakeBoardPort()
+            port.answers[(neb.Subsys_Storage, neb.StorageCmd_SessionInfo)] = \
+                [createResponse(neb.Subsys_Storage, neb.StorageCmd_SessionInfo, struct.pack('<I H', 0xFFFFFFFF, 0))]
+            port.answers[(neb.Subsys_Storage, neb.StorageCmd_Playback)] = \
+                [playbackString] + sessionPackets + [playbackString]
+            comm = nebapi.NeblinaComm(port)
+            progress = []
+            numPackets = comm.flashPlayback(65535, fileName, lambda *args: progress.append(args))
+            self.assertEqual(numPackets, len(sessionPackets))
+            self.assertEqual(progress[-1], (len(sessionPackets), None))
+            self.assertEqual(os.path.getsize(fileName), len(sessionPackets)*nebarray.PacketSize)
+
+            # A playback that stalls before its end is not taken for a complete one
+            port = FakeBoardPort()
+            port.answers[(neb.Subsys_Storage, neb.StorageCmd_Playback)] = \
+                [playbackString] + sessionPackets[:300]
+            comm = nebapi.NeblinaComm(port)
+            with self.assertRaises(neb.NebTimeoutError) as context:
+                comm.flashPlayback(3, fileName)
+            self.assertEqual(context.exception.numPackets, 300)
+        finally:
+            if os.path.exists(fileName):
+                os.remove(fileName)
+
+    def testFlashCatalog(self):
+        print("\n*** Testing Flash Session Catalog ***")
+        nebapi.SessionCatalogs.clear()
+        port = FakeBoardPort()
+        versions = struct.pack(neb.Neblina_FWVersions_fmt, 1, 2, 0, 1, 1, 0, 3, b'board001', 0)
+        port.answers[(neb.Subsys_Debug, neb.DebugCmd_FWVersions)] = \
+            [createResponse(neb.Subsys_Debug, neb.DebugCmd_FWVersions, versions)]
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_NumSessions)] = \
+            [createResponse(neb.Subsys_Storage, neb.StorageCmd_NumSessions, struct.pack('<I H', 0, 4))]
+        def sessionInfo(commandString):
+            sessionID = struct.unpack_from('<H', commandString, 8)[0]
+            sessionLength = 0xFFFFFFFF if sessionID == 2 else (sessionID + 1)*180
+            return [createResponse(neb.Subsys_Storage, neb.StorageCmd_SessionInfo,\
+                struct.pack('<I H', sessionLength, sessionID))]
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_SessionInfo)] = sessionInfo
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_EraseAll)] = \
+            [createResponse(neb.Subsys_Storage, neb.StorageCmd_EraseAll, b'')]
+        catalog = [(0, 180), (1, 360), (3, 720)]
+        def sentCommands():
+            commands = [packetString[3] for packetString in port.commands]
+            port.commands = []
+            return commands
+
+        # One sweep, then cached by device ID, also for a new connection
+        comm = nebapi.NeblinaComm(port)
+        self.assertEqual(comm.flashGetCatalog(), catalog)
+        self.assertEqual(sentCommands(), [neb.DebugCmd_FWVersions, neb.StorageCmd_NumSessions] + \
+            [neb.StorageCmd_SessionInfo]*4)
+        self.assertEqual(comm.flashGetCatalog(), catalog)
+        self.assertEqual(sentCommands(), [])
+        otherComm = nebapi.NeblinaComm(port)
+        self.assertEqual(otherComm.flashGetCatalog(), catalog)
+        self.assertEqual(sentCommands(), [neb.DebugCmd_FWVersions, neb.StorageCmd_NumSessions])
+        self.assertEqual(list(nebapi.SessionCatalogs), [b'board001'])
+
+        # Erasing the flash drops the catalog
+        comm.flashErase()
+        self.assertEqual(nebapi.SessionCatalogs, {})
+        sentCommands()
+        self.assertEqual(comm.flashGetCatalog(), catalog)
+        self.assertEqual(sentCommands(), [neb.StorageCmd_NumSessions] + [neb.StorageCmd_SessionInfo]*4)
+
+        # An answer for another session is not taken, the session is asked
+        # again, and the sessions are asked by batches
+        staleAnswers = [createResponse(neb.Subsys_Storage, neb.StorageCmd_SessionInfo,\
+            struct.pack('<I H', 180, 0))]
+        def staleSessionInfo(commandString):
+            if struct.unpack_from('<H', commandString, 8)[0] == 1 and staleAnswers:
+                return [staleAnswers.pop()]
+            return sessionInfo(commandString)
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_SessionInfo)] = staleSessionInfo
+        depth = nebapi.CatalogPipelineDepth
+        nebapi.CatalogPipelineDepth = 3
+        try:
+            self.assertEqual(comm.flashGetCatalog(refresh=True), catalog)
+        finally:
+            nebapi.CatalogPipelineDepth = depth
+        self.assertEqual(sentCommands(), [neb.StorageCmd_NumSessions] + [neb.StorageCmd_SessionInfo]*5)
+        nebapi.SessionCatalogs.clear()
+
+    def testTimedFlashRecord(self):
+        print("\n*** Testing Time-Bounded Flash Recording ***")
+        # 50 Hz samples sent 10 times faster than real time
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 1000)
+        port = FakeBoardPort()
+        port.streams[neb.MotCmd_IMU_Data] = [packet.stringEncode() for packet in imuPackets]
+        port.streamRate = 500.0
+        port.answers[(neb.Subsys_Storage, neb.StorageCmd_Record)] = \
+            [createResponse(neb.Subsys_Storage, neb.StorageCmd_Record, struct.pack('<I B H', 0, 1, 5))]
+        comm = nebapi.NeblinaComm(port)
+        recordCommands = [(neb.Subsys_MotionEngine, neb.MotCmd_DisableStreaming, 1),\
+            (neb.Subsys_Storage, neb.StorageCmd_Record, 1), (neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data, 1),\
+            (neb.Subsys_MotionEngine, neb.MotCmd_IMU_Data, 0), (neb.Subsys_Storage, neb.StorageCmd_Record, 0)]
+        def sentCommands():
+            commands = [(packetString[0] & neb.Subsys_BitMask, packetString[3], packetString[8])\
+                for packetString in port.commands]
+            port.commands = []
+            return commands
+
+        # Host time, the stream is not read meanwhile
+        startTime = time.monotonic()
+        self.assertEqual(comm.flashRecordFor(neb.MotCmd_IMU_Data, duration=0.2), 5)
+        self.assertTrue(0.2 <= time.monotonic() - startTime < 1.0)
+        self.assertEqual(sentCommands(), recordCommands)
+
+        # Board time, followed through the monitored packets
+        monitored = []
+        startTime = time.monotonic()
+        comm.flashRecordFor(neb.MotCmd_IMU_Data, timestampSpan=2.0,\
+            monitor=monitored.append, monitorInterval=0.05)
+        self.assertLess(time.monotonic() - startTime, 1.0)
+        self.assertGreater(len(monitored), 1)
+        timestamps = [packet.data.timestamp for packet in monitored]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertGreaterEqual(timestamps[-1] - imuPackets[0].data.timestamp, 2000000)
+        self.assertEqual(sentCommands(), recordCommands)
+
+        with self.assertRaises(ValueError):
+            comm.flashRecordFor(neb.MotCmd_IMU_Data)
+
+        # A failing stop does not hide the error that ended the recording
+        stopped = []
+        def failingStop(dataType, sessionID):
+            stopped.append(sessionID)
+            raise neb.NebTimeoutError(neb.PacketType_Ack, neb.Subsys_Storage, neb.StorageCmd_Record, 1.0)
+        def failingMonitor(packet):
+            raise RuntimeError('monitor failed')
+        comm.flashRecordStop = failingStop
+        with self.assertRaisesRegex(RuntimeError, 'monitor failed'):
+            comm.flashRecordFor(neb.MotCmd_IMU_Data, duration=1.0,\
+                monitor=failingMonitor, monitorInterval=0.05)
+        self.assertEqual(stopped, [5])
+
+    def testEEPROMBulk(self):
+        print("\n*** Testing Bulk EEPROM Access ***")
+        nebapi.EEPROMCaches.clear()
+        port = FakeBoardPort()
+        versions = struct.pack(neb.Neblina_FWVersions_fmt, 1, 2, 0, 1, 1, 0, 3, b'board002', 0)
+        port.answers[(neb.Subsys_Debug, neb.DebugCmd_FWVersions)] = \
+            [createResponse(neb.Subsys_Debug, neb.DebugCmd_FWVersions, versions)]
+        eeprom = [struct.pack('<HHI', pageNumber, 0xBEEF, 0) for pageNumber in range(nebapi.EEPROMNumPages)]
+        def readPage(commandString):
+            pageNumber = struct.unpack_from('<H', commandString, 4)[0]
+            return [createResponse(neb.Subsys_EEPROM, neb.EEPROMCmd_Read,\
+                struct.pack('<H 8s', pageNumber, eeprom[pageNumber]))]
+        def writePage(commandString):
+            pageNumber, dataBytes = struct.unpack_from('<H 8s', commandString, 4)
+            eeprom[pageNumber] = dataBytes
+            return []
+        port.answers[(neb.Subsys_EEPROM, neb.EEPROMCmd_Read)] = readPage
+        port.answers[(neb.Subsys_EEPROM, neb.EEPROMCmd_Write)] = writePage
+        def sentCommands():
+            commands = [packetString[3] for packetString in port.commands]
+            port.commands = []
+            return commands
+
+        # Whole image, pipelined, then served from the cache
+        comm = nebapi.NeblinaComm(port)
+        image = comm.EEPROMReadAll()
+        self.assertEqual(image, b''.join(eeprom))
+        self.assertEqual(sentCommands(), [neb.DebugCmd_FWVersions] + [neb.EEPROMCmd_Read]*nebapi.EEPROMNumPages)
+        self.assertEqual(comm.EEPROMRead(7), eeprom[7])
+        self.assertEqual(comm.EEPROMReadAll(), image)
+        self.assertEqual(sentCommands(), [])
+
+        # Only the changed pages are written, and the cache follows
+        newImage = bytearray(image)
+        newImage[3*8:4*8] = b'config01'
+        newImage[200*8:200*8+4] = b'\x01\x02\x03\x04'
+        self.assertEqual(comm.EEPROMWriteAll(newImage), [3, 200])
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Write]*2)
+        self.assertEqual(b''.join(eeprom), bytes(newImage))
+        self.assertEqual(comm.EEPROMRead(3), b'config01')
+        comm.EEPROMWrite(5, b'abc')
+        self.assertEqual(nebapi.NeblinaComm(port).EEPROMRead(5), b'abc'.ljust(8, b'\x00'))
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Write, neb.DebugCmd_FWVersions])
+        self.assertEqual(comm.EEPROMRead(5, refresh=True), eeprom[5])
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Read])
+
+        with self.assertRaises(ValueError):
+            comm.EEPROMWriteAll(b'short')
+
+        # An answer for another page is not cached, the page is read again
+        staleAnswers = [createResponse(neb.Subsys_EEPROM, neb.EEPROMCmd_Read,\
+            struct.pack('<H 8s', 9, eeprom[9]))]
+        def staleReadPage(commandString):
+            if struct.unpack_from('<H', commandString, 4)[0] == 10 and staleAnswers:
+                return [staleAnswers.pop()]
+            return readPage(commandString)
+        port.answers[(neb.Subsys_EEPROM, neb.EEPROMCmd_Read)] = staleReadPage
+        self.assertEqual(comm.EEPROMReadAll(refresh=True), b''.join(eeprom))
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Read]*(nebapi.EEPROMNumPages+1))
+
+        # The pages that fail are named, and dropped from the cache
+        image = b''.join(eeprom)
+        newImage = bytearray(image)
+        newImage[7*8:8*8] = b'config02'
+        port.errorCommands.add(neb.EEPROMCmd_Write)
+        with self.assertRaises(neb.EEPROMPageError) as context:
+            comm.EEPROMWriteAll(newImage, image)
+        self.assertEqual((context.exception.errorPages, context.exception.timedOutPages,\
+            context.exception.writtenPages), ([7], [], []))
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Write])
+        port.errorCommands = set([neb.EEPROMCmd_Read])
+        with self.assertRaises(neb.EEPROMPageError) as context:
+            comm.EEPROMReadAll()
+        self.assertEqual(context.exception.errorPages, [7])
+        self.assertEqual(sentCommands(), [neb.EEPROMCmd_Read])
+        self.assertNotIn(7, comm.EEPROMCache())
+        with self.assertRaises(neb.EEPROMPageError) as context:
+            comm.EEPROMRead(12, refresh=True)
+        self.assertEqual(context.exception.errorPages, [12])
+        self.assertNotIn(12, comm.EEPROMCache())
+
+        # A page read alone skips an answer for another page
+        port.errorCommands = set()
+        port.answers[(neb.Subsys_EEPROM, neb.EEPROMCmd_Read)] = lambda commandString: \
+            [createResponse(neb.Subsys_EEPROM, neb.EEPROMCmd_Read, struct.pack('<H 8s', 11, eeprom[11]))] + \
+            readPage(commandString)
+        self.assertEqual(comm.EEPROMRead(12), eeprom[12])
+        self.assertEqual(comm.EEPROMCache()[12], eeprom[12])
+        nebapi.EEPROMCaches.clear()
+
+    def testStreamStore(self):
+        print("\n*** Testing Columnar Packet Store ***")
+        imuPackets = nebsim.createRandomIMUDataPacketList(50.0, 200)
+        eulerPackets = nebsim.createSpinningObjectPacketList(50.0, 1.0, 2.0, 6.0)
+        packetStrings = [packet.stringEncode() for packet in imuPackets + eulerPackets]
+        stopString = bytearray(struct.pack(neb.Neblina_PacketHeader_fmt, \
+            neb.Subsys_Storage, 16, 0, neb.StorageCmd_Playback)) + bytearray(16)
+        stopString[2] = nebcrc.nebCRC8(stopString)
+        stream = b''.join(nebslip.encode(packetString) for packetString in packetStrings + [bytes(stopString)])
+
+        comm = nebapi.NeblinaComm(io.BytesIO(stream))
+        store = comm.storePacketsUntil(neb.PacketType_RegularResponse, neb.Subsys_Storage, neb.StorageCmd_Playback)
+        self.assertEqual(len(store), len(packetStrings))
+        self.assertEqual(list(store.iterPackets()), packetStrings)
+
+        # Replay keeps the order of arrival of interleaved streams
+        interleaved = [packetString for pair in zip(packetStrings[:200], packetStrings[200:])\
+            for packetString in pair] + [bytes(stopString)]
+        interleavedStore = nebstore.StreamStore()
+        for packetString in interleaved:
+            interleavedStore.append(packetString)
+        self.assertEqual(list(interleavedStore.iterPackets()), interleaved)
+
+        imuColumns = store.stream(neb.MotCmd_IMU_Data)
+        self.assertEqual(len(imuColumns), len(imuPackets))
+        self.assertEqual(list(imuColumns.column('timestamp')), [packet.data.timestamp for packet in imuPackets])
+        self.assertEqual(list(imuColumns.column('gyroY')), [packet.data.gyro[1] for packet in imuPackets])
+        eulerColumns = store.stream(neb.MotCmd_EulerAngle)
+        self.assertEqual(list(eulerColumns.scaledColumn('yaw')), [packet.data.yaw for packet in eulerPackets])
+
+        # Slicing by index and by timestamp
+        startTime = imuPackets[10].data.timestamp
+        stopTime = imuPackets[20].data.timestamp
+        self.assertEqual(imuColumns.timeRange(startTime, stopTime), (10, 20))
+        samples = imuColumns.timeSlice(startTime, stopTime)
+        self.assertEqual(list(samples['accelZ']), [packet.data.accel[2] for packet in imuPackets[10:20]])
+        self.assertEqual(imuColumns[5]['timestamp'], imuPackets[5].data.timestamp)
+        self.assertEqual(list(imuColumns[-3:]['gyroX']), [packet.data.gyro[0] for packet in imuPackets[-3:]])
+
+        # NumPy views share memory with the columns
+        arrays = nebarray.columnArrays(imuColumns)
+        self.assertEqual(arrays['accelX'].tolist(), [packet.data.accel[0] for packet in imuPackets])
+        del arrays
+
 if __name__ == "__main__":
     unittest.main() # run all tests
     print (unittest.TextTestResult)
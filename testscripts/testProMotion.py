@@ -66,7 +66,8 @@ class ut_ProMotionTests(unittest.TestCase):
         dataString = "UnitTest"
         dataString = dataString.encode()
         self.comm.EEPROMWrite(0, dataString)
-        dataBytes = self.comm.EEPROMRead(0)
+        # Read the page back from the board, not from the cache
+        dataBytes = self.comm.EEPROMRead(0, refresh=True)
         self.assertEqual(dataBytes, dataString)
 
     def testFlashRecord(self):
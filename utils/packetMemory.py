@@ -0,0 +1,39 @@
+import tracemalloc
+import neblina as neb
+import neblinasim as nebsim
+import neblinastore as nebstore
+
+# Reports the heap used per decoded response packet (packet object + header
+# + data object).
+def measure(packetStrings):
+    tracemalloc.start()
+    packets = [neb.NebResponsePacket(packetString) for packetString in packetStrings]
+    currentSize, peakSize = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return currentSize/len(packets)
+
+# Same for the columnar store now used by NeblinaComm.storePacketsUntil
+def measureStore(packetStrings):
+    tracemalloc.start()
+    store = nebstore.StreamStore()
+    for packetString in packetStrings:
+        store.append(packetString)
+    currentSize, peakSize = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return currentSize/len(store)
+
+def main():
+    numPackets = 10000
+    streams = [
+        ('IMU', nebsim.createRandomIMUDataPacketList(50.0, numPackets)),
+        ('MAG', nebsim.createRandomMAGDataPacketList(50.0, numPackets)),
+        ('Euler Angle', nebsim.createSpinningObjectPacketList(50.0, 0.01)),
+        ('Pedometer', nebsim.createWalkingPathPacketList(1000)),
+    ]
+    for name, packetList in streams:
+        packetStrings = [packet.stringEncode() for packet in packetList]
+        print('{0}: {1:.0f} bytes per packet, {2:.0f} bytes per stored sample'\
+            .format(name, measure(packetStrings), measureStore(packetStrings)))
+
+if __name__ == "__main__":
+    main()